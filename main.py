@@ -1,43 +1,97 @@
 import asyncio
+import json
 import os
 import sys
 import threading
+from collections import deque
 from contextlib import asynccontextmanager
-from datetime import datetime
 from typing import List, Dict, Any
 
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from fastapi.staticfiles import StaticFiles
 from src.spooler.task_list import TaskList
-from src.devices.printer import Printer
+from src.spooler.policies import POLICIES
+from src.spooler.journal import TaskJournal
+from src.spooler.render_pipeline import RenderPipeline
+from src.spooler.document_cache import DocumentCache
+from src.spooler.document_parser import DocumentParser
+from src.spooler.upload_store import UploadStore
+from src.spooler.state_stream import StateStream
+from src.spooler.state_publisher import StatePublisher
+from src.devices.printer_pool import PrinterPool
 from src.routes import auth, system, tasks, pages
-from src.auth.session_manager import load_sessions
+from src.auth.session_manager import get_session, session_store, database, initialize_storage
 
 UPLOAD_DIR = "uploaded_files"
+JOURNAL_DIR = "spool_journal"
+DOCUMENT_CACHE_DIR = "document_cache"
+SCHEDULING_POLICY = os.environ.get("SPOOLER_POLICY", "priority")
+PRINTERS_FILE = os.environ.get("SPOOLER_PRINTERS", "printers.json")
+PARSER_WORKERS = int(os.environ.get("SPOOLER_PARSER_WORKERS", os.cpu_count() or 2))
+PARSE_TIMEOUT = float(os.environ.get("SPOOLER_PARSE_TIMEOUT", 30.0))
+STATE_PUSH_INTERVAL = float(os.environ.get("SPOOLER_STATE_INTERVAL", 0.25))
+MAX_UPLOAD_SIZE = int(os.environ.get("SPOOLER_MAX_UPLOAD_MB", 50)) * 1024 * 1024
+DEFAULT_PRINTERS = [{"name": "MainPrinter", "printer_name": "Xprinter"}]
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, backlog=256, send_timeout=5.0):
         """
         This class manages active WebSocket connections to facilitate real-time broadcasting.
 
+        A broadcast appends the message to a shared bounded log and wakes the writers, it never waits for a client.
+        Idle writers of one event loop share one asyncio.Event, so a broadcast costs one wakeup whatever the number
+        of clients.
+        Every connection has its own writer task sending the log from its own position. A client which falls
+        more than `backlog` messages behind, or does not take a message within `send_timeout`, is disconnected.
+        System state is sent as versioned deltas, a client gets a full snapshot on connect and when it asks to resync.
+
         active_connections: list of currently open connections.
-        lock: ensures thread-safe access to the active_connections list.
+        lock: ensures thread-safe access to the active_connections list and the log.
+
+        :param backlog: number of messages kept for clients which are behind
+        :param send_timeout: seconds one send may take before the client is disconnected
         """
         self.active_connections: List[WebSocket] = []
         self.lock = threading.Lock()
-
-    async def connect(self, websocket: WebSocket):
+        self.backlog = backlog
+        self.send_timeout = send_timeout
+        self.log = deque(maxlen=backlog)
+        self.sequence = 0
+        self.wakeups = {}
+        self.writers = {}
+        self.direct = {}
+        self.state_stream = StateStream()
+
+    async def connect(self, websocket: WebSocket, state: Dict[str, Any] = None):
         """
         Accepts a new WebSocket connection and adds it to the active_connections list.
 
         :param websocket: WebSocket object representing the client connection.
+        :param state: current system state, the client gets it as its first snapshot
         """
         await websocket.accept()
+        await websocket.send_text("INFO: Successfully connected to server")
         with self.lock:
+            if state is not None:
+                self._update_state(state)
             self.active_connections.append(websocket)
-        await websocket.send_text("INFO: Successfully connected to server")
+            self.direct[websocket] = deque()
+            if self.state_stream.state is not None:
+                self.direct[websocket].append(json.dumps(self.state_stream.snapshot()))
+            self.writers[websocket] = asyncio.create_task(self._writer(websocket, self.sequence))
+
+    def resync(self, websocket: WebSocket):
+        """
+        Sends the full system state snapshot to one client, before its pending broadcasts.
+
+        :param websocket: WebSocket object representing the client connection.
+        """
+        with self.lock:
+            if websocket in self.direct and self.state_stream.state is not None:
+                self.direct[websocket].append(json.dumps(self.state_stream.snapshot()))
+                self._wake_writers()
 
     def disconnect(self, websocket: WebSocket):
         """
@@ -46,7 +100,115 @@ class ConnectionManager:
         :param websocket: WebSocket object representing the client connection.
         """
         with self.lock:
-            self.active_connections.remove(websocket)
+            if websocket in self.active_connections:
+                self.active_connections.remove(websocket)
+            writer = self.writers.pop(websocket, None)
+            self.direct.pop(websocket, None)
+        if writer and writer is not asyncio.current_task():
+            writer.cancel()
+
+    async def _writer(self, websocket: WebSocket, position: int):
+        """
+        Sends the broadcast log to one client, starting at position.
+
+        :param websocket: WebSocket object representing the client connection.
+        :param position: sequence number of the first message to send
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                first = self.sequence - len(self.log)
+                if position < first:
+                    reason = f"fell {self.sequence - position} messages behind"
+                    break
+                if self.direct.get(websocket):
+                    message = self.direct[websocket].popleft()
+                    event = None
+                elif position < self.sequence:
+                    message = self.log[position - first]
+                    position += 1
+                    event = None
+                else:
+                    event = self.wakeups.get(loop)
+                    if event is None:
+                        event = self.wakeups[loop] = asyncio.Event()
+
+            if event is not None:
+                await event.wait()
+                continue
+
+            try:
+                await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+            except asyncio.TimeoutError:
+                reason = f"did not take a message within {self.send_timeout} seconds"
+                break
+            except Exception:
+                self.disconnect(websocket)
+                return
+
+        print(f"Client {websocket.client} is too slow ({reason}), disconnecting.")
+        self.disconnect(websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), self.send_timeout)
+        except Exception:
+            pass
+
+    def _wake_writers(self):
+        """
+        Wakes all waiting writers from any thread, must be called with the lock held.
+        The event of the server loop is set directly when called on that loop, otherwise with one
+        call_soon_threadsafe. The next idle writers get a new event.
+        """
+        if not self.wakeups:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop, event in self.wakeups.items():
+            if loop is running:
+                event.set()
+            else:
+                loop.call_soon_threadsafe(event.set)
+        self.wakeups = {}
+
+    def _append(self, message: str):
+        """
+        Appends a message to the broadcast log and wakes the writers, must be called with the lock held.
+
+        :param message: text frame to send to every client
+        """
+        self.log.append(message)
+        self.sequence += 1
+        self._wake_writers()
+
+    def _publish(self, message: str):
+        """
+        Appends a message to the broadcast log and wakes the writers.
+
+        :param message: text frame to send to every client
+        """
+        with self.lock:
+            self._append(message)
+
+    def _update_state(self, state: Dict[str, Any]):
+        """
+        Records the system state and appends its delta to the log, must be called with the lock held.
+
+        :param state: current system state
+        """
+        message = self.state_stream.update(state)
+        if message is not None:
+            self._append(json.dumps(message))
+
+    async def broadcast_state(self, state: Dict[str, Any]):
+        """
+        Broadcasts the changes of the system state since the last broadcast.
+
+        :param state: current system state from get_system_state
+        """
+        with self.lock:
+            self._update_state(state)
 
     async def broadcast_json(self, data: Dict[str, Any]):
         """
@@ -54,8 +216,7 @@ class ConnectionManager:
 
         :param data: Dictionary to be sent as JSON
         """
-        for connection in self.active_connections:
-            await connection.send_json(data)
+        self._publish(json.dumps(data))
 
     async def broadcast(self, message: str):
         """
@@ -64,8 +225,7 @@ class ConnectionManager:
         :param message: The message string to broadcast
         """
         print("Broadcast: " + message)
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        self._publish(message)
 
 
 @asynccontextmanager
@@ -76,23 +236,52 @@ async def lifespan(app: FastAPI):
     """
     print("Server starting...")
 
+    initialize_storage()
+    session_store.start()
+    restored = journal.replay()
+    upload_store.rebuild(restored)
+    task_list.restore(restored)
+    journal.start()
+
     loop = asyncio.get_event_loop()
+    publisher.start(loop)
 
-    printer = Printer(
+    printer_pool = PrinterPool.from_config(
+        load_printer_configs(),
         task_list=task_list,
         manager=manager,
         loop=loop,
-        name="MainPrinter",
         get_system_state_func=get_system_state,
-        printer_name="Xprinter"
+        render_pipeline=RenderPipeline(task_list),
+        document_cache=document_cache,
+        upload_store=upload_store,
+        publisher=publisher,
+        job_history=database
     )
-    printer.start()
-    app.state.printer = printer
+    printer_pool.start()
+    app.state.printer_pool = printer_pool
 
     yield
 
     print("Server stopping...")
-    app.state.printer.stop()
+    app.state.printer_pool.stop()
+    document_parser.close()
+    journal.close()
+    session_store.close()
+    database.close()
+
+
+def load_printer_configs():
+    """
+    Loads printer profiles from PRINTERS_FILE, a JSON list of Printer keyword arguments.
+    Falls back to the single Xprinter when the file does not exist.
+
+    :return: list of printer configuration dictionaries
+    """
+    if not os.path.exists(PRINTERS_FILE):
+        return DEFAULT_PRINTERS
+    with open(PRINTERS_FILE, 'r') as f:
+        return json.load(f)
 
 
 def resource_path(relative_path):
@@ -108,7 +297,11 @@ def resource_path(relative_path):
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_path)
 
 manager = ConnectionManager()
-task_list = TaskList()
+journal = TaskJournal(JOURNAL_DIR)
+task_list = TaskList(policy=POLICIES[SCHEDULING_POLICY](), journal=journal)
+document_parser = DocumentParser(workers=PARSER_WORKERS, timeout=PARSE_TIMEOUT)
+document_cache = DocumentCache(DOCUMENT_CACHE_DIR, parser=document_parser)
+upload_store = UploadStore(UPLOAD_DIR)
 app = FastAPI(title="Print Spooler API", lifespan=lifespan)
 STATIC_DIR = resource_path("static")
 INDEX_FILE = os.path.join(STATIC_DIR, "index.html")
@@ -116,41 +309,75 @@ LOGIN_FILE = os.path.join(STATIC_DIR, "login.html")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
+_queue_state = (-1, [])
+
+def get_queue_state():
+    """
+    Returns the queued tasks as dictionaries, rebuilt only when the TaskList version changed.
+
+    :return: tuple (queue version, list of task dictionaries)
+    """
+    global _queue_state
+    version, tasks = task_list.snapshot()
+    if _queue_state[0] != version:
+        _queue_state = (version, [task.to_dict() for task in tasks])
+    return _queue_state
+
+
+def get_state_version():
+    """
+    Returns the version of the system state, it changes whenever the queue or a printer status changes.
+
+    :return: tuple (queue version, printer version), printer version is None when the pool has no version
+    """
+    return task_list.version, getattr(app.state.printer_pool, "version", None)
+
+
+_system_state = (None, None)
+
 async def get_system_state():
     """
     Returns current system state including printer status and task queue.
+    The built state is reused until the queue or a printer status changes.
 
     :return: Dictionary containing printer status, current task, queue length, and task list
     """
-    queue_tasks = task_list.get_all_tasks()
-    queue_length = len(task_list)
-    printer_status = app.state.printer.get_status()
-    current_task_dict = None
-    if printer_status['current_task']:
-        task = printer_status['current_task']
-        current_task_dict = {
-            "name": task.name,
-            "pages": task.pages,
-            "priority": task.priority,
-            "user": task.username
-        }
-    return {
-        "printer_status": "printing" if printer_status['is_printing'] else "idle",
-        "printer_available": printer_status.get('printer_available', False),
-        "current_task": current_task_dict,
-        "queue_length": queue_length,
-        "queue_tasks": [
-            {
-                "name": task.name,
-                "pages": task.pages,
-                "priority": task.priority,
-                "user": task.username
-            } for task in queue_tasks
-        ]
+    global _system_state
+    version = get_state_version()
+    if version[1] is not None and _system_state[0] == version:
+        return _system_state[1]
+
+    queue_version, queue_tasks = get_queue_state()
+    printers = [
+        {
+            "name": status["name"],
+            "printer_name": status["printer_name"],
+            "paper_width_mm": status["paper_width_mm"],
+            "capabilities": status["capabilities"],
+            "status": "printing" if status["is_printing"] else "idle",
+            "available": status.get("printer_available", False),
+            "current_task": status["current_task"].to_dict() if status["current_task"] else None
+        } for status in app.state.printer_pool.get_status()
+    ]
+    printing = [printer for printer in printers if printer["status"] == "printing"]
+    state = {
+        "printer_status": "printing" if printing else "idle",
+        "printer_available": any(printer["available"] for printer in printers),
+        "current_task": printing[0]["current_task"] if printing else None,
+        "printers": printers,
+        "queue_version": queue_version,
+        "queue_length": len(queue_tasks),
+        "queue_tasks": queue_tasks
     }
+    _system_state = (version, state)
+    return state
 
-tasks.initialize_task_router(task_list, manager, get_system_state, UPLOAD_DIR)
-system.initialize_system_router(get_system_state)
+publisher = StatePublisher(manager, get_system_state, interval=STATE_PUSH_INTERVAL)
+
+tasks.initialize_task_router(task_list, manager, get_system_state, UPLOAD_DIR,
+                             route_func=lambda task: app.state.printer_pool.can_serve(task), cache=document_cache,
+                             max_upload_size=MAX_UPLOAD_SIZE, store=upload_store, state_publisher=publisher)
+system.initialize_system_router(get_system_state, get_state_version, publisher)
 pages.initialize_page_router(INDEX_FILE, LOGIN_FILE)
 
 app.include_router(auth.router)
@@ -173,25 +400,19 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    sessions = load_sessions()
-    session = sessions.get(token)
-
-    if not session:
+    if not get_session(token):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    expires = datetime.fromisoformat(session["expires"])
-    if datetime.now() > expires:
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-        return
-
-    await manager.connect(websocket)
+    await manager.connect(websocket, await get_system_state())
     try:
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
+            if await websocket.receive_text() == "resync":
+                manager.resync(websocket)
+    except (WebSocketDisconnect, RuntimeError):
         print(f"Client {websocket.client} disconnected.")
+    finally:
+        manager.disconnect(websocket)
 
 if __name__ == "__main__":
     import socket
@@ -0,0 +1,269 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    created TEXT NOT NULL,
+    expires TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    username TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    printer TEXT,
+    status TEXT NOT NULL,
+    content_hash TEXT,
+    finished TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_username ON jobs (username, finished);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    signature TEXT PRIMARY KEY,
+    expires INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS revoked_tokens_expires ON revoked_tokens (expires);
+"""
+
+
+class DatabaseException(Exception):
+    pass
+
+
+class Database:
+    def __init__(self, path):
+        """
+        SQLite storage for users, sessions and the history of printed jobs.
+
+        The database runs in WAL mode, so readers do not block the writer and every change is a small append
+        instead of a rewrite of a whole file. One connection is shared by all threads behind a lock;
+        all queries use parameters, which sqlite3 keeps as prepared statements in its statement cache.
+
+        :param path: database file, ":memory:" for a temporary database, opened on first use
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.users = None
+        self.users_version = None
+
+    def _connect(self):
+        """
+        Opens the database and creates the tables, must be called with the lock held
+
+        :return: sqlite3 connection
+        :raises DatabaseException: If the database can not be opened
+        """
+        if self.connection is None:
+            try:
+                connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                             cached_statements=256)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.executescript(SCHEMA)
+            except sqlite3.Error as e:
+                raise DatabaseException(f"Could not open database {self.path}: {e}")
+            self.connection = connection
+        return self.connection
+
+    def _write(self, statements):
+        """
+        Runs statements in one transaction
+
+        :param statements: list of (sql, list of parameter tuples)
+        :raises DatabaseException: If a statement fails, nothing is written then
+        """
+        with self.lock:
+            connection = self._connect()
+            try:
+                connection.execute("BEGIN")
+                for sql, rows in statements:
+                    connection.executemany(sql, rows)
+                connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise DatabaseException(f"Database write failed: {e}")
+
+    def _read(self, sql, parameters=()):
+        """
+        Runs a query
+
+        :param sql: SELECT statement
+        :param parameters: tuple of parameters
+        :return: list of rows
+        """
+        with self.lock:
+            try:
+                return self._connect().execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                raise DatabaseException(f"Database read failed: {e}")
+
+    def load_users(self):
+        """
+        Returns all users. The table is cached in memory and read again only when the database was changed,
+        by this process (save_users) or another one (PRAGMA data_version, which SQLite keeps in memory).
+
+        :return: dictionary username -> password hash, must not be modified
+        """
+        version = self._read("PRAGMA data_version")[0][0]
+        users = self.users
+        if users is None or version != self.users_version:
+            users = dict(self._read("SELECT username, password_hash FROM users"))
+            self.users, self.users_version = users, version
+        return users
+
+    def get_password_hash(self, username):
+        """
+        Returns the password hash of one user from the cached user table
+
+        :param username: name of the user
+        :return: password hash, None when the user does not exist
+        """
+        return self.load_users().get(username)
+
+    def save_users(self, users):
+        """
+        Adds or updates users
+
+        :param users: dictionary username -> password hash
+        """
+        self._write([("INSERT OR REPLACE INTO users (username, password_hash) VALUES (?, ?)", list(users.items()))])
+        self.users = None
+
+    def count_users(self):
+        """
+        :return: number of users
+        """
+        return self._read("SELECT COUNT(*) FROM users")[0][0]
+
+    def load_sessions(self):
+        """
+        Returns all sessions
+
+        :return: dictionary token -> session dictionary with username, created and expires
+        """
+        rows = self._read("SELECT token, username, created, expires FROM sessions")
+        return {token: {"username": username, "created": created, "expires": expires}
+                for token, username, created, expires in rows}
+
+    def save_sessions(self, changed, deleted=(), replace=False):
+        """
+        Writes changed sessions and removes deleted ones in one transaction
+
+        :param changed: dictionary token -> session dictionary
+        :param deleted: tokens of removed sessions
+        :param replace: remove every session which is not in changed first
+        """
+        statements = []
+        if replace:
+            statements.append(("DELETE FROM sessions", [()]))
+        statements.append(("DELETE FROM sessions WHERE token = ?", [(token,) for token in deleted]))
+        statements.append((
+            "INSERT OR REPLACE INTO sessions (token, username, created, expires) VALUES (?, ?, ?, ?)",
+            [(token, s["username"], s["created"], s["expires"]) for token, s in changed.items()]
+        ))
+        self._write(statements)
+
+    def revoke_token(self, signature, expires, now):
+        """
+        Records a revoked signed token so that other server processes reject it too,
+        revocations which already expired are removed
+
+        :param signature: revocation key of the token, the hex of its HMAC
+        :param expires: Unix time when the token expires
+        :param now: current Unix time
+        """
+        self._write([
+            ("DELETE FROM revoked_tokens WHERE expires < ?", [(int(now),)]),
+            ("INSERT OR REPLACE INTO revoked_tokens (signature, expires) VALUES (?, ?)", [(signature, int(expires))])
+        ])
+
+    def load_revoked(self, now):
+        """
+        Returns the revoked signed tokens which did not expire yet
+
+        :param now: current Unix time
+        :return: dictionary signature -> expiry (Unix time)
+        """
+        return dict(self._read("SELECT signature, expires FROM revoked_tokens WHERE expires >= ?", (int(now),)))
+
+    def record_job(self, task, printer, status):
+        """
+        Adds a finished print job to the history
+
+        :param task: printed Task
+        :param printer: name of the printer
+        :param status: "printed" or "failed"
+        """
+        self._write([(
+            "INSERT INTO jobs (task_id, name, username, pages, printer, status, content_hash, finished) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(task.task_id, task.name, task.username, task.pages, printer, status, task.content_hash,
+              datetime.now().isoformat())]
+        )])
+
+    def job_history(self, username=None, limit=100):
+        """
+        Returns the latest finished jobs
+
+        :param username: only jobs of this user, all users when None
+        :param limit: maximum number of jobs
+        :return: list of job dictionaries, newest first
+        """
+        columns = ["task_id", "name", "username", "pages", "printer", "status", "content_hash", "finished"]
+        sql = f"SELECT {', '.join(columns)} FROM jobs"
+        parameters = ()
+        if username is not None:
+            sql += " WHERE username = ?"
+            parameters = (username,)
+        sql += " ORDER BY id DESC LIMIT ?"
+        rows = self._read(sql, parameters + (limit,))
+        return [dict(zip(columns, row)) for row in rows]
+
+    def import_json(self, users_file, sessions_file):
+        """
+        Imports users.json and sessions.json of older versions when the database has no users yet.
+        Imported files are renamed to *.imported so they are not read again.
+
+        :param users_file: path of users.json
+        :param sessions_file: path of sessions.json
+        :return: True if anything was imported
+        """
+        if self.count_users() > 0:
+            return False
+        imported = False
+        for path, save in ((users_file, self.save_users), (sessions_file, self.save_sessions)):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    save(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, DatabaseException) as e:
+                print(f"Could not import {path}: {e}")
+                continue
+            os.replace(path, path + ".imported")
+            print(f"Imported {path} into {self.path}")
+            imported = True
+        return imported
+
+    def close(self):
+        """
+        Closes the connection
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,64 @@
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_keys=10000):
+        """
+        Token buckets per key (client address, username, or username on a client address). Every bucket holds at most burst tokens and refills
+        with rate tokens per second, an attempt takes one token.
+
+        :param rate: tokens added per second
+        :param burst: size of a bucket, the number of attempts allowed at once
+        :param max_keys: number of buckets kept before full buckets are forgotten
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def acquire(self, key, now=None):
+        """
+        Takes a token from the bucket of the key
+
+        :param key: client address, or (username, client address)
+        :param now: current time.monotonic(), taken when None
+        :return: 0 when the attempt is allowed, otherwise seconds until the next token
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def refund(self, key, now=None):
+        """
+        Gives back a token taken by acquire, e.g. when the attempt turned out to be allowed for free
+
+        :param key: client address, or (username, client address)
+        :param now: current time.monotonic(), taken when None
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if key not in self.buckets:
+                return
+            tokens, updated = self.buckets[key]
+            self.buckets[key] = (min(self.burst, tokens + (now - updated) * self.rate + 1), now)
+
+    def _prune(self, now):
+        """
+        Forgets the buckets which are full again, must be called with the lock held
+
+        :param now: current time.monotonic()
+        """
+        self.buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self.buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
@@ -1,11 +1,16 @@
+import asyncio
 import os
 import sys
-import json
+import time
 import secrets
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from fastapi import Request, HTTPException, status
+from src.auth.database import Database, DatabaseException
+from src.auth.session_store import SessionStore
+from src.auth.signed_tokens import TokenSigner
 
 class SessionManagerException(Exception):
     pass
@@ -27,7 +32,27 @@ def get_writable_path():
 BASE_DIR = get_writable_path()
 USERS_FILE = os.path.join(BASE_DIR, "users.json")
 SESSIONS_FILE = os.path.join(BASE_DIR, "sessions.json")
+DATABASE_FILE = os.environ.get("SPOOLER_DATABASE", os.path.join(BASE_DIR, "spooler.db"))
 SESSION_DURATION = timedelta(hours=24)
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SPOOLER_SESSION_FLUSH", 1.0))
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SPOOLER_SESSION_SWEEP", 60.0))
+SESSION_MODE = os.environ.get("SPOOLER_SESSION_MODE", "store")
+SESSION_SECRET = os.environ.get("SPOOLER_SESSION_SECRET")
+REVOCATION_REFRESH = 5.0
+PASSWORD_WORKERS = int(os.environ.get("SPOOLER_PASSWORD_WORKERS", 2))
+
+if SESSION_MODE not in ("store", "signed"):
+    raise SessionManagerException(f"Unknown session mode {SESSION_MODE}, use 'store' or 'signed'")
+
+database = Database(DATABASE_FILE)
+session_store = SessionStore(database, flush_interval=SESSION_FLUSH_INTERVAL, sweep_interval=SESSION_SWEEP_INTERVAL)
+token_signer = None
+if SESSION_MODE == "signed":
+    if not SESSION_SECRET:
+        print("SPOOLER_SESSION_SECRET is not set, sessions will not survive a restart")
+    token_signer = TokenSigner(SESSION_SECRET or secrets.token_bytes(32))
+_revoked_loaded_at = None
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
 
 
 def hash_password(password: str) -> str:
@@ -43,63 +68,103 @@ def verify_password(plain: str, hashed: str) -> bool:
         return False
 
 
+def initialize_storage():
+    """
+    Imports users.json and sessions.json of older versions into the database and creates the default users.
+    Must run before the first session lookup.
+    """
+    database.import_json(USERS_FILE, SESSIONS_FILE)
+    load_users()
+
 def load_users() -> Dict[str, str]:
-    if not os.path.exists(USERS_FILE):
-        default_users = {
+    users = database.load_users()
+    if not users:
+        users = {
             "admin": hash_password("admin123"),
             "user": hash_password("user123"),
             "John": hash_password("Doe"),
         }
-        with open(USERS_FILE, 'w') as f:
-            json.dump(default_users, f, indent=2)
-        print(f"Created {USERS_FILE} with default admin user")
-        return default_users
+        database.save_users(users)
+        print(f"Created default users in {DATABASE_FILE}")
+    return users
 
-    with open(USERS_FILE, 'r') as f:
-        return json.load(f)
+def get_password_hash(username: str) -> Optional[str]:
+    return database.get_password_hash(username)
 
 def load_sessions() -> Dict[str, Dict[str, Any]]:
-    if not os.path.exists(SESSIONS_FILE):
-        return {}
-    try:
-        with open(SESSIONS_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+    return session_store.all()
 
 def save_sessions(sessions: Dict[str, Dict[str, Any]]):
-    with open(SESSIONS_FILE, 'w') as f:
-        json.dump(sessions, f, indent=2)
+    session_store.replace(sessions)
 
 
 def create_session(username: str) -> str:
-    token = secrets.token_urlsafe(32)
-    sessions = load_sessions()
-    sessions[token] = {
-        "username": username,
-        "created": datetime.now().isoformat(),
-        "expires": (datetime.now() + SESSION_DURATION).isoformat()
-    }
-    save_sessions(sessions)
-    return token
+    if token_signer:
+        return token_signer.sign(username, time.time() + SESSION_DURATION.total_seconds())
+    return session_store.create(username, SESSION_DURATION)
+
+def _refresh_revoked(now: float):
+    """
+    Loads the tokens revoked by other server processes, at most once per REVOCATION_REFRESH seconds.
+    """
+    global _revoked_loaded_at
+    if _revoked_loaded_at is not None and now - _revoked_loaded_at < REVOCATION_REFRESH:
+        return
+    _revoked_loaded_at = now
+    try:
+        token_signer.add_revoked(database.load_revoked(now), now)
+    except DatabaseException as e:
+        print(f"Could not load revoked tokens: {e}")
+
+def get_session(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the live session of a token. Signed tokens are checked in memory,
+    other tokens are looked up in the in-memory session store.
+
+    :param token: session token from the cookie
+    :return: session dictionary, None when unknown, expired or revoked
+    """
+    if token_signer:
+        now = time.time()
+        _refresh_revoked(now)
+        session = token_signer.verify(token, now)
+        if session is None:
+            return None
+        return {"username": session["username"], "expires": datetime.fromtimestamp(session["expires"]).isoformat()}
+    return session_store.get(token)
+
+def delete_session(token: str) -> bool:
+    if token_signer:
+        now = time.time()
+        revoked = token_signer.revoke(token, now)
+        if revoked is None:
+            return False
+        try:
+            database.revoke_token(*revoked, now)
+        except DatabaseException as e:
+            print(f"Could not share revoked token: {e}")
+        return True
+    return session_store.delete(token)
+
+def get_session_stats() -> Dict[str, Any]:
+    """
+    Returns the session metrics. Signed tokens are not stored, so in that mode only the revoked tokens are counted.
+
+    :return: dictionary with the session mode and its counters
+    """
+    if token_signer:
+        return {"mode": SESSION_MODE, "revoked": len(token_signer.revoked)}
+    return {"mode": SESSION_MODE, **session_store.stats()}
 
 def get_current_user(request: Request) -> Optional[str]:
     token = request.cookies.get("session_token")
     if not token:
         return None
 
-    sessions = load_sessions()
-    session = sessions.get(token)
-
+    session = get_session(token)
     if not session:
         return None
 
-    expires = datetime.fromisoformat(session["expires"])
-    if datetime.now() > expires:
-        del sessions[token]
-        save_sessions(sessions)
-        return None
-
     return session["username"]
 
 
@@ -115,9 +180,16 @@ async def require_auth(request: Request):
 
 
 def authenticate_user(username: str, password: str) -> bool:
-    users = load_users()
-
-    if username not in users:
+    hashed = get_password_hash(username)
+    if hashed is None:
         return False
 
-    return verify_password(password, users[username])
\ No newline at end of file
+    return verify_password(password, hashed)
+
+async def authenticate_user_async(username: str, password: str) -> bool:
+    """
+    Runs authenticate_user in the password thread pool, so the bcrypt cost does not block the event loop.
+    At most PASSWORD_WORKERS passwords are checked at once, further logins wait for a free worker.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, authenticate_user, username, password)
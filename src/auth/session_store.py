@@ -0,0 +1,271 @@
+import heapq
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from src.auth.database import DatabaseException
+
+
+class SessionStoreException(Exception):
+    pass
+
+
+class SessionStore:
+    def __init__(self, database, flush_interval=1.0, sweep_interval=60.0):
+        """
+        In-memory sessions, the source of truth for authentication.
+
+        Lookups are dictionary reads. Changed and removed tokens are collected and a background thread writes
+        them to the database at most once per flush_interval in one transaction, so many logins share one write.
+        Expiry times are kept in a min-heap, the writer thread purges the expired sessions every sweep_interval.
+
+        :param database: Database holding the sessions, loaded on first use
+        :param flush_interval: maximum number of seconds a change waits before it is written
+        :param sweep_interval: number of seconds between two purges of the expired sessions
+        """
+        self.database = database
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.last_sweep = None
+        self.expired_count = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.sessions = None
+        self.expires = {}
+        self.expiry_heap = []
+        self.changed_tokens = set()
+        self.deleted_tokens = set()
+        self.replaced = False
+        self.running = False
+        self.thread = None
+
+    def _load(self):
+        """
+        Reads the sessions from the database on first use, must be called with the lock held
+        """
+        if self.sessions is not None:
+            return
+        sessions = self.database.load_sessions()
+        self.sessions = {}
+        self.expires = {}
+        self.expiry_heap = []
+        for token, session in sessions.items():
+            self._add(token, session)
+
+    def _add(self, token, session):
+        """
+        Adds a session and indexes its expiry, must be called with the lock held
+
+        :param token: session token
+        :param session: dictionary with username, created and expires (ISO format)
+        :raises SessionStoreException: If the session has no valid expiry
+        """
+        try:
+            expires = datetime.fromisoformat(session["expires"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise SessionStoreException(f"Invalid session expiry: {e}")
+        self.sessions[token] = session
+        self.expires[token] = expires
+        heapq.heappush(self.expiry_heap, (expires, token))
+
+    def _remove(self, token):
+        """
+        Removes a session, its heap entry is dropped lazily, must be called with the lock held
+
+        :param token: session token
+        """
+        self.sessions.pop(token, None)
+        self.expires.pop(token, None)
+        self.changed_tokens.discard(token)
+        self.deleted_tokens.add(token)
+
+    def get(self, token, now=None):
+        """
+        Returns the live session of the token, an expired session is removed
+
+        :param token: session token
+        :param now: current time, datetime.now() when None
+        :return: session dictionary or None
+        """
+        with self.lock:
+            self._load()
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            if (now or datetime.now()) > self.expires[token]:
+                self._remove(token)
+                self.expired_count += 1
+                return None
+            return session
+
+    def create(self, username, duration):
+        """
+        Creates a new session
+
+        :param username: user who logged in
+        :param duration: timedelta until the session expires
+        :return: new session token
+        """
+        token = secrets.token_urlsafe(32)
+        now = datetime.now()
+        session = {
+            "username": username,
+            "created": now.isoformat(),
+            "expires": (now + duration).isoformat()
+        }
+        with self.lock:
+            self._load()
+            self._add(token, session)
+            self.changed_tokens.add(token)
+            self.deleted_tokens.discard(token)
+        return token
+
+    def delete(self, token):
+        """
+        Removes a session
+
+        :param token: session token
+        :return: True if the session existed
+        """
+        with self.lock:
+            self._load()
+            if token not in self.sessions:
+                return False
+            self._remove(token)
+            return True
+
+    def all(self):
+        """
+        Returns a copy of all sessions
+
+        :return: dictionary token -> session
+        """
+        with self.lock:
+            self._load()
+            return dict(self.sessions)
+
+    def replace(self, sessions):
+        """
+        Replaces all sessions
+
+        :param sessions: dictionary token -> session
+        """
+        with self.lock:
+            self.sessions = {}
+            self.expires = {}
+            self.expiry_heap = []
+            for token, session in sessions.items():
+                self._add(token, session)
+            self.changed_tokens = set(self.sessions)
+            self.deleted_tokens = set()
+            self.replaced = True
+
+    def purge_expired(self, now=None):
+        """
+        Removes the expired sessions, O(k log n) for k expired sessions
+
+        :param now: current time, datetime.now() when None
+        :return: number of removed sessions
+        """
+        now = now or datetime.now()
+        removed = 0
+        with self.lock:
+            self._load()
+            while self.expiry_heap and self.expiry_heap[0][0] < now:
+                expires, token = heapq.heappop(self.expiry_heap)
+                if self.expires.get(token) == expires:
+                    self._remove(token)
+                    removed += 1
+            self.expired_count += removed
+        return removed
+
+    def stats(self):
+        """
+        Returns the metrics of the store
+
+        :return: dictionary with live (sessions in memory), expired (removed expired sessions since start)
+            and pending (changed sessions not written yet)
+        """
+        with self.lock:
+            self._load()
+            return {
+                "live": len(self.sessions),
+                "expired": self.expired_count,
+                "pending": len(self.changed_tokens) + len(self.deleted_tokens)
+            }
+
+    def __len__(self):
+        with self.lock:
+            self._load()
+            return len(self.sessions)
+
+    def start(self):
+        """
+        Start the background writer thread
+        """
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="SessionStore", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop the writer thread after writing the pending changes
+        """
+        with self.lock:
+            self.running = False
+            self.changed.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the sessions changed since the last write in one transaction
+
+        :raises DatabaseException: If the write fails, the changes are kept for the next flush
+        """
+        with self.lock:
+            if not (self.changed_tokens or self.deleted_tokens or self.replaced):
+                return
+            changed = {token: self.sessions[token] for token in self.changed_tokens}
+            deleted, replaced = self.deleted_tokens, self.replaced
+            self.changed_tokens, self.deleted_tokens, self.replaced = set(), set(), False
+
+        try:
+            self.database.save_sessions(changed, deleted, replace=replaced)
+        except DatabaseException:
+            with self.lock:
+                self.changed_tokens |= {token for token in changed if token in self.sessions}
+                self.deleted_tokens |= {token for token in deleted if token not in self.sessions}
+                self.replaced = self.replaced or replaced
+            raise
+
+    def _run(self):
+        """
+        Main loop of the writer thread
+        """
+        while True:
+            with self.lock:
+                if self.running:
+                    self.changed.wait(self.flush_interval)
+                running = self.running
+
+            try:
+                now = time.monotonic()
+                if running and (self.last_sweep is None or now - self.last_sweep >= self.sweep_interval):
+                    self.last_sweep = now
+                    removed = self.purge_expired()
+                    if removed:
+                        print(f"Removed {removed} expired sessions")
+                self.flush()
+            except DatabaseException as e:
+                print(f"Error writing sessions: {e}")
+
+            if not running:
+                break
@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+
+class SignedTokenException(Exception):
+    pass
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    def __init__(self, secret):
+        """
+        Stateless session tokens: "<payload>.<signature>", both base64url, where the payload is JSON with the
+        username and the expiry (Unix time) and the signature is HMAC-SHA256 of the payload.
+
+        Verifying a token needs only the secret, so it takes no I/O and every server process sharing the secret
+        accepts it. Tokens revoked before their expiry (logout) are kept in a small in-memory set until they expire.
+
+        :param secret: signing key, bytes or str
+        :raises SignedTokenException: If the secret is empty
+        """
+        if not secret:
+            raise SignedTokenException("Token secret must not be empty")
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.lock = threading.Lock()
+        self.revoked = {}
+
+    def _signature(self, payload):
+        return hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest()
+
+    def sign(self, username, expires):
+        """
+        Creates a token
+
+        :param username: user who logged in
+        :param expires: Unix time when the token expires
+        :return: token string
+        """
+        payload = _encode(json.dumps({"u": username, "e": int(expires)}, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{_encode(self._signature(payload))}"
+
+    def _check(self, token, now):
+        """
+        Checks the signature and the expiry of a token
+
+        :param token: token string
+        :param now: current Unix time, time.time() when None
+        :return: (revocation key, session dictionary), None when the token is not valid
+        """
+        payload, _, signature = token.partition(".")
+        expected = self._signature(payload) if payload.isascii() else None
+        try:
+            if expected is None or _encode(_decode(signature)) != signature:
+                return None
+            if not hmac.compare_digest(_decode(signature), expected):
+                return None
+            data = json.loads(_decode(payload))
+            username, expires = data["u"], data["e"]
+        except (ValueError, TypeError, KeyError):
+            return None
+        if not isinstance(expires, int) or (now or time.time()) > expires:
+            return None
+        return expected.hex(), {"username": username, "expires": expires}
+
+    def verify(self, token, now=None):
+        """
+        Checks the signature, the expiry and the revocation set of a token.
+        Revocations are keyed on the HMAC itself, so another spelling of the same signature is revoked too.
+
+        :param token: token string
+        :param now: current Unix time, time.time() when None
+        :return: dictionary with username and expires (Unix time), None when the token is not valid
+        """
+        checked = self._check(token, now)
+        if checked is None or checked[0] in self.revoked:
+            return None
+        return checked[1]
+
+    def revoke(self, token, now=None):
+        """
+        Revokes a valid token until it expires
+
+        :param token: token string
+        :param now: current Unix time, time.time() when None
+        :return: (revocation key, expires) of the revoked token, None when the token was not valid
+        """
+        checked = self._check(token, now)
+        if checked is None or checked[0] in self.revoked:
+            return None
+        key, session = checked
+        self.add_revoked({key: session["expires"]}, now)
+        return key, session["expires"]
+
+    def add_revoked(self, revoked, now=None):
+        """
+        Adds revoked signatures, e.g. loaded from other processes, and forgets the expired ones
+
+        :param revoked: dictionary revocation key (hex of the HMAC) -> expiry (Unix time)
+        :param now: current Unix time, time.time() when None
+        """
+        now = now or time.time()
+        with self.lock:
+            current = {signature: expires for signature, expires in self.revoked.items() if expires >= now}
+            current.update({signature: expires for signature, expires in revoked.items() if expires >= now})
+            self.revoked = current
@@ -0,0 +1,367 @@
+import os
+import socket
+import threading
+import time
+
+
+class PrinterBackendException(Exception):
+    pass
+
+
+class PrinterBackend:
+    """
+    Device I/O of one printer. The Printer thread formats the document, the backend only
+    checks if the device is reachable and sends raw bytes to it.
+    """
+    kind = "base"
+
+    def is_available(self):
+        """
+        Checks if the device can accept a job
+
+        :return: True if the device is available, False otherwise
+        """
+        raise NotImplementedError
+
+    def write(self, data, job_name="Print Job"):
+        """
+        Sends raw bytes to the device as one job
+
+        :param data: bytes to send
+        :param job_name: name of the job
+        :return: job handle passed to wait_for_completion
+        :raises PrinterBackendException: If the data could not be sent
+        """
+        raise NotImplementedError
+
+    def wait_for_completion(self, job, timeout):
+        """
+        Waits until the device finished printing the job
+
+        :param job: job handle returned by write
+        :param timeout: maximum number of seconds to wait
+        :return: True when completion was confirmed, False when the job failed or timed out,
+            None when the backend can not detect completion
+        """
+        return None
+
+    def cancel(self, job):
+        """
+        Removes a failed job from the device queue, so it is not printed again when the job is retried
+
+        :param job: job handle returned by write
+        """
+        pass
+
+    def describe(self):
+        """
+        Returns a short description of the device for logs
+
+        :return: description string
+        """
+        return self.kind
+
+
+class Win32Backend(PrinterBackend):
+    kind = "win32"
+    ENUM_TTL = 1.0
+    _enum_lock = threading.Lock()
+    _enum_cache = (None, [])
+
+    def __init__(self, printer_name):
+        """
+        Windows spooler printer used through pywin32
+
+        :param printer_name: name of the printer in Windows
+        """
+        self.printer_name = printer_name
+        try:
+            import win32print
+            self.win32print = win32print
+        except ImportError:
+            self.win32print = None
+
+    def is_available(self):
+        if self.win32print is None:
+            return False
+        return self.printer_name in self._enum_printers()
+
+    def _enum_printers(self):
+        """
+        Enumerates Windows printers once per ENUM_TTL for all Win32Backend instances
+
+        :return: list of printer names
+        """
+        with Win32Backend._enum_lock:
+            checked, printers = Win32Backend._enum_cache
+            if checked is None or time.monotonic() - checked >= self.ENUM_TTL:
+                try:
+                    printers = [printer[2] for printer in self.win32print.EnumPrinters(2)]
+                except Exception as e:
+                    print(f"Error checking printer: {e}")
+                    printers = []
+                Win32Backend._enum_cache = (time.monotonic(), printers)
+            return printers
+
+    def write(self, data, job_name="Print Job"):
+        if self.win32print is None:
+            raise PrinterBackendException("win32print is not available on this system")
+
+        try:
+            hPrinter = self.win32print.OpenPrinter(self.printer_name)
+            try:
+                job_id = self.win32print.StartDocPrinter(hPrinter, 1, (job_name, None, "RAW"))
+                self.win32print.StartPagePrinter(hPrinter)
+                self.win32print.WritePrinter(hPrinter, data)
+                self.win32print.EndPagePrinter(hPrinter)
+                self.win32print.EndDocPrinter(hPrinter)
+            finally:
+                self.win32print.ClosePrinter(hPrinter)
+        except Exception as e:
+            raise PrinterBackendException(f"Failed to write to '{self.printer_name}': {e}")
+        return job_id
+
+    def wait_for_completion(self, job, timeout, poll_interval=0.1):
+        """
+        Polls the Windows spooler until the job is printed or leaves the queue
+        """
+        if self.win32print is None or job is None:
+            return None
+
+        printed = getattr(self.win32print, "JOB_STATUS_PRINTED", 0x80)
+        failed = (getattr(self.win32print, "JOB_STATUS_ERROR", 0x2) | getattr(self.win32print, "JOB_STATUS_OFFLINE", 0x20)
+                  | getattr(self.win32print, "JOB_STATUS_PAPEROUT", 0x40))
+        deadline = time.monotonic() + timeout
+        try:
+            hPrinter = self.win32print.OpenPrinter(self.printer_name)
+        except Exception:
+            return None
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    status = self.win32print.GetJob(hPrinter, job, 1)["Status"]
+                except Exception:
+                    return True
+                if status & printed:
+                    return True
+                if status & failed:
+                    return False
+                time.sleep(poll_interval)
+            return False
+        finally:
+            self.win32print.ClosePrinter(hPrinter)
+
+    def cancel(self, job):
+        """
+        Deletes the job from the Windows spooler, a job waiting for paper would otherwise print with its retry
+        """
+        if self.win32print is None or job is None:
+            return
+        try:
+            hPrinter = self.win32print.OpenPrinter(self.printer_name)
+            try:
+                self.win32print.SetJob(hPrinter, job, 0, None, getattr(self.win32print, "JOB_CONTROL_DELETE", 5))
+            finally:
+                self.win32print.ClosePrinter(hPrinter)
+        except Exception as e:
+            print(f"Error deleting job {job} on '{self.printer_name}': {e}")
+
+    def describe(self):
+        return f"win32:{self.printer_name}"
+
+
+class FileBackend(PrinterBackend):
+    kind = "file"
+
+    def __init__(self, path):
+        """
+        Raw device node or file, e.g. /dev/usb/lp0
+
+        :param path: path of the device node
+        """
+        self.path = path
+
+    def is_available(self):
+        return os.path.exists(self.path) and os.access(self.path, os.W_OK)
+
+    def write(self, data, job_name="Print Job"):
+        try:
+            with open(self.path, 'ab', buffering=0) as f:
+                f.write(data)
+        except OSError as e:
+            raise PrinterBackendException(f"Failed to write to {self.path}: {e}")
+
+    def describe(self):
+        return f"file:{self.path}"
+
+
+class SocketBackend(PrinterBackend):
+    kind = "socket"
+    STATUS_REQUEST = b"\x1D\x72\x01"
+
+    def __init__(self, host, port=9100, timeout=5.0, status_poll=False):
+        """
+        Network printer accepting raw jobs on a TCP port (JetDirect / port 9100 style)
+
+        With status_poll the job ends with an ESC/POS paper status request (GS r 1). The printer handles it
+        in order after the job data, so its answer confirms completion. A printer which never answered
+        is no longer polled after its first unanswered request.
+
+        :param host: host name or IP address of the printer
+        :param port: TCP port of the printer
+        :param timeout: connect and send timeout in seconds
+        :param status_poll: confirm completion with a status request
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.status_poll = status_poll
+        self.answered = False
+
+    def is_available(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                return True
+        except OSError:
+            return False
+
+    def write(self, data, job_name="Print Job"):
+        try:
+            connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise PrinterBackendException(f"Failed to send to {self.host}:{self.port}: {e}")
+        try:
+            connection.sendall(data + self.STATUS_REQUEST if self.status_poll else data)
+            connection.shutdown(socket.SHUT_WR)
+        except OSError as e:
+            connection.close()
+            raise PrinterBackendException(f"Failed to send to {self.host}:{self.port}: {e}")
+        if not self.status_poll:
+            connection.close()
+            return None
+        return connection
+
+    def wait_for_completion(self, job, timeout):
+        """
+        Waits for the answer to the status request sent after the job.
+        No answer, e.g. while the printer is out of paper, is reported as unknown and not as a failure,
+        because the printer still holds the job and prints it later.
+        """
+        if job is None:
+            return None
+        try:
+            job.settimeout(timeout)
+            if not job.recv(1):
+                return None
+            self.answered = True
+            return True
+        except socket.timeout:
+            if not self.answered:
+                print(f"Printer {self.host}:{self.port} does not answer status requests, status polling disabled")
+                self.status_poll = False
+            return None
+        except OSError:
+            return None
+        finally:
+            job.close()
+
+    def describe(self):
+        return f"socket:{self.host}:{self.port}"
+
+
+class SimulatedBackend(PrinterBackend):
+    kind = "simulated"
+
+    def __init__(self, bytes_per_second=2000.0, chunk_size=256):
+        """
+        Printer simulator for load testing without hardware.
+        Writing takes len(data) / bytes_per_second seconds, paper-out and disconnect events
+        can be triggered at any time and fail the job being written.
+
+        :param bytes_per_second: simulated device throughput
+        :param chunk_size: number of bytes "printed" between checks for events
+        """
+        if bytes_per_second <= 0:
+            raise PrinterBackendException("bytes_per_second must be positive")
+        self.bytes_per_second = bytes_per_second
+        self.chunk_size = chunk_size
+        self.connected = True
+        self.has_paper = True
+        self.bytes_written = 0
+        self.jobs_written = 0
+        self.lock = threading.Lock()
+
+    def disconnect(self):
+        """
+        Simulates unplugging the printer
+        """
+        self.connected = False
+
+    def connect(self):
+        """
+        Simulates plugging the printer back
+        """
+        self.connected = True
+
+    def paper_out(self):
+        """
+        Simulates running out of paper
+        """
+        self.has_paper = False
+
+    def load_paper(self):
+        """
+        Simulates loading new paper
+        """
+        self.has_paper = True
+
+    def is_available(self):
+        return self.connected and self.has_paper
+
+    def write(self, data, job_name="Print Job"):
+        with self.lock:
+            for start in range(0, len(data), self.chunk_size):
+                if not self.connected:
+                    raise PrinterBackendException(f"Simulated printer disconnected during '{job_name}'")
+                if not self.has_paper:
+                    raise PrinterBackendException(f"Simulated printer out of paper during '{job_name}'")
+                chunk = data[start:start + self.chunk_size]
+                time.sleep(len(chunk) / self.bytes_per_second)
+                self.bytes_written += len(chunk)
+            self.jobs_written += 1
+        return self.jobs_written
+
+    def wait_for_completion(self, job, timeout):
+        """
+        The simulated device prints while write() runs, so the job is done when write returned
+        """
+        return True
+
+    def describe(self):
+        return f"simulated:{self.bytes_per_second:g}B/s"
+
+
+BACKENDS = {
+    Win32Backend.kind: Win32Backend,
+    FileBackend.kind: FileBackend,
+    SocketBackend.kind: SocketBackend,
+    SimulatedBackend.kind: SimulatedBackend,
+}
+
+
+def make_backend(config):
+    """
+    Creates a backend from its configuration
+
+    :param config: dictionary with "type" (win32, file, socket, simulated) and the backend arguments
+    :return: PrinterBackend instance
+    :raises PrinterBackendException: If the type is unknown or the arguments are wrong
+    """
+    config = dict(config)
+    kind = config.pop("type", None)
+    if kind not in BACKENDS:
+        raise PrinterBackendException(f"backend type must be one of {sorted(BACKENDS)}")
+    try:
+        return BACKENDS[kind](**config)
+    except TypeError as e:
+        raise PrinterBackendException(f"Invalid {kind} backend configuration: {e}")
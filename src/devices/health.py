@@ -0,0 +1,137 @@
+import threading
+import time
+
+
+class PrinterHealthMonitor(threading.Thread):
+    def __init__(self, interval=5.0, clock=time.monotonic):
+        """
+        Background thread which checks the availability of printers and caches it.
+
+        The print path only reads the cached flag, the slow device enumeration runs here once
+        per interval. Changes are pushed to the callback registered for the printer, and a
+        failed write marks the printer unavailable right away and triggers a new check.
+
+        :param interval: seconds between two checks, also the time to live of a cached result
+        :param clock: function returning the current time in seconds
+        """
+        threading.Thread.__init__(self, name="PrinterHealthMonitor", daemon=True)
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.wakeup = threading.Event()
+        self.running = False
+        self.watched = {}
+
+    def watch(self, printer, on_change=None):
+        """
+        Starts watching the printer and checks it once
+
+        :param printer: Printer instance with a backend
+        :param on_change: function (printer, available) called from the monitor thread when availability changes
+        """
+        with self.lock:
+            self.watched[printer.name] = {"printer": printer, "on_change": on_change, "available": None, "checked": None}
+        self.check(printer)
+
+    def check(self, printer):
+        """
+        Checks the printer now and updates the cache
+
+        :param printer: watched Printer instance
+        :return: True if the printer is available
+        """
+        try:
+            available = bool(printer.backend.is_available())
+        except Exception as e:
+            print(f"Error checking printer {printer.name}: {e}")
+            available = False
+        self._update(printer, available)
+        return available
+
+    def is_available(self, printer):
+        """
+        Returns the cached availability, checks again only if the cache expired
+        and the monitor thread is not running
+
+        :param printer: watched Printer instance
+        :return: True if the printer is available
+        """
+        with self.lock:
+            entry = self.watched[printer.name]
+            fresh = entry["checked"] is not None and self.clock() - entry["checked"] < self.interval
+            if fresh or self.running:
+                return bool(entry["available"])
+        return self.check(printer)
+
+    def wait_available(self, printer, timeout=None):
+        """
+        Blocks until the printer becomes available
+
+        :param printer: watched Printer instance
+        :param timeout: maximum number of seconds to wait
+        :return: True if the printer is available
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.watched[printer.name]["available"], timeout)
+            return bool(self.watched[printer.name]["available"])
+
+    def report_failure(self, printer):
+        """
+        Marks the printer unavailable after a failed write and schedules a new check
+
+        :param printer: watched Printer instance
+        """
+        self._update(printer, False)
+        self.wakeup.set()
+
+    def _update(self, printer, available):
+        """
+        Stores the result of a check and pushes the change to the callback
+
+        :param printer: watched Printer instance
+        :param available: result of the check
+        """
+        with self.lock:
+            entry = self.watched[printer.name]
+            previous = entry["available"]
+            entry["available"] = available
+            entry["checked"] = self.clock()
+            printer.printer_available = available
+            self.changed.notify_all()
+            on_change = entry["on_change"]
+
+        if previous is not None and previous != available and on_change:
+            try:
+                on_change(printer, available)
+            except Exception as e:
+                print(f"Error in printer health callback: {e}")
+
+    def stop(self):
+        """
+        Stops the monitor thread
+        """
+        with self.lock:
+            self.running = False
+        self.wakeup.set()
+
+    def start(self):
+        with self.lock:
+            self.running = True
+        threading.Thread.start(self)
+
+    def run(self):
+        """
+        Main loop of the monitor
+        """
+        while True:
+            with self.lock:
+                if not self.running:
+                    break
+                printers = [entry["printer"] for entry in self.watched.values()]
+
+            for printer in printers:
+                self.check(printer)
+
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
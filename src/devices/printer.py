@@ -1,13 +1,17 @@
+import itertools
 import threading
 import time
-import asyncio
-import win32print
 import os
-from pypdf import PdfReader
 
 import re
 
-from src.spooler.task_list import TaskList
+from src.spooler.task_list import TaskList, TaskListEmptyException
+from src.devices.backends import PrinterBackend, PrinterBackendException, Win32Backend, make_backend
+from src.devices.health import PrinterHealthMonitor
+from src.devices.throughput import ThroughputModel
+from src.spooler.document_cache import parse_document
+from src.spooler.state_publisher import StatePublisher
+from src.auth.database import DatabaseException
 
 
 class PrinterException(Exception):
@@ -15,7 +19,32 @@ class PrinterException(Exception):
 
 
 class Printer(threading.Thread):
-    def __init__(self, task_list, manager, loop, name="printer", get_system_state_func=None, printer_name="Xprinter"):
+    def __init__(self, task_list, manager, loop, name="printer", get_system_state_func=None, printer_name="Xprinter",
+                 paper_width_mm=58, char_per_line=32, capabilities=None, backend=None, health_monitor=None,
+                 bytes_per_second=1000.0, render_pipeline=None, document_cache=None, upload_store=None,
+                 publisher=None, job_history=None):
+        """
+        Printer worker thread which takes tasks accepted by it from the shared TaskList
+
+        :param task_list: shared TaskList
+        :param manager: ConnectionManager used for broadcasts
+        :param loop: event loop of the server
+        :param name: unique name of the worker, used for routing tasks to this printer
+        :param get_system_state_func: coroutine function returning the system state
+        :param printer_name: name of the device in the operating system
+        :param paper_width_mm: paper width of the device
+        :param char_per_line: number of characters on one line
+        :param capabilities: extra capability names, "<paper_width_mm>mm" is always included
+        :param backend: PrinterBackend instance or backend configuration dictionary,
+            Win32Backend for printer_name when None
+        :param health_monitor: shared PrinterHealthMonitor, the printer runs its own when None
+        :param bytes_per_second: initial estimate of the device speed, refined from confirmed jobs
+        :param render_pipeline: RenderPipeline preparing the bytes of queued tasks ahead, or None
+        :param document_cache: DocumentCache with the documents parsed at upload, or None to parse at print time
+        :param upload_store: UploadStore holding the uploaded files, printed files are deleted directly when None
+        :param publisher: StatePublisher shared by the printers, the printer makes its own when None
+        :param job_history: Database recording the finished jobs, or None
+        """
         threading.Thread.__init__(self)
         self.name = name
         self.tasks = task_list
@@ -27,66 +56,78 @@ class Printer(threading.Thread):
         self.lock = threading.Lock()
         self.get_system_state_func = get_system_state_func
         self.printer_name = printer_name
+        self.backend = backend
         self.printer_available = False
-
-        self.paper_width_mm = 58
-        self.char_per_line = 32
-
-        self._check_printer_availability()
+        self.publisher = publisher or StatePublisher(manager, get_system_state_func, loop=loop)
+        self._versions = itertools.count(1)
+        self.status_version = 0
+
+        self.paper_width_mm = paper_width_mm
+        self.char_per_line = char_per_line
+        self.capabilities = frozenset(capabilities or ()) | {f"{paper_width_mm}mm"}
+        self.throughput = ThroughputModel(bytes_per_second)
+
+        self.document_cache = document_cache
+        self.upload_store = upload_store
+        self.job_history = job_history
+        self.render_pipeline = render_pipeline
+        if render_pipeline:
+            render_pipeline.register(self.char_per_line, self.accepts, self.render_task)
+
+        self.owns_health_monitor = health_monitor is None
+        self.health_monitor = health_monitor or PrinterHealthMonitor()
+        self.health_monitor.watch(self, on_change=self._on_availability_change)
 
         print(f"Printer thread: current task={self.current_task.name if self.current_task else None}")
 
+    @property
+    def backend(self):
+        return self._backend
+
+    @backend.setter
+    def backend(self, value):
+        if value is None:
+            value = Win32Backend(self.printer_name)
+        elif isinstance(value, dict):
+            try:
+                value = make_backend(value)
+            except PrinterBackendException as e:
+                raise PrinterException(f"Invalid printer backend: {e}")
+        if not isinstance(value, PrinterBackend):
+            raise PrinterException("Printer backend must be a PrinterBackend or a backend configuration")
+        self._backend = value
+
     def _check_printer_availability(self):
         """
-        Checks if the printer is available in Windows
+        Checks the printer device now, bypassing the cached availability
 
         :return: True if the printer is available, False otherwise
         """
-        try:
-            printers = [printer[2] for printer in win32print.EnumPrinters(2)]
-            if self.printer_name in printers:
-                self.printer_available = True
-                print(f"✓ Printer '{self.printer_name}' is connected and ready")
-                return True
-            else:
-                self.printer_available = False
-                print(f"✗ Printer '{self.printer_name}' not found.")
-                print(f"Available printers: {printers}")
-                return False
-        except Exception as e:
-            self.printer_available = False
-            print(f"Error checking printer: {e}")
-            return False
+        return self.health_monitor.check(self)
 
-    def _extract_text_from_pdf(self, pdf_path):
+    def _on_availability_change(self, printer, available):
         """
-        Extract text from PDF for thermal printer
+        Pushes availability changes reported by the health monitor to the clients
 
-        :param pdf_path: Path to PDF file
-        :return: Extracted text string
+        :param printer: this printer
+        :param available: new availability
         """
-        try:
-            reader = PdfReader(pdf_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
-            raise PrinterException(f"Failed to extract PDF text: {e}")
-
-    import re
-
-    def _detect_invoice_language(self, text):
-        """Detect invoice language"""
-        text_lower = text.lower()
-        if any(word in text_lower for word in ['faktura', 'dodavatel', 'odběratel', 'celkem', 'částka']):
-            return 'cs'
-        elif any(
-                word in text_lower for word in ['invoice', 'bill', 'receipt', 'total', 'amount', 'customer', 'vendor']):
-            return 'en'
+        if available:
+            msg = f"INFO: Printer '{self.printer_name}' is connected and ready"
         else:
-            return 'unknown'
+            msg = f"WARNING: Printer '{self.printer_name}' not connected. Waiting for connection..."
+        print(msg)
+        self._notify_state(msg)
+
+    def _notify_state(self, event=None):
+        """
+        Marks a change of the printer status and lets the StatePublisher push it.
+        Must be called after the status was changed, readers take the version before the status.
+
+        :param event: text message for the clients, or None
+        """
+        self.status_version = next(self._versions)
+        self.publisher.notify(event)
 
     def _smart_format_invoice(self, text):
         """
@@ -314,54 +355,82 @@ class Printer(threading.Thread):
 
         return 'cp437'
 
-    def _print_file(self, file_path, task_name):
+    def _load_document(self, file_path, content_hash=None):
         """
-        Print PDF with smart universal formatting
+        Returns the parsed document, from the DocumentCache when the upload already parsed it
+
+        :param file_path: Path to PDF file
+        :param content_hash: SHA-256 of the file content, or None
+        :return: DocumentArtifact
         """
-        try:
-            if not self._check_printer_availability():
-                raise PrinterException(f"Printer '{self.printer_name}' is not available")
+        if self.document_cache:
+            return self.document_cache.get_or_parse(file_path, file_path, content_hash)
+        return parse_document(file_path, file_path, content_hash)
 
-            file_ext = os.path.splitext(file_path)[1].lower()
-            commands = b'\x1B\x40'
+    def render_task(self, task):
+        """
+        Renders a queued task, used by the RenderPipeline
 
-            if file_ext != '.pdf':
-                raise PrinterException(f"Unsupported file type: {file_ext}")
+        :param task: Task with a file path
+        :return: bytes ready to send to the printer
+        """
+        return self.render_file(task.file_path, task.content_hash)
 
-            try:
-                reader = PdfReader(file_path)
-                text = ""
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            except Exception as e:
-                print(f"Text extraction failed: {e}")
-                raise PrinterException(f"Failed to extract PDF text: {e}")
+    def render_file(self, file_path, content_hash=None):
+        """
+        Turns a PDF into ESC/POS bytes for this printer profile, formatted as an invoice when one is detected
 
-            if not text.strip():
-                raise PrinterException("PDF contains no extractable text")
+        :param file_path: Path to PDF file
+        :param content_hash: SHA-256 of the file content, key of the parsed document in the DocumentCache
+        :return: bytes ready to send to the printer
+        :raises PrinterException: If the file is not a PDF or has no extractable text
+        """
+        file_ext = os.path.splitext(file_path)[1].lower()
+        commands = b'\x1B\x40'
 
-            is_invoice = self._detect_invoice_language(text) in ['cs', 'en']
+        if file_ext != '.pdf':
+            raise PrinterException(f"Unsupported file type: {file_ext}")
 
-            if is_invoice:
-                formatted_text = self._smart_format_invoice(text)
-            else:
-                formatted_text = text
+        document = self._load_document(file_path, content_hash)
+        text = document.text or ""
 
-            encoding = self._get_encoding_for_text(formatted_text)
-            print(f"Using encoding: {encoding}")
+        if not text.strip():
+            raise PrinterException("PDF contains no extractable text")
 
-            commands += b'\x1B\x61\x00'
-            try:
-                commands += formatted_text.encode(encoding, errors='replace')
-            except Exception:
-                commands += formatted_text.encode('utf-8', errors='replace')
+        is_invoice = document.language in ['cs', 'en']
+
+        if is_invoice:
+            formatted_text = self._smart_format_invoice(text)
+        else:
+            formatted_text = text
+
+        encoding = self._get_encoding_for_text(formatted_text)
+        print(f"Using encoding: {encoding}")
+
+        commands += b'\x1B\x61\x00'
+        try:
+            commands += formatted_text.encode(encoding, errors='replace')
+        except Exception:
+            commands += formatted_text.encode('utf-8', errors='replace')
+
+        commands += b'\n\n\n'
+        commands += b'\x1D\x56\x00'
+        return commands
+
+    def _print_file(self, file_path, task_name, data=None, content_hash=None):
+        """
+        Print PDF with smart universal formatting
 
-            commands += b'\n\n\n'
-            commands += b'\x1D\x56\x00'
+        :param file_path: Path to PDF file
+        :param task_name: Name for the print job
+        :param data: bytes rendered ahead by the RenderPipeline, rendered now when None
+        :param content_hash: SHA-256 of the file content, key of the parsed document in the DocumentCache
+        """
+        try:
+            if data is None:
+                data = self.render_file(file_path, content_hash)
 
-            self._print_raw(commands, task_name)
+            self._print_raw(data, task_name)
             print(f"Document printed: {file_path}")
 
         except Exception as e:
@@ -376,25 +445,18 @@ class Printer(threading.Thread):
         :param job_name: Name for the print job
         """
         try:
-            if not self._check_printer_availability():
-                raise PrinterException(f"Printer '{self.printer_name}' is not available")
+            if isinstance(data, str):
+                try:
+                    data = data.encode('cp852')
+                except:
+                    data = data.encode('latin1', errors='replace')
 
-            hPrinter = win32print.OpenPrinter(self.printer_name)
+            started = time.monotonic()
             try:
-                win32print.StartDocPrinter(hPrinter, 1, (job_name, None, "RAW"))
-                win32print.StartPagePrinter(hPrinter)
-
-                if isinstance(data, str):
-                    try:
-                        data = data.encode('cp852')
-                    except:
-                        data = data.encode('latin1', errors='replace')
-
-                win32print.WritePrinter(hPrinter, data)
-                win32print.EndPagePrinter(hPrinter)
-                win32print.EndDocPrinter(hPrinter)
-            finally:
-                win32print.ClosePrinter(hPrinter)
+                job = self.backend.write(data, job_name)
+            except PrinterBackendException:
+                self.health_monitor.report_failure(self)
+                raise
 
             print(f"Data sent to printer successfully")
 
@@ -402,13 +464,61 @@ class Printer(threading.Thread):
             print(f"Error printing: {e}")
             raise PrinterException(f"Failed to print: {e}")
 
+        self._wait_for_completion(job, len(data), started)
+
+    def _wait_for_completion(self, job, size, started):
+        """
+        Waits until the device printed the job.
+        Uses the completion reported by the backend and learns the device speed from it.
+        When the backend can not report completion (file backend, socket backend without status polling) it waits
+        for the bytes-per-second estimate. A failed job is removed from the device queue before it is retried.
+
+        :param job: job handle returned by the backend
+        :param size: number of bytes of the job
+        :param started: time.monotonic() when the write started
+        :raises PrinterException: If the backend reports that the job failed or did not finish in time
+        """
+        estimate = self.throughput.estimate(size)
+        completed = self.backend.wait_for_completion(job, timeout=estimate * 3 + 5)
+
+        if completed:
+            self.throughput.observe(size, time.monotonic() - started)
+        elif completed is None:
+            remaining = estimate - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+        else:
+            self.backend.cancel(job)
+            self.health_monitor.report_failure(self)
+            raise PrinterException(f"Job on '{self.printer_name}' failed or was not completed in time")
+
+
+    def _record_job(self, task, status):
+        """
+        Adds a finished task to the job history, a failing history never stops the printer
+
+        :param task: finished Task
+        :param status: "printed" or "failed"
+        """
+        if self.job_history is None:
+            return
+        try:
+            self.job_history.record_job(task, self.name, status)
+        except DatabaseException as e:
+            print(f"Could not record job {task.name}: {e}")
 
     def _delete_file_after_print(self, file_path):
         """
-        Delete the file after successful printing
+        Delete the file after successful printing.
+        Files of the UploadStore are only released, other queued tasks may print the same content.
 
         :param file_path: Path to file to delete
         """
+        if self.upload_store:
+            if file_path and self.upload_store.release(file_path):
+                print(f"Deleted file: {file_path}")
+            return
+
         try:
             if file_path and os.path.exists(file_path):
                 os.remove(file_path)
@@ -436,6 +546,17 @@ class Printer(threading.Thread):
             raise PrinterException("Printer tasks must be a TaskList class")
         self._tasks = value
 
+    def accepts(self, task):
+        """
+        Checks if the task can be printed by this printer
+
+        :param task: Task instance
+        :return: True if the task is routed to any printer or this one and its capabilities are met
+        """
+        if task.printer is not None and task.printer != self.name:
+            return False
+        return task.capabilities <= self.capabilities
+
     def stop(self):
         """
         Stops the printer
@@ -443,12 +564,15 @@ class Printer(threading.Thread):
         with self.lock:
             self.running = False
 
+        if self.owns_health_monitor:
+            self.health_monitor.stop()
+
         with self.tasks.not_empty:
             self.tasks.not_empty.notify_all()
 
         print("Finished printing")
         msg = "STOP: Printer is stopping"
-        asyncio.run_coroutine_threadsafe(self.manager.broadcast(msg), self.loop)
+        self._notify_state(msg)
 
     def get_status(self):
         """
@@ -458,17 +582,16 @@ class Printer(threading.Thread):
         """
         with self.lock:
             return {
+                'name': self.name,
+                'printer_name': self.printer_name,
+                'paper_width_mm': self.paper_width_mm,
+                'capabilities': sorted(self.capabilities),
                 'running': self.running,
                 'current_task': self.current_task,
                 'is_printing': self.is_printing,
                 'printer_available': self.printer_available
             }
 
-    async def _broadcast_system_state(self):
-        if self.get_system_state_func:
-            state = await self.get_system_state_func()
-            await self.manager.broadcast_json({"type": "system_state", "data": state})
-
     def run(self):
         """
         Main loop of the printer
@@ -476,22 +599,25 @@ class Printer(threading.Thread):
         """
         print("Printer thread started")
 
+        if self.owns_health_monitor:
+            self.health_monitor.start()
+
+        if not self.health_monitor.is_available(self):
+            self._on_availability_change(self, False)
+
         while True:
             with self.lock:
                 if not self.running:
                     break
 
             try:
-                if not self._check_printer_availability():
-                    if not self.printer_available:
-                        msg = f"WARNING: Printer '{self.printer_name}' not connected. Waiting for connection..."
-                        asyncio.run_coroutine_threadsafe(self.manager.broadcast(msg), self.loop)
-                        print(msg)
-
-                        time.sleep(5)
-                        continue
+                if not self.health_monitor.wait_available(self, timeout=1):
+                    continue
 
-                task = self.tasks.pop()
+                try:
+                    task = self.tasks.pop(timeout=1, match=self.accepts)
+                except TaskListEmptyException:
+                    continue
 
                 with self.lock:
                     if not self.running:
@@ -502,8 +628,7 @@ class Printer(threading.Thread):
                     self.is_printing = True
 
                 msg_start = f"START: Printing {task.name} ({task.pages} pages) for {task.username}"
-                asyncio.run_coroutine_threadsafe(self.manager.broadcast(msg_start), self.loop)
-                asyncio.run_coroutine_threadsafe(self._broadcast_system_state(), self.loop)
+                self._notify_state(msg_start)
 
                 print_msg = f"PRINTING: {task.name}, pages={task.pages}, priority={task.priority} for user={task.username}"
                 print(print_msg)
@@ -511,22 +636,17 @@ class Printer(threading.Thread):
                 print_success = False
                 try:
                     if hasattr(task, 'file_path') and task.file_path:
-                        if not self._check_printer_availability():
-                            raise PrinterException("Printer disconnected before printing")
-
-                        self._print_file(task.file_path, task.name)
+                        data = self.render_pipeline.take(task, self.char_per_line) if self.render_pipeline else None
+                        self._print_file(task.file_path, task.name, data, task.content_hash)
                         print_success = True
 
                         self._delete_file_after_print(task.file_path)
-
-                        time.sleep(max(2, task.pages * 0.5))
                     else:
                         print("Warning: No file path found, skipping print")
 
                 except PrinterException as print_error:
                     print(f"Printer error: {print_error}")
                     error_msg = f"ERROR: Printer issue with {task.name}. Task returned to queue."
-                    asyncio.run_coroutine_threadsafe(self.manager.broadcast(error_msg), self.loop)
 
                     self.tasks.append(task)
 
@@ -534,7 +654,7 @@ class Printer(threading.Thread):
                         self.current_task = None
                         self.is_printing = False
 
-                    asyncio.run_coroutine_threadsafe(self._broadcast_system_state(), self.loop)
+                    self._notify_state(error_msg)
 
                     time.sleep(10)
                     continue
@@ -545,21 +665,24 @@ class Printer(threading.Thread):
                     traceback.print_exc()
 
                     error_msg = f"ERROR: Failed to print {task.name}: {str(e)}"
-                    asyncio.run_coroutine_threadsafe(self.manager.broadcast(error_msg), self.loop)
+                    self.publisher.notify(error_msg)
 
                     if hasattr(task, 'file_path'):
                         self._delete_file_after_print(task.file_path)
 
+                self.tasks.task_done(task)
+                self._record_job(task, "printed" if print_success else "failed")
+
                 if self.running and print_success:
                     msg_end = f"END: Printing finished {task.name}"
-                    asyncio.run_coroutine_threadsafe(self.manager.broadcast(msg_end), self.loop)
+                    self.publisher.notify(msg_end)
 
                 with self.lock:
                     self.current_task = None
                     self.is_printing = False
 
                 if self.running:
-                    asyncio.run_coroutine_threadsafe(self._broadcast_system_state(), self.loop)
+                    self._notify_state()
 
             except Exception as e:
                 print(f"Problem in printer thread: {e}")
@@ -570,7 +693,7 @@ class Printer(threading.Thread):
                     if self.running:
                         self.current_task = None
                         self.is_printing = False
-                        asyncio.run_coroutine_threadsafe(self._broadcast_system_state(), self.loop)
+                        self._notify_state()
                     else:
                         break
 
@@ -0,0 +1,104 @@
+from src.devices.printer import Printer
+from src.devices.health import PrinterHealthMonitor
+
+
+class PrinterPoolException(Exception):
+    pass
+
+
+class PrinterPool:
+    def __init__(self, printers, health_monitor=None, render_pipeline=None):
+        """
+        Group of Printer workers consuming one shared TaskList.
+        Each printer only takes tasks it accepts (any printer, its name, or matching capabilities).
+
+        :param printers: list of Printer instances with unique names
+        :param health_monitor: PrinterHealthMonitor shared by the printers, started and stopped with the pool
+        :param render_pipeline: RenderPipeline shared by the printers, started and stopped with the pool
+        :raises PrinterPoolException: If the list is empty or names are not unique
+        """
+        if not printers:
+            raise PrinterPoolException("PrinterPool needs at least one printer")
+        names = [printer.name for printer in printers]
+        if len(set(names)) != len(names):
+            raise PrinterPoolException(f"Printer names must be unique: {names}")
+        self.printers = list(printers)
+        self.health_monitor = health_monitor
+        self.render_pipeline = render_pipeline
+
+    @classmethod
+    def from_config(cls, configs, task_list, manager, loop, get_system_state_func=None, health_interval=5.0,
+                    render_pipeline=None, document_cache=None, upload_store=None, publisher=None,
+                    job_history=None):
+        """
+        Creates the pool from printer profiles
+
+        :param configs: list of dictionaries with Printer keyword arguments
+            (name, printer_name, paper_width_mm, char_per_line, capabilities)
+        :param task_list: shared TaskList
+        :param manager: ConnectionManager used for broadcasts
+        :param loop: event loop of the server
+        :param get_system_state_func: coroutine function returning the system state
+        :param health_interval: seconds between two availability checks of every printer
+        :param render_pipeline: RenderPipeline rendering queued tasks ahead, or None
+        :param document_cache: DocumentCache shared with the upload route, or None
+        :param upload_store: UploadStore shared with the upload route, or None
+        :param publisher: StatePublisher shared with the routes, or None
+        :param job_history: Database recording the finished jobs, or None
+        :return: PrinterPool instance
+        """
+        health_monitor = PrinterHealthMonitor(interval=health_interval)
+        return cls([
+            Printer(task_list, manager, loop, get_system_state_func=get_system_state_func,
+                    health_monitor=health_monitor, render_pipeline=render_pipeline, document_cache=document_cache,
+                    upload_store=upload_store, publisher=publisher, job_history=job_history, **config)
+            for config in configs
+        ], health_monitor=health_monitor, render_pipeline=render_pipeline)
+
+    @property
+    def version(self):
+        """
+        Version of the printer statuses, changes whenever a status of any printer changes
+
+        :return: integer version
+        """
+        return sum(printer.status_version for printer in self.printers)
+
+    def can_serve(self, task):
+        """
+        Checks if at least one printer of the pool accepts the task
+
+        :param task: Task instance
+        :return: True if the task can be printed
+        """
+        return any(printer.accepts(task) for printer in self.printers)
+
+    def start(self):
+        """
+        Starts the health monitor and all printers
+        """
+        if self.health_monitor:
+            self.health_monitor.start()
+        if self.render_pipeline:
+            self.render_pipeline.start()
+        for printer in self.printers:
+            printer.start()
+
+    def stop(self):
+        """
+        Stops all printers and the health monitor
+        """
+        for printer in self.printers:
+            printer.stop()
+        if self.render_pipeline:
+            self.render_pipeline.stop()
+        if self.health_monitor:
+            self.health_monitor.stop()
+
+    def get_status(self):
+        """
+        Returns the status of every printer
+
+        :return: list of printer status dictionaries
+        """
+        return [printer.get_status() for printer in self.printers]
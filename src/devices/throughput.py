@@ -0,0 +1,47 @@
+import threading
+
+
+class ThroughputModel:
+    def __init__(self, bytes_per_second=1000.0, smoothing=0.3, min_job_bytes=256):
+        """
+        Printing speed of one device (exponentially weighted moving average of confirmed jobs).
+        Used to size completion timeouts and to estimate how long a job takes when the backend can not
+        report completion. Only backends which confirm completion refine it, for the others it stays at
+        the configured bytes_per_second.
+
+        :param bytes_per_second: initial estimate before any job was measured
+        :param smoothing: weight of a new measurement, between 0 and 1
+        :param min_job_bytes: jobs smaller than this are not measured, their time is mostly overhead
+        """
+        self.bytes_per_second = float(bytes_per_second)
+        self.smoothing = smoothing
+        self.min_job_bytes = min_job_bytes
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def observe(self, size, seconds):
+        """
+        Adds a measured job
+
+        :param size: number of bytes of the job
+        :param seconds: time from the start of the write to the confirmed completion
+        """
+        if size < self.min_job_bytes or seconds <= 0:
+            return
+        measured = size / seconds
+        with self.lock:
+            if self.samples == 0:
+                self.bytes_per_second = measured
+            else:
+                self.bytes_per_second += self.smoothing * (measured - self.bytes_per_second)
+            self.samples += 1
+
+    def estimate(self, size):
+        """
+        Estimates how long the device needs to print the job
+
+        :param size: number of bytes of the job
+        :return: estimated number of seconds
+        """
+        with self.lock:
+            return size / self.bytes_per_second
@@ -1,8 +1,12 @@
+import uuid
+
+
 class TaskException(Exception):
     pass
 
 class Task:
-    def __init__(self, name, pages, priority, username, file_path=None):
+    def __init__(self, name, pages, priority, username, file_path=None, task_id=None, printer=None, capabilities=None,
+                 content_hash=None):
         """
         Represents a print job submitted by the user
 
@@ -10,13 +14,105 @@ class Task:
         :param pages: Number of pages to print
         :param priority: Priority of the task (lower number = higher priority)
         :param username: User who submitted the task
+        :param task_id: Stable ID of the task, generated when not given
+        :param printer: Name of the printer which must print the task, None for any printer
+        :param capabilities: Capabilities the printer must have, e.g. {"58mm", "cut"}
+        :param content_hash: SHA-256 of the file content, key of the parsed document in the DocumentCache
         :raises TaskException: If parameters are not of the expected type
         """
+        self.task_id = task_id if task_id is not None else uuid.uuid4().hex
+        self.printer = printer
+        self.capabilities = capabilities if capabilities is not None else frozenset()
         self.name = name
         self.pages = pages
         self.priority = priority
         self.username = username
         self.file_path = file_path
+        self.content_hash = content_hash
+
+    @property
+    def task_id(self):
+        """
+        Get the stable ID of the task
+
+        :return: ID of the task
+        """
+        return self._task_id
+
+    @task_id.setter
+    def task_id(self, value):
+        """
+        Set the stable ID of the task
+
+        :param value: ID of the task
+        :raises TaskException: If value is not a string
+        """
+        if not isinstance(value, str):
+            raise TaskException('task_id must be a string')
+        self._task_id = value
+
+    @property
+    def printer(self):
+        """
+        Get the name of the printer which must print the task
+
+        :return: name of the printer or None for any printer
+        """
+        return self._printer
+
+    @printer.setter
+    def printer(self, value):
+        """
+        Set the name of the printer which must print the task
+
+        :param value: name of the printer or None for any printer
+        :raises TaskException: If value is not a string or None
+        """
+        if value is not None and not isinstance(value, str):
+            raise TaskException('printer must be a string or None')
+        self._printer = value
+
+    @property
+    def capabilities(self):
+        """
+        Get the capabilities the printer must have
+
+        :return: frozenset of capability names
+        """
+        return self._capabilities
+
+    @capabilities.setter
+    def capabilities(self, value):
+        """
+        Set the capabilities the printer must have
+
+        :param value: iterable of capability names
+        :raises TaskException: If value is a string or contains something else than strings
+        """
+        if isinstance(value, str) or not all(isinstance(item, str) for item in value):
+            raise TaskException('capabilities must be a collection of strings')
+        self._capabilities = frozenset(value)
+
+    @property
+    def content_hash(self):
+        """
+        Get the SHA-256 of the file content
+
+        :return: hex digest or None when the content was not hashed
+        """
+        return self._content_hash
+
+    @content_hash.setter
+    def content_hash(self, value):
+        """
+        Set the SHA-256 of the file content
+
+        :param value: hex digest or None
+        :raises TaskException: If value is not a string or None
+        """
+        if value is not None and not isinstance(value, str):
+            raise TaskException('content_hash must be a string or None')
+        self._content_hash = value
 
     @property
     def name(self):
@@ -101,6 +197,63 @@ class Task:
             raise TaskException('user must be a string')
         self._username = value
 
+    def to_dict(self):
+        """
+        Return the public representation of the task used by the API
+
+        :return: Dictionary describing the task
+        """
+        return {
+            "id": self.task_id,
+            "name": self.name,
+            "pages": self.pages,
+            "priority": self.priority,
+            "user": self.username,
+            "printer": self.printer
+        }
+
+    def serialize(self):
+        """
+        Return the full representation of the task used for persistence
+
+        :return: Dictionary with every attribute needed to rebuild the task
+        """
+        return {
+            "task_id": self.task_id,
+            "name": self.name,
+            "pages": self.pages,
+            "priority": self.priority,
+            "username": self.username,
+            "file_path": self.file_path,
+            "printer": self.printer,
+            "capabilities": sorted(self.capabilities),
+            "content_hash": self.content_hash
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        """
+        Rebuild a task from the output of serialize()
+
+        :param data: Dictionary created by serialize()
+        :return: Task instance
+        :raises TaskException: If data is missing a field or a field has a wrong type
+        """
+        try:
+            return cls(
+                name=data["name"],
+                pages=data["pages"],
+                priority=data["priority"],
+                username=data["username"],
+                file_path=data.get("file_path"),
+                task_id=data["task_id"],
+                printer=data.get("printer"),
+                capabilities=data.get("capabilities", []),
+                content_hash=data.get("content_hash")
+            )
+        except KeyError as e:
+            raise TaskException(f"missing task field {e}")
+
     def __str__(self):
         """
         Return a string representation of the task
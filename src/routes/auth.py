@@ -1,26 +1,45 @@
-from fastapi import APIRouter, Request, Form, HTTPException, status
+import math
+from fastapi import APIRouter, Request, Form, HTTPException, Depends, status
 from fastapi.responses import JSONResponse
 from datetime import timedelta
-from src.auth.session_manager import load_users, create_session, get_current_user, save_sessions, load_sessions, SESSION_DURATION
+from src.auth.session_manager import authenticate_user_async, create_session, get_current_user, delete_session, get_session_stats, require_auth, SESSION_DURATION
+from src.auth.rate_limiter import RateLimiter
 
 router = APIRouter(prefix="/api", tags=["authentication"])
 
-@router.post("/login")
-async def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    users = load_users()
+ip_limiter = RateLimiter(rate=1.0, burst=20)
+user_limiter = RateLimiter(rate=0.1, burst=5)
+account_limiter = RateLimiter(rate=1.0, burst=30)
 
-    if username not in users:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid username or password"
-        )
+def _too_many_attempts(wait: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts, try again later",
+        headers={"Retry-After": str(math.ceil(wait))}
+    )
 
-    hashed_password = users[username]
+@router.post("/login")
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    """
+    Logs in with token bucket throttling. Every attempt takes a token of the client address, of the username
+    on that address and of the username across all addresses before the password is checked, so concurrent
+    guesses can not pass the limits. A successful login gets the username tokens back.
+    """
+    client = request.client.host if request.client else "unknown"
+    wait = ip_limiter.acquire(client) or user_limiter.acquire((username, client))
+    if wait:
+        raise _too_many_attempts(wait)
+    wait = account_limiter.acquire(username)
+    if wait:
+        user_limiter.refund((username, client))
+        raise _too_many_attempts(wait)
 
-    from src.auth.session_manager import verify_password
-    if not verify_password(password, hashed_password):
+    if not await authenticate_user_async(username, password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
 
+    user_limiter.refund((username, client))
+    account_limiter.refund(username)
+
     token = create_session(username)
 
     response = JSONResponse(content={"message": "Login successful"})
@@ -38,10 +57,7 @@ async def login(request: Request, username: str = Form(...), password: str = For
 async def logout(request: Request):
     token = request.cookies.get("session_token")
     if token:
-        sessions = load_sessions()
-        if token in sessions:
-            del sessions[token]
-            save_sessions(sessions)
+        delete_session(token)
 
     response = JSONResponse(content={"message": "Logged out"})
     response.delete_cookie("session_token")
@@ -52,4 +68,11 @@ async def check_auth(request: Request):
     user = get_current_user(request)
     if user:
         return {"authenticated": True, "username": user}
-    return {"authenticated": False}
\ No newline at end of file
+    return {"authenticated": False}
+
+@router.get("/sessions/stats")
+async def session_stats(current_user: str = Depends(require_auth)):
+    """
+    Returns the session metrics: live sessions, expired sessions removed since start and changes not written yet.
+    """
+    return get_session_stats()
@@ -1,14 +1,58 @@
-from fastapi import APIRouter, Request, Depends
+import asyncio
+import uuid
+from fastapi import APIRouter, Request, Response, Depends, status
+from fastapi.responses import JSONResponse
 from src.auth.session_manager import require_auth
 
 router = APIRouter(prefix="/system-state", tags=["system"])
 
 get_system_state_func = None
+get_state_version_func = None
+publisher = None
+MAX_WAIT = 30.0
+BOOT_ID = uuid.uuid4().hex[:8]
 
-def initialize_system_router(state_func):
-    global get_system_state_func
+def initialize_system_router(state_func, version_func=None, state_publisher=None):
+    global get_system_state_func, get_state_version_func, publisher
     get_system_state_func = state_func
+    get_state_version_func = version_func
+    publisher = state_publisher
+
+def get_etag():
+    """
+    Builds the ETag of the current system state from its version.
+    The boot ID keeps tags of a previous server run from matching.
+
+    :return: quoted ETag, or None when the state is not versioned
+    """
+    if get_state_version_func is None:
+        return None
+    version = get_state_version_func()
+    if None in version:
+        return None
+    return '"' + "-".join([BOOT_ID] + [str(part) for part in version]) + '"'
 
 @router.get("/")
-async def get_system_state(request: Request, current_user: str = Depends(require_auth)):
-    return await get_system_state_func()
\ No newline at end of file
+async def get_system_state(request: Request, wait: float = 0, current_user: str = Depends(require_auth)):
+    """
+    Returns the system state with an ETag. A request with a matching If-None-Match gets 304 Not Modified.
+    With wait (seconds, at most MAX_WAIT) and a matching If-None-Match the request is held until the state changes.
+    """
+    etag = get_etag()
+    if_none_match = request.headers.get("if-none-match")
+
+    if etag is not None and if_none_match == etag and wait > 0 and publisher is not None:
+        deadline = asyncio.get_running_loop().time() + min(wait, MAX_WAIT)
+        while etag == if_none_match:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0 or not await publisher.wait(remaining):
+                break
+            etag = get_etag()
+
+    if etag is not None and if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    state = await get_system_state_func()
+    if etag is None:
+        return state
+    return JSONResponse(state, headers={"ETag": etag})
@@ -1,9 +1,19 @@
+import asyncio
+import hashlib
+import math
 import os
-from fastapi import APIRouter, Request, UploadFile, File, Form, Depends
-from pypdf import PdfReader
+import zipfile
+import zlib
+from typing import List, Optional
+from fastapi import APIRouter, Request, UploadFile, File, Form, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
 
 from src.auth.session_manager import require_auth
-from src.spooler.task_list import TaskList
+from src.spooler.document_cache import DocumentCache, parse_document
+from src.spooler.document_parser import DocumentParserException, DocumentParserUnavailableException
+from src.spooler.upload_store import UploadStore
+from src.spooler.state_publisher import StatePublisher
+from src.spooler.task_list import TaskList, TaskListFullException
 from src.models.task import Task
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
@@ -12,62 +22,383 @@ task_list: TaskList = None
 manager = None
 get_system_state_func = None
 UPLOAD_DIR = "uploaded_files"
+ENQUEUE_TIMEOUT = 0.0
+SECONDS_PER_PAGE = 0.5
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+MAX_BATCH_FILES = 100
+can_route_func = None
+document_cache: DocumentCache = None
+upload_store: UploadStore = None
+publisher: StatePublisher = None
 
-def initialize_task_router(tl: TaskList, conn_manager, state_func, upload_dir: str):
-    global task_list, manager, get_system_state_func, UPLOAD_DIR
+class UploadTooLargeException(Exception):
+    pass
+
+def initialize_task_router(tl: TaskList, conn_manager, state_func, upload_dir: str, enqueue_timeout: float = 0.0,
+                           route_func=None, cache: DocumentCache = None, max_upload_size: int = 50 * 1024 * 1024,
+                           store: UploadStore = None, state_publisher: StatePublisher = None):
+    global task_list, manager, get_system_state_func, UPLOAD_DIR, ENQUEUE_TIMEOUT, can_route_func, document_cache, \
+        MAX_UPLOAD_SIZE, upload_store, publisher
     task_list = tl
     manager = conn_manager
     get_system_state_func = state_func
     UPLOAD_DIR = upload_dir
+    ENQUEUE_TIMEOUT = enqueue_timeout
+    can_route_func = route_func
+    document_cache = cache
+    MAX_UPLOAD_SIZE = max_upload_size
+    upload_store = store or UploadStore(upload_dir)
+    publisher = state_publisher or StatePublisher(conn_manager, state_func)
+
+def estimate_retry_after() -> int:
+    """
+    Estimates in seconds when a queue slot frees up, from the average page count of queued tasks.
+
+    :return: number of seconds for the Retry-After header
+    """
+    queued = len(task_list)
+    if queued == 0:
+        return 1
+    return max(1, math.ceil(task_list.queued_pages / queued * SECONDS_PER_PAGE))
+
+def max_batch_files() -> int:
+    """
+    Number of files accepted in one batch, never more than the queue holds, so a valid batch can always be enqueued.
+
+    :return: maximum number of files of a batch
+    """
+    return min(MAX_BATCH_FILES, task_list.max_size)
 
-def get_page_count(file_stream, filename: str) -> int:
-    filename = filename.lower()
+async def save_upload(file: UploadFile, file_path: str):
+    """
+    Streams the upload to disk in UPLOAD_CHUNK_SIZE chunks, hashing it on the way.
+    Disk writes run in a thread, only one chunk is held in memory.
 
+    :param file: uploaded file
+    :param file_path: destination path
+    :return: tuple (SHA-256 hex digest, number of bytes)
+    :raises UploadTooLargeException: As soon as the upload exceeds MAX_UPLOAD_SIZE, the partial file is removed
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise UploadTooLargeException(f"File is larger than {MAX_UPLOAD_SIZE} bytes")
+
+    digest = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(open, file_path, "wb")
     try:
-        if filename.endswith('.pdf'):
-            reader = PdfReader(file_stream)
-            return len(reader.pages)
-        else:
-            return 1
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise UploadTooLargeException(f"File is larger than {MAX_UPLOAD_SIZE} bytes")
+            digest.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, file_path)
+        raise
+    await asyncio.to_thread(f.close)
+    return digest.hexdigest(), size
 
-    except Exception as e:
-        print(f"Error reading file {filename}: {e}. Defaulting to 1 page.")
-        return 1
+def analyze_document(file_path: str, filename: str, content_hash: str):
+    """
+    Parses the uploaded document once, the printer reuses the result from the DocumentCache.
+    Blocks until the parser processes are done, call it outside of the event loop.
+
+    :param file_path: path of the stored upload
+    :param filename: original file name
+    :param content_hash: SHA-256 of the file content
+    :return: DocumentArtifact with the page count, text and language
+    """
+    if document_cache:
+        return document_cache.get_or_parse(file_path, filename, content_hash)
+    return parse_document(file_path, filename, content_hash)
+
+def _unpack_zip(zip_path: str, archive_name: str) -> list:
+    """
+    Stores every file of a zip archive in the upload store, runs in a thread.
+    Members are copied in UPLOAD_CHUNK_SIZE chunks and hashed on the way, like uploads.
+
+    :param zip_path: path of the received archive
+    :param archive_name: original name of the archive, used in errors
+    :return: list of received entries, {"file", "file_path", "content_hash"} or {"file", "error"},
+        unpacking stops after one file more than max_batch_files
+    """
+    entries = []
+    limit = max_batch_files()
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                if len(entries) > limit:
+                    break
+
+                temp_path = upload_store.temp_path()
+                digest = hashlib.sha256()
+                size = 0
+                try:
+                    with archive.open(info) as source, open(temp_path, "wb") as target:
+                        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > MAX_UPLOAD_SIZE:
+                                break
+                            digest.update(chunk)
+                            target.write(chunk)
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error, EOFError) as e:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    entries.append({"file": name, "error": f"Could not unpack file: {e}"})
+                    continue
+                if size > MAX_UPLOAD_SIZE:
+                    os.remove(temp_path)
+                    entries.append({"file": name, "error": f"File is larger than {MAX_UPLOAD_SIZE} bytes"})
+                    continue
+
+                content_hash = digest.hexdigest()
+                file_path = upload_store.store(temp_path, content_hash, name)
+                entries.append({"file": name, "file_path": file_path, "content_hash": content_hash})
+    except zipfile.BadZipFile:
+        entries.append({"file": archive_name, "error": "Not a valid zip archive"})
+    except Exception:
+        _release_entries(entries)
+        raise
+    finally:
+        os.remove(zip_path)
+    return entries
+
+def _release_entries(entries: list):
+    """
+    Releases the stored files of received batch entries
+
+    :param entries: received entries, entries with "file_path" or "task" hold a reference in the upload store
+    """
+    for entry in entries:
+        file_path = entry.pop("file_path", None)
+        task = entry.pop("task", None)
+        if task is not None:
+            file_path = task.file_path
+        if file_path:
+            upload_store.release(file_path)
+
+async def _receive_file(file: UploadFile) -> list:
+    """
+    Receives one file of a batch into the upload store, zip archives are unpacked
+
+    :param file: uploaded file
+    :return: list of received entries, {"file", "file_path", "content_hash"} or {"file", "error"}
+    """
+    temp_path = upload_store.temp_path()
+    try:
+        content_hash, size = await save_upload(file, temp_path)
+    except UploadTooLargeException as e:
+        return [{"file": file.filename, "error": str(e)}]
+
+    if file.filename.lower().endswith(".zip"):
+        return await asyncio.to_thread(_unpack_zip, temp_path, file.filename)
+
+    file_path = await asyncio.to_thread(upload_store.store, temp_path, content_hash, file.filename)
+    return [{"file": file.filename, "file_path": file_path, "content_hash": content_hash}]
+
+async def _build_task(filename: str, file_path: str, content_hash: str, username: str, priority: int,
+                      printer: Optional[str], capabilities: Optional[str]) -> Task:
+    """
+    Parses the stored upload and creates its task
+
+    :param filename: original file name
+    :param file_path: path in the upload store
+    :param content_hash: SHA-256 of the file content
+    :param username: user who submitted the task
+    :param priority: priority of the task
+    :param printer: name of the printer which must print the task, empty for any printer
+    :param capabilities: comma separated capabilities the printer must have
+    :return: Task instance
+    :raises DocumentParserException: If the document could not be parsed
+    """
+    document = await asyncio.to_thread(analyze_document, file_path, filename, content_hash)
+    print(f"Pages counted: {document.pages}")
+
+    return Task(
+        name=filename,
+        pages=document.pages,
+        priority=priority,
+        username=username,
+        file_path=file_path,
+        content_hash=content_hash,
+        printer=printer or None,
+        capabilities=[item.strip() for item in (capabilities or "").split(",") if item.strip()]
+    )
 
 @router.post("/")
-async def create_task(request: Request,username: str = Form(...),priority: int = Form(...),file: UploadFile = File(...),current_user: str = Depends(require_auth)):
+async def create_task(request: Request,username: str = Form(...),priority: int = Form(...),file: UploadFile = File(...),
+                      printer: Optional[str] = Form(None),capabilities: Optional[str] = Form(None),current_user: str = Depends(require_auth)):
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-
-        base_name, extension = os.path.splitext(file.filename)
-        counter = 1
-        while os.path.exists(file_path):
-            file_path = os.path.join(UPLOAD_DIR, f"{base_name}_{counter}{extension}")
-            counter += 1
-
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        file.file.seek(0)
-        pages = get_page_count(file.file, file.filename)
-        print(f"Pages counted: {pages}")
-
-        new_task = Task(
-            name=file.filename,
-            pages=pages,
-            priority=priority,
-            username=username,
-            file_path=file_path
-        )
+        temp_path = upload_store.temp_path()
+        try:
+            content_hash, size = await save_upload(file, temp_path)
+        except UploadTooLargeException as e:
+            return JSONResponse(
+                status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                content={"error": str(e)}
+            )
+        file_path = await asyncio.to_thread(upload_store.store, temp_path, content_hash, file.filename)
+        print(f"Upload saved: {file_path} ({size} bytes)")
 
-        task_list.append(new_task)
+        try:
+            new_task = await _build_task(file.filename, file_path, content_hash, username, priority, printer,
+                                         capabilities)
+        except DocumentParserUnavailableException as e:
+            upload_store.release(file_path)
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"error": f"Document could not be processed now, try again later: {e}"},
+                headers={"Retry-After": "5"}
+            )
+        except DocumentParserException as e:
+            upload_store.release(file_path)
+            return JSONResponse(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                content={"error": f"Document could not be processed: {e}"}
+            )
 
-        await manager.broadcast(f"NEW: New task added {new_task.name} by {new_task.username}")
-        state = await get_system_state_func()
-        await manager.broadcast_json({"type": "system_state", "data": state})
+        if can_route_func and not can_route_func(new_task):
+            upload_store.release(file_path)
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"error": "No printer can print this task, check printer name and capabilities."}
+            )
 
-        return {"message": "Task successfully added.", "task_id": new_task.name}
+        try:
+            await task_list.async_append(new_task, timeout=ENQUEUE_TIMEOUT)
+        except TaskListFullException:
+            upload_store.release(file_path)
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"error": "Print queue is full, try again later."},
+                headers={"Retry-After": str(estimate_retry_after())}
+            )
+
+        await publisher.publish(f"NEW: New task added {new_task.name} by {new_task.username}")
+
+        return {"message": "Task successfully added.", "task_id": new_task.task_id}
 
     except Exception as e:
-        return {"error": f"Error adding task: {e}"}
\ No newline at end of file
+        return {"error": f"Error adding task: {e}"}
+
+@router.post("/batch")
+async def create_tasks(username: str = Form(...), priority: int = Form(...), files: List[UploadFile] = File(...),
+                       printer: Optional[str] = Form(None), capabilities: Optional[str] = Form(None),
+                       current_user: str = Depends(require_auth)):
+    """
+    Adds many files (or zip archives of files) in one request.
+    Files are received and parsed concurrently, the accepted tasks are enqueued all at once
+    and clients get one broadcast. The response has a result for every file, in order.
+    """
+    results = await asyncio.gather(*(_receive_file(file) for file in files), return_exceptions=True)
+    received = []
+    for file, entries in zip(files, results):
+        if isinstance(entries, Exception):
+            received.append({"file": file.filename, "error": f"Could not receive file: {entries}"})
+        else:
+            received.extend(entries)
+
+    try:
+        return await _add_received(received, username, priority, printer, capabilities)
+    except Exception:
+        _release_entries(received)
+        raise
+
+async def _add_received(received: list, username: str, priority: int, printer: Optional[str],
+                        capabilities: Optional[str]):
+    """
+    Builds and enqueues the tasks of the received batch entries
+
+    :param received: received entries of create_tasks, changed in place into the results
+    :return: response of create_tasks
+    """
+    stored = [entry for entry in received if "file_path" in entry]
+    limit = max_batch_files()
+    if len(stored) > limit:
+        error = f"Batch has more than {limit} files, send at most {limit} files in one request."
+        for entry in stored:
+            upload_store.release(entry.pop("file_path"))
+            del entry["content_hash"]
+            entry["error"] = error
+        return JSONResponse(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            content={"error": error, "results": received}
+        )
+
+    built = await asyncio.gather(*(_build_task(entry["file"], entry["file_path"], entry["content_hash"], username,
+                                               priority, printer, capabilities) for entry in stored),
+                                 return_exceptions=True)
+
+    new_tasks = []
+    for entry, task in zip(stored, built):
+        file_path = entry.pop("file_path")
+        del entry["content_hash"]
+        if isinstance(task, DocumentParserUnavailableException):
+            upload_store.release(file_path)
+            entry["error"] = f"Document could not be processed now, try again later: {task}"
+        elif isinstance(task, Exception):
+            upload_store.release(file_path)
+            entry["error"] = f"Document could not be processed: {task}"
+        elif can_route_func and not can_route_func(task):
+            upload_store.release(file_path)
+            entry["error"] = "No printer can print this task, check printer name and capabilities."
+        else:
+            entry["task"] = task
+            new_tasks.append(task)
+
+    if new_tasks:
+        try:
+            await task_list.async_extend(new_tasks, timeout=ENQUEUE_TIMEOUT)
+        except TaskListFullException:
+            for entry in received:
+                task = entry.pop("task", None)
+                if task:
+                    upload_store.release(task.file_path)
+                    entry["error"] = "Print queue is full, try again later."
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"error": "Print queue is full, try again later.", "results": received},
+                headers={"Retry-After": str(estimate_retry_after())}
+            )
+
+    for entry in received:
+        task = entry.pop("task", None)
+        if task:
+            entry["task_id"] = task.task_id
+
+    if new_tasks:
+        await publisher.publish(f"NEW: {len(new_tasks)} new tasks added by {username}")
+    return {"message": f"{len(new_tasks)} of {len(received)} tasks added.", "results": received}
+
+@router.get("/{task_id}")
+async def get_task(task_id: str, current_user: str = Depends(require_auth)):
+    task = task_list.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found in queue")
+    return task.to_dict()
+
+@router.delete("/{task_id}")
+async def cancel_task(task_id: str, current_user: str = Depends(require_auth)):
+    task = task_list.cancel(task_id)
+    if task is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found in queue")
+
+    if task.file_path:
+        upload_store.release(task.file_path)
+
+    await publisher.publish(f"CANCEL: Task {task.name} by {task.username} was cancelled by {current_user}")
+    return {"message": "Task cancelled.", "task": task.to_dict()}
+
+@router.patch("/{task_id}")
+async def reprioritize_task(task_id: str, priority: int = Form(...), current_user: str = Depends(require_auth)):
+    task = task_list.reprioritize(task_id, priority)
+    if task is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found in queue")
+
+    await publisher.publish()
+    return {"message": "Task priority changed.", "task": task.to_dict()}
\ No newline at end of file
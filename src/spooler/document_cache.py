@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from pypdf import PdfReader
+
+
+def detect_language(text):
+    """
+    Detect invoice language
+
+    :param text: extracted text of the document
+    :return: 'cs', 'en' or 'unknown'
+    """
+    text_lower = text.lower()
+    if any(word in text_lower for word in ['faktura', 'dodavatel', 'odběratel', 'celkem', 'částka']):
+        return 'cs'
+    elif any(word in text_lower for word in ['invoice', 'bill', 'receipt', 'total', 'amount', 'customer', 'vendor']):
+        return 'en'
+    else:
+        return 'unknown'
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 of a file
+
+    :param file_path: path of the file
+    :param chunk_size: number of bytes read at once
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentArtifact:
+    def __init__(self, content_hash, pages, text=None, language='unknown'):
+        """
+        Result of parsing a document once: page count, extracted text and detected language
+
+        :param content_hash: SHA-256 of the file content
+        :param pages: number of pages
+        :param text: extracted text or None when the document has no text (or is not a PDF)
+        :param language: detected invoice language
+        """
+        self.content_hash = content_hash
+        self.pages = pages
+        self.text = text
+        self.language = language
+
+    @property
+    def size(self):
+        """
+        Approximate memory used by the artifact
+
+        :return: number of bytes
+        """
+        return len(self.text or "") + 128
+
+    def serialize(self):
+        return {"content_hash": self.content_hash, "pages": self.pages, "text": self.text, "language": self.language}
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(data["content_hash"], data["pages"], data.get("text"), data.get("language", 'unknown'))
+
+
+def parse_document(file_path, filename, content_hash):
+    """
+    Parses the document once, reading the page count and the text of every page
+
+    :param file_path: path of the uploaded file
+    :param filename: original file name, decides the file type
+    :param content_hash: SHA-256 of the file content
+    :return: DocumentArtifact
+    """
+    if not filename.lower().endswith('.pdf'):
+        return DocumentArtifact(content_hash, 1)
+
+    try:
+        reader = PdfReader(file_path)
+        pages = len(reader.pages)
+    except Exception as e:
+        print(f"Error reading file {filename}: {e}. Defaulting to 1 page.")
+        return DocumentArtifact(content_hash, 1)
+
+    text = ""
+    try:
+        for page in reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text + "\n"
+    except Exception as e:
+        print(f"Text extraction failed for {filename}: {e}")
+        return DocumentArtifact(content_hash, pages)
+
+    return DocumentArtifact(content_hash, pages, text, detect_language(text))
+
+
+class DocumentCache:
+    def __init__(self, directory, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024,
+                 parser=None):
+        """
+        Two level cache of DocumentArtifacts keyed by content hash.
+        Memory is an LRU bounded by the size of the extracted text, evicted artifacts stay on disk
+        as JSON files, and the disk is bounded too, evicting the least recently used files.
+
+        :param directory: directory of the disk level
+        :param max_memory_bytes: memory limit of the cached artifacts
+        :param max_disk_bytes: disk limit of the cached artifacts
+        :param parser: DocumentParser used on a miss, documents are parsed in this process when None
+        """
+        self.directory = directory
+        self.parser = parser
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, content_hash, size in sorted(entries):
+            self.disk[content_hash] = size
+            self.disk_bytes += size
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, f"{content_hash}.json")
+
+    def get(self, content_hash):
+        """
+        Returns the cached artifact
+
+        :param content_hash: SHA-256 of the file content
+        :return: DocumentArtifact or None
+        """
+        with self.lock:
+            on_disk = content_hash in self.disk
+            if on_disk:
+                self.disk.move_to_end(content_hash)
+            artifact = self.memory.get(content_hash)
+            if artifact is not None:
+                self.memory.move_to_end(content_hash)
+                return artifact
+
+        if not on_disk:
+            return None
+        try:
+            with open(self._path(content_hash), 'r') as f:
+                artifact = DocumentArtifact.deserialize(json.load(f))
+            os.utime(self._path(content_hash))
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.disk_bytes -= self.disk.pop(content_hash, 0)
+            return None
+
+        self._remember(artifact)
+        return artifact
+
+    def put(self, artifact):
+        """
+        Stores the artifact in memory and on disk
+
+        :param artifact: DocumentArtifact
+        """
+        data = json.dumps(artifact.serialize())
+        path = self._path(artifact.content_hash)
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not store document artifact: {e}")
+        else:
+            evicted = []
+            with self.lock:
+                self.disk_bytes -= self.disk.pop(artifact.content_hash, 0)
+                self.disk[artifact.content_hash] = len(data)
+                self.disk_bytes += len(data)
+                while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                    content_hash, size = self.disk.popitem(last=False)
+                    self.disk_bytes -= size
+                    evicted.append(content_hash)
+            for content_hash in evicted:
+                try:
+                    os.remove(self._path(content_hash))
+                except OSError:
+                    pass
+
+        self._remember(artifact)
+
+    def get_or_parse(self, file_path, filename, content_hash=None):
+        """
+        Returns the cached artifact of the file or parses it and caches the result
+
+        :param file_path: path of the file
+        :param filename: original file name, decides the file type
+        :param content_hash: SHA-256 of the file content, computed when None
+        :return: DocumentArtifact
+        :raises DocumentParserException: If the parser gave up on the document, nothing is cached then
+        """
+        if content_hash is None:
+            content_hash = hash_file(file_path)
+        artifact = self.get(content_hash)
+        if artifact is None:
+            if self.parser:
+                artifact = self.parser.parse(file_path, filename, content_hash)
+            else:
+                artifact = parse_document(file_path, filename, content_hash)
+            self.put(artifact)
+        return artifact
+
+    def _remember(self, artifact):
+        """
+        Puts the artifact in the memory LRU and evicts the least recently used ones
+
+        :param artifact: DocumentArtifact
+        """
+        with self.lock:
+            previous = self.memory.pop(artifact.content_hash, None)
+            if previous is not None:
+                self.memory_bytes -= previous.size
+            self.memory[artifact.content_hash] = artifact
+            self.memory_bytes += artifact.size
+            while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= evicted.size
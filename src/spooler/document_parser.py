@@ -0,0 +1,223 @@
+import math
+import os
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import Pool
+
+from pypdf import PdfReader
+
+from src.spooler.document_cache import DocumentArtifact, detect_language
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class DocumentParserException(Exception):
+    pass
+
+
+class DocumentParserUnavailableException(DocumentParserException):
+    """
+    The document was not parsed because the parser stopped, the upload can be retried
+    """
+    pass
+
+
+def _limit_memory(memory_limit):
+    """
+    Initializer of the worker processes, limits their address space (Unix only)
+
+    :param memory_limit: maximum number of bytes, None for no limit
+    """
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _count_pages(file_path):
+    """
+    Runs in a worker process
+
+    :param file_path: path of the PDF
+    :return: number of pages
+    """
+    return len(PdfReader(file_path).pages)
+
+
+def _extract_pages(file_path, start, end):
+    """
+    Runs in a worker process, extracts the text of pages start..end-1
+
+    :param file_path: path of the PDF
+    :param start: index of the first page
+    :param end: index after the last page
+    :return: extracted text
+    """
+    reader = PdfReader(file_path)
+    text = ""
+    for index in range(start, min(end, len(reader.pages))):
+        page_text = reader.pages[index].extract_text()
+        if page_text:
+            text += page_text + "\n"
+    return text
+
+
+class DocumentParser:
+    def __init__(self, workers=None, timeout=30.0, memory_limit=512 * 1024 * 1024, chunk_pages=16):
+        """
+        Parses PDFs in worker processes, so large or malformed documents do not block the server.
+
+        The workers are long-lived single-process pools shared by all documents and started on first use.
+        A document waits for one free worker to count its pages, then takes at most one more idle worker
+        per chunk of chunk_pages pages, so long documents are extracted page-parallel while short ones
+        leave the other workers to concurrent uploads.
+        The timeout runs from the moment the document got its first worker, so waiting behind other documents
+        does not count. Only the workers of a document over the timeout or the memory limit are restarted.
+
+        :param workers: total number of worker processes, number of CPUs when None
+        :param timeout: seconds one document may take
+        :param memory_limit: address space limit of a worker in bytes (RLIMIT_AS), None for no limit
+        :param chunk_pages: number of pages extracted by one worker
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.chunk_pages = chunk_pages
+        self.slots = threading.Semaphore(self.workers)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.busy = set()
+        self.closed = False
+
+    def _take_worker(self, blocking=True):
+        """
+        Takes a free worker, starts a new one when no idle worker is left
+
+        :param blocking: wait until a worker is free
+        :return: worker Pool, None when not blocking and every worker is busy
+        :raises DocumentParserUnavailableException: If the parser was closed
+        """
+        if not self.slots.acquire(blocking=blocking):
+            return None
+        with self.lock:
+            if self.closed:
+                self.slots.release()
+                raise DocumentParserUnavailableException("Document parser is closed")
+            worker = self.idle.pop() if self.idle else Pool(1, initializer=_limit_memory,
+                                                           initargs=(self.memory_limit,))
+            self.busy.add(worker)
+            return worker
+
+    def _release_workers(self, workers, restart=False):
+        """
+        Gives the workers of a document back
+
+        :param workers: worker Pools taken by the document
+        :param restart: terminate the workers, used for a stuck or crashed document, new ones are started when needed
+        """
+        with self.lock:
+            for worker in workers:
+                self.busy.discard(worker)
+            keep = not (restart or self.closed)
+            if keep:
+                self.idle.extend(workers)
+        if not keep:
+            for worker in workers:
+                worker.terminate()
+        for _ in workers:
+            self.slots.release()
+
+    def parse(self, file_path, filename, content_hash):
+        """
+        Parses the document in worker processes, same result as parse_document
+
+        :param file_path: path of the uploaded file
+        :param filename: original file name, decides the file type
+        :param content_hash: SHA-256 of the file content
+        :return: DocumentArtifact
+        :raises DocumentParserException: If the document timed out or exceeded the memory limit
+        :raises DocumentParserUnavailableException: If the parser was closed meanwhile
+        """
+        if not filename.lower().endswith('.pdf'):
+            return DocumentArtifact(content_hash, 1)
+
+        workers = [self._take_worker()]
+        deadline = time.monotonic() + self.timeout
+        restart = False
+        try:
+            return self._parse(workers, deadline, file_path, filename, content_hash)
+        except TimeoutError:
+            restart = True
+            raise DocumentParserException(f"Parsing {filename} took longer than {self.timeout} seconds")
+        except MemoryError as e:
+            restart = True
+            raise DocumentParserException(f"Parsing {filename} exceeded the worker limits: {e}")
+        finally:
+            self._release_workers(workers, restart)
+
+    def _result(self, result, deadline):
+        """
+        Waits for the result of a job until the deadline or until the parser is closed
+
+        :param result: AsyncResult of the job
+        :param deadline: time.monotonic() when the document must be parsed
+        :return: value returned by the job
+        :raises TimeoutError: If the deadline passed
+        :raises DocumentParserUnavailableException: If the parser was closed meanwhile
+        """
+        while not result.ready():
+            if self.closed:
+                raise DocumentParserUnavailableException("Document parser is closed")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError()
+            result.wait(min(remaining, 0.1))
+        return result.get()
+
+    def _parse(self, workers, deadline, file_path, filename, content_hash):
+        """
+        Counts the pages on the first worker, then extracts the text on up to one worker per chunk
+
+        :param workers: worker Pools of the document, extra workers are appended
+        :raises TimeoutError: If the deadline passed
+        :raises MemoryError: If a worker exceeded the memory limit
+        """
+        try:
+            pages = self._result(workers[0].apply_async(_count_pages, (file_path,)), deadline)
+        except (TimeoutError, MemoryError, DocumentParserUnavailableException):
+            raise
+        except Exception as e:
+            print(f"Error reading file {filename}: {e}. Defaulting to 1 page.")
+            return DocumentArtifact(content_hash, 1)
+
+        starts = range(0, pages, self.chunk_pages)
+        while len(workers) < min(math.ceil(pages / self.chunk_pages), self.workers):
+            worker = self._take_worker(blocking=False)
+            if worker is None:
+                break
+            workers.append(worker)
+
+        results = [workers[number % len(workers)].apply_async(_extract_pages, (file_path, start,
+                                                                              start + self.chunk_pages))
+                   for number, start in enumerate(starts)]
+        try:
+            text = "".join(self._result(result, deadline) for result in results)
+        except (TimeoutError, MemoryError, DocumentParserUnavailableException):
+            raise
+        except Exception as e:
+            print(f"Text extraction failed for {filename}: {e}")
+            return DocumentArtifact(content_hash, pages)
+
+        return DocumentArtifact(content_hash, pages, text, detect_language(text))
+
+    def close(self):
+        """
+        Stops the worker processes, documents being parsed fail with DocumentParserUnavailableException
+        """
+        with self.lock:
+            self.closed = True
+            workers, self.idle = self.idle + list(self.busy), []
+        for worker in workers:
+            worker.terminate()
@@ -0,0 +1,270 @@
+import heapq
+import itertools
+
+
+class Node:
+    def __init__(self, task, key):
+        """
+        Defines the single task in the LinkedListEngine
+
+        :param task: Task instance stored in this node
+        :param key: ordering key given by the scheduling policy
+        """
+        self.task = task
+        self.key = key
+        self.prev = None
+        self.next = None
+
+
+class LinkedListEngine:
+    def __init__(self):
+        """
+        Doubly linked list storage ordered by the policy key.
+        Insert walks the list from head (O(n)), pop takes the head (O(1)).
+        The index maps task_id to its node, so lookup and removal are O(1).
+        """
+        self.head = None
+        self.tail = None
+        self.size = 0
+        self.index = {}
+
+    def insert(self, task, key):
+        """
+        Insert the task after every task with the same or lower key
+
+        :param task: Task instance to insert
+        :param key: ordering key given by the scheduling policy
+        """
+        new_node = Node(task, key)
+
+        if self.head is None:
+            self.head = new_node
+            self.tail = new_node
+        else:
+            current = self.head
+            prev = None
+
+            while current and key >= current.key:
+                prev = current
+                current = current.next
+
+            if prev is None:
+                new_node.next = self.head
+                self.head.prev = new_node
+                self.head = new_node
+            else:
+                new_node.next = current
+                new_node.prev = prev
+                prev.next = new_node
+                if current:
+                    current.prev = new_node
+                else:
+                    self.tail = new_node
+
+        self.index[task.task_id] = new_node
+        self.size += 1
+
+    def pop(self):
+        """
+        Remove and return the first task
+
+        :return: the first task in the list
+        """
+        node = self.head
+        self._unlink(node)
+        return node.task
+
+    def find_first(self, match):
+        """
+        Return the first task accepted by match without removing it
+
+        :param match: function task -> bool
+        :return: the first matching task or None
+        """
+        current = self.head
+        while current is not None:
+            if match(current.task):
+                return current.task
+            current = current.next
+        return None
+
+    def get(self, task_id):
+        """
+        Return the queued task with the given ID
+
+        :param task_id: ID of the task
+        :return: the task or None if it is not queued
+        """
+        node = self.index.get(task_id)
+        return node.task if node else None
+
+    def remove(self, task_id):
+        """
+        Remove the task with the given ID
+
+        :param task_id: ID of the task
+        :return: the removed task or None if it is not queued
+        """
+        node = self.index.get(task_id)
+        if node is None:
+            return None
+        self._unlink(node)
+        return node.task
+
+    def _unlink(self, node):
+        """
+        Unlink the node from the list and the index
+
+        :param node: Node to unlink
+        """
+        if node.prev:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+
+        node.prev = None
+        node.next = None
+        del self.index[node.task.task_id]
+        self.size -= 1
+
+    def tasks(self):
+        """
+        Return the tasks in queue order
+
+        :return: list of tasks
+        """
+        tasks = []
+        current = self.head
+        while current is not None:
+            tasks.append(current.task)
+            current = current.next
+        return tasks
+
+    def clear(self):
+        """
+        Remove all tasks
+        """
+        self.head = None
+        self.tail = None
+        self.size = 0
+        self.index = {}
+
+    def __len__(self):
+        return self.size
+
+
+class HeapEngine:
+    def __init__(self):
+        """
+        Binary heap storage ordered by the policy key.
+        Insert and pop are O(log n). A sequence number keeps FIFO order within the same key.
+        Removed entries are only marked and skipped on pop (lazy deletion), so removal is O(1).
+        """
+        self.heap = []
+        self.counter = itertools.count()
+        self.index = {}
+
+    def insert(self, task, key):
+        """
+        Push the task onto the heap
+
+        :param task: Task instance to insert
+        :param key: ordering key given by the scheduling policy
+        """
+        entry = [key, next(self.counter), task]
+        self.index[task.task_id] = entry
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        """
+        Remove and return the task with the lowest key
+
+        :return: the first task in the heap
+        """
+        while True:
+            task = heapq.heappop(self.heap)[2]
+            if task is not None:
+                del self.index[task.task_id]
+                return task
+
+    def find_first(self, match):
+        """
+        Return the first task accepted by match without removing it.
+        Walks the heap in key order from the top, expanding only the children of checked entries,
+        so finding the k-th task costs O(k log k) instead of sorting the whole heap.
+
+        :param match: function task -> bool
+        :return: the first matching task or None
+        """
+        while self.heap and self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+
+        frontier = [(self.heap[0][0], self.heap[0][1], 0)]
+        while frontier:
+            position = heapq.heappop(frontier)[2]
+            task = self.heap[position][2]
+            if task is not None and match(task):
+                return task
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(self.heap):
+                    entry = self.heap[child]
+                    heapq.heappush(frontier, (entry[0], entry[1], child))
+        return None
+
+    def get(self, task_id):
+        """
+        Return the queued task with the given ID
+
+        :param task_id: ID of the task
+        :return: the task or None if it is not queued
+        """
+        entry = self.index.get(task_id)
+        return entry[2] if entry else None
+
+    def remove(self, task_id):
+        """
+        Remove the task with the given ID
+
+        :param task_id: ID of the task
+        :return: the removed task or None if it is not queued
+        """
+        entry = self.index.pop(task_id, None)
+        if entry is None:
+            return None
+        task = entry[2]
+        entry[2] = None
+
+        if len(self.heap) > 2 * len(self.index) + 16:
+            self.heap = [entry for entry in self.heap if entry[2] is not None]
+            heapq.heapify(self.heap)
+        return task
+
+    def tasks(self):
+        """
+        Return the tasks in queue order
+
+        :return: list of tasks
+        """
+        return [entry[2] for entry in sorted(self.index.values())]
+
+    def clear(self):
+        """
+        Remove all tasks
+        """
+        self.heap = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+
+ENGINES = {
+    "linked": LinkedListEngine,
+    "heap": HeapEngine,
+}
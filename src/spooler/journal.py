@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+
+from src.models.task import Task, TaskException
+
+
+class TaskJournalException(Exception):
+    pass
+
+
+class TaskJournal:
+    JOURNAL_FILE = "journal.log"
+    SNAPSHOT_FILE = "snapshot.json"
+
+    def __init__(self, directory, flush_interval=0.05, max_batch=512, compact_every=10000):
+        """
+        Append-only write-ahead log of the print queue.
+
+        Records are buffered in memory and written by a background thread, which appends the
+        whole batch and fsyncs once (group commit), so producers never wait for the disk.
+        The journal also keeps a mirror of the live tasks, and once compact_every records were
+        written the mirror is saved as a snapshot and the journal is truncated.
+
+        :param directory: directory holding the journal and the snapshot
+        :param flush_interval: maximum number of seconds a record waits in the buffer
+        :param max_batch: number of buffered records that triggers an immediate flush
+        :param compact_every: number of journal records after which a snapshot is written
+        """
+        self.directory = directory
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compact_every = compact_every
+
+        self.lock = threading.Lock()
+        self.has_records = threading.Condition(self.lock)
+        self.buffer = []
+        self.live = {}
+        self.records_since_snapshot = 0
+        self.running = False
+        self.thread = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def record_enqueue(self, task):
+        """
+        Record that a task was added to the queue
+
+        :param task: Task instance added to the queue
+        """
+        self._record({"op": "enqueue", "task": task.serialize()})
+
+    def record_dequeue(self, task):
+        """
+        Record that a task left the queue to be printed, it is restored until completed
+
+        :param task: Task instance taken by the printer
+        """
+        self._record({"op": "dequeue", "id": task.task_id})
+
+    def record_reprioritize(self, task):
+        """
+        Record a priority change of a queued task
+
+        :param task: Task instance with the new priority
+        """
+        self._record({"op": "reprioritize", "id": task.task_id, "priority": task.priority})
+
+    def record_cancel(self, task):
+        """
+        Record that a task was removed from the queue without printing
+
+        :param task: Task instance removed from the queue
+        """
+        self._record({"op": "cancel", "id": task.task_id})
+
+    def record_complete(self, task):
+        """
+        Record that a task finished printing
+
+        :param task: Task instance which was printed
+        """
+        self._record({"op": "complete", "id": task.task_id})
+
+    def record_clear(self):
+        """
+        Record that the whole queue was cleared
+        """
+        self._record({"op": "clear"})
+
+    def _record(self, record):
+        """
+        Apply the record to the live mirror and buffer it for the flusher thread
+
+        :param record: dictionary describing the event
+        """
+        with self.lock:
+            self._apply(self.live, record)
+            self.buffer.append(record)
+            if len(self.buffer) >= self.max_batch:
+                self.has_records.notify()
+
+    @staticmethod
+    def _apply(live, record):
+        """
+        Apply one journal record to a dictionary task_id -> serialized task
+
+        :param live: dictionary of live tasks in enqueue order
+        :param record: dictionary describing the event
+        """
+        op = record.get("op")
+        if op == "enqueue":
+            live[record["task"]["task_id"]] = record["task"]
+        elif op == "reprioritize":
+            if record["id"] in live:
+                live[record["id"]] = dict(live[record["id"]], priority=record["priority"])
+        elif op in ("cancel", "complete"):
+            live.pop(record["id"], None)
+        elif op == "clear":
+            live.clear()
+
+    def replay(self):
+        """
+        Read the snapshot and the journal and return the tasks which were queued or printing.
+        The result is compacted into a new snapshot right away.
+
+        :return: list of Task instances in enqueue order
+        """
+        live = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    for data in json.load(f)["tasks"]:
+                        live[data["task_id"]] = data
+            except (ValueError, KeyError) as e:
+                raise TaskJournalException(f"Corrupted snapshot {self.snapshot_path}: {e}")
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        self._apply(live, json.loads(line))
+                    except ValueError:
+                        print(f"Skipping torn journal record: {line[:80]!r}")
+
+        tasks = []
+        for data in live.values():
+            try:
+                task = Task.deserialize(data)
+            except TaskException as e:
+                print(f"Skipping invalid journal task: {e}")
+                continue
+            if task.file_path and not os.path.exists(task.file_path):
+                print(f"Skipping journal task {task.name}, file {task.file_path} is missing")
+                continue
+            tasks.append(task)
+
+        with self.lock:
+            self.live = {task.task_id: task.serialize() for task in tasks}
+            self.buffer = []
+            snapshot = list(self.live.values())
+        self._write_snapshot(snapshot)
+
+        print(f"Journal replayed: {len(tasks)} tasks restored")
+        return tasks
+
+    def start(self):
+        """
+        Start the background flusher thread
+        """
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="TaskJournal", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop the flusher thread after writing every buffered record
+        """
+        with self.lock:
+            self.running = False
+            self.has_records.notify()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to disk, or write a snapshot when the journal is long enough
+        """
+        with self.lock:
+            records = self.buffer
+            self.buffer = []
+            snapshot = None
+            if self.records_since_snapshot + len(records) >= self.compact_every:
+                snapshot = list(self.live.values())
+                self.records_since_snapshot = 0
+            else:
+                self.records_since_snapshot += len(records)
+
+        try:
+            if snapshot is not None:
+                self._write_snapshot(snapshot)
+            elif records:
+                with open(self.journal_path, 'a') as f:
+                    f.write("".join(json.dumps(record) + "\n" for record in records))
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError:
+            with self.lock:
+                self.buffer[:0] = records
+            raise
+
+    def _write_snapshot(self, tasks):
+        """
+        Atomically replace the snapshot and truncate the journal
+
+        :param tasks: list of serialized tasks
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"tasks": tasks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        with open(self.journal_path, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _run(self):
+        """
+        Main loop of the flusher thread
+        """
+        while True:
+            with self.lock:
+                if self.running and len(self.buffer) < self.max_batch:
+                    self.has_records.wait(self.flush_interval)
+                running = self.running
+
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error writing journal: {e}")
+
+            if not running:
+                break
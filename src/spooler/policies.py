@@ -0,0 +1,165 @@
+import time
+
+
+class SchedulingPolicyException(Exception):
+    pass
+
+
+class SchedulingPolicy:
+    """
+    Decides the order of tasks in the TaskList.
+
+    The policy turns a task into an ordering key when it is enqueued, the queue engine keeps
+    the tasks sorted by that key (FIFO for equal keys). All methods are called with the
+    TaskList lock held, so policies do not need their own locking.
+    """
+    name = "base"
+
+    def key(self, task):
+        """
+        Return the ordering key of a newly enqueued task, lower key is printed sooner
+
+        :param task: Task instance being enqueued
+        :return: comparable key
+        """
+        raise NotImplementedError
+
+    def rekey(self, task):
+        """
+        Return the new ordering key of a queued task whose priority changed
+
+        :param task: Task instance with the new priority
+        :return: comparable key
+        """
+        return self.key(task)
+
+    def on_pop(self, task):
+        """
+        Called when the task leaves the queue to be printed
+
+        :param task: Task instance leaving the queue
+        """
+
+    def on_remove(self, task):
+        """
+        Called when the task is cancelled before being printed
+
+        :param task: Task instance removed from the queue
+        """
+
+    def clear(self):
+        """
+        Called when the queue is cleared
+        """
+
+
+class StrictPriorityPolicy(SchedulingPolicy):
+    """
+    Orders tasks by priority only (lower number = higher priority), FIFO within a priority.
+    """
+    name = "priority"
+
+    def key(self, task):
+        return (task.priority,)
+
+
+class FairSharePolicy(SchedulingPolicy):
+    """
+    Weighted fair queuing between users (start-time fair queuing).
+
+    Every user has a virtual finish tag that grows by pages / weight for each submitted task,
+    so users who already got many pages printed are ordered after the others. A user who was
+    idle starts again from the current virtual time, which keeps the wait of every user bounded
+    when some users submit in bursts. Cancelled tasks give their pages back, so users are only
+    charged for pages which are printed. Priority only breaks ties between equal start tags.
+    """
+    name = "fair"
+
+    def __init__(self, weights=None, default_weight=1.0):
+        """
+        :param weights: dictionary username -> weight, higher weight gets a bigger share
+        :param default_weight: weight of users not present in weights
+        :raises SchedulingPolicyException: If a weight is not a positive number
+        """
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        for weight in list(self.weights.values()) + [default_weight]:
+            if not isinstance(weight, (int, float)) or weight <= 0:
+                raise SchedulingPolicyException("weights must be positive numbers")
+
+        self.virtual_time = 0.0
+        self.finish_tags = {}
+        self.start_tags = {}
+
+    def _cost(self, task):
+        return max(task.pages, 1) / self.weights.get(task.username, self.default_weight)
+
+    def key(self, task):
+        start = max(self.virtual_time, self.finish_tags.get(task.username, 0.0))
+        self.finish_tags[task.username] = start + self._cost(task)
+        self.start_tags[task.task_id] = start
+        return (start, task.priority)
+
+    def rekey(self, task):
+        return (self.start_tags[task.task_id], task.priority)
+
+    def on_pop(self, task):
+        self.virtual_time = max(self.virtual_time, self.start_tags.pop(task.task_id, self.virtual_time))
+
+    def on_remove(self, task):
+        if self.start_tags.pop(task.task_id, None) is None:
+            return
+        finish = self.finish_tags.get(task.username)
+        if finish is not None:
+            self.finish_tags[task.username] = max(self.virtual_time, finish - self._cost(task))
+
+    def clear(self):
+        self.start_tags = {}
+
+
+class ShortestJobAgingPolicy(SchedulingPolicy):
+    """
+    Shortest job first within a priority band, with aging.
+
+    A task's effective score while it waits is pages - aging_rate * waited_seconds, so a long job
+    gains aging_rate pages of credit every second. Ordering by that score at any moment is the
+    same as ordering by the static key enqueued_at + pages / aging_rate, so the key never has to
+    be recomputed and a task with N pages waits at most N / aging_rate seconds behind newer jobs.
+    """
+    name = "sjf"
+
+    def __init__(self, aging_rate=1.0, clock=time.monotonic):
+        """
+        :param aging_rate: pages of credit a waiting task gains per second
+        :param clock: function returning the current time in seconds
+        :raises SchedulingPolicyException: If aging_rate is not a positive number
+        """
+        if not isinstance(aging_rate, (int, float)) or aging_rate <= 0:
+            raise SchedulingPolicyException("aging_rate must be a positive number")
+        self.aging_rate = aging_rate
+        self.clock = clock
+        self.deadlines = {}
+
+    def key(self, task):
+        deadline = self.clock() + task.pages / self.aging_rate
+        self.deadlines[task.task_id] = deadline
+        return (task.priority, deadline)
+
+    def rekey(self, task):
+        return (task.priority, self.deadlines[task.task_id])
+
+    def on_pop(self, task):
+        self.deadlines.pop(task.task_id, None)
+
+    def on_remove(self, task):
+        self.deadlines.pop(task.task_id, None)
+
+    def clear(self):
+        self.deadlines = {}
+
+
+POLICIES = {
+    StrictPriorityPolicy.name: StrictPriorityPolicy,
+    FairSharePolicy.name: FairSharePolicy,
+    ShortestJobAgingPolicy.name: ShortestJobAgingPolicy,
+}
@@ -0,0 +1,135 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class RenderPipeline:
+    def __init__(self, task_list, workers=2, lookahead=4, poll_interval=0.05):
+        """
+        Render stage between the TaskList and the printers.
+
+        A driver thread watches the first `lookahead` tasks of the queue and renders them into
+        ready-to-send bytes in a worker pool, while the printers are busy with the previous job.
+        Tasks stay in the TaskList until a printer pops them, so priority order, cancellation and
+        reprioritization keep working. Renders of tasks pushed out of the window are dropped, renders
+        of tasks which left the queue (popped or cancelled) are kept for one more refresh, so the
+        printer which popped the task can still take it.
+
+        :param task_list: shared TaskList
+        :param workers: number of render worker threads
+        :param lookahead: number of queued tasks rendered ahead
+        :param poll_interval: seconds between two checks of the queue version
+        """
+        self.task_list = task_list
+        self.workers = workers
+        self.lookahead = lookahead
+        self.poll_interval = poll_interval
+
+        self.lock = threading.Lock()
+        self.profiles = {}
+        self.renders = {}
+        self.leaving = set()
+        self.stopped = threading.Event()
+        self.executor = None
+        self.thread = None
+
+    def register(self, profile, accepts, render):
+        """
+        Registers a printer profile, tasks accepted by it are rendered with its render function
+
+        :param profile: hashable key of the output format, printers with the same key share renders
+        :param accepts: function task -> bool
+        :param render: function task -> bytes
+        """
+        with self.lock:
+            if profile in self.profiles:
+                previous_accepts, render = self.profiles[profile]
+                accepts_any = lambda task, first=previous_accepts, second=accepts: first(task) or second(task)
+                self.profiles[profile] = (accepts_any, render)
+            else:
+                self.profiles[profile] = (accepts, render)
+
+    def take(self, task, profile):
+        """
+        Returns the bytes rendered ahead for the task, waits if the render is still running
+
+        :param task: Task popped from the TaskList
+        :param profile: profile key of the printer
+        :return: rendered bytes or None when the task was not rendered ahead or the render failed
+        """
+        with self.lock:
+            future = self.renders.pop((task.task_id, profile), None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except (Exception, CancelledError) as e:
+            print(f"Render ahead of {task.name} failed, rendering again: {e}")
+            return None
+
+    def start(self):
+        """
+        Starts the worker pool and the driver thread
+        """
+        self.stopped.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Render")
+        self.thread = threading.Thread(target=self._run, name="RenderPipeline", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the driver thread and drops every pending render
+        """
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            for future in self.renders.values():
+                future.cancel()
+            self.renders = {}
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def refresh(self, tasks):
+        """
+        Schedules renders for the tasks in the lookahead window and drops renders of tasks outside of it
+
+        :param tasks: queued tasks in print order
+        """
+        window = [task for task in tasks[:self.lookahead] if task.file_path]
+        queued = {task.task_id for task in tasks}
+        with self.lock:
+            wanted = set()
+            for task in window:
+                for profile, (accepts, render) in self.profiles.items():
+                    if accepts(task):
+                        wanted.add((task.task_id, profile))
+                        if (task.task_id, profile) not in self.renders:
+                            self.renders[(task.task_id, profile)] = self.executor.submit(render, task)
+
+            leaving = set()
+            for key in list(self.renders):
+                if key in wanted:
+                    continue
+                if key[0] not in queued and key not in self.leaving:
+                    leaving.add(key)
+                else:
+                    self.renders.pop(key).cancel()
+            self.leaving = leaving
+
+    def _run(self):
+        """
+        Main loop of the driver thread
+        """
+        version = None
+        while not self.stopped.is_set():
+            snapshot_version, tasks = self.task_list.snapshot()
+            if snapshot_version != version:
+                version = snapshot_version
+                try:
+                    self.refresh(tasks)
+                except RuntimeError as e:
+                    print(f"Render pipeline stopped: {e}")
+                    break
+            self.stopped.wait(self.poll_interval)
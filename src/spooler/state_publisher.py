@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+
+class StatePublisher:
+    def __init__(self, manager, state_func, loop=None, interval=0.25):
+        """
+        Coalesces state changes and event messages from the routes and the printer threads.
+
+        Changes are pushed at most once per interval: the first change after a quiet period is pushed at once,
+        later ones are collected and pushed together when the interval ends, always with the latest state.
+        Event messages collected meanwhile are sent as one text frame, one per line.
+        Without a running loop (before start) every publish is pushed immediately.
+
+        :param manager: ConnectionManager used for broadcasts
+        :param state_func: coroutine function returning the system state, None to send only event messages
+        :param loop: event loop running the pushes, None until start
+        :param interval: minimal number of seconds between two pushes
+        """
+        self.manager = manager
+        self.state_func = state_func
+        self.loop = loop
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.events = []
+        self.dirty = False
+        self.scheduled = False
+        self.last_push = None
+        self.waiters = []
+        self.push_tasks = set()
+
+    def start(self, loop):
+        """
+        Starts coalescing on the event loop of the server
+
+        :param loop: running event loop
+        """
+        self.loop = loop
+
+    def notify(self, event=None):
+        """
+        Records a state change and an optional event message, can be called from any thread
+
+        :param event: text message for the clients, or None when only the state changed
+        """
+        with self.lock:
+            if event is not None:
+                self.events.append(event)
+            self.dirty = True
+            if self.loop is None or self.scheduled:
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self._schedule)
+
+    async def publish(self, event=None):
+        """
+        Records a state change from the event loop, pushes it right away when the publisher is not started
+
+        :param event: text message for the clients, or None when only the state changed
+        """
+        self.notify(event)
+        if self.loop is None:
+            await self._push()
+
+    async def wait(self, timeout):
+        """
+        Waits until the next push
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if there was a push, False on timeout
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            self.waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self.lock:
+                if (loop, future) in self.waiters:
+                    self.waiters.remove((loop, future))
+
+    def _schedule(self):
+        """
+        Runs on the loop, plans the next push so that pushes are at least interval apart
+        """
+        delay = 0 if self.last_push is None else max(0.0, self.last_push + self.interval - self.loop.time())
+        self.loop.call_later(delay, self._start_push)
+
+    def _start_push(self):
+        """
+        Runs on the loop, starts the push and keeps a reference to it until it finished
+        """
+        task = self.loop.create_task(self._push())
+        self.push_tasks.add(task)
+        task.add_done_callback(self._push_done)
+
+    def _push_done(self, task):
+        """
+        Drops the reference to a finished push and logs its error
+        """
+        self.push_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error pushing system state: {task.exception()}")
+
+    async def _push(self):
+        """
+        Sends the collected event messages as one frame, then the latest system state
+        """
+        with self.lock:
+            events, self.events = self.events, []
+            dirty, self.dirty = self.dirty, False
+            self.scheduled = False
+            waiters, self.waiters = self.waiters, []
+        if self.loop is not None:
+            self.last_push = self.loop.time()
+
+        if events:
+            await self.manager.broadcast("\n".join(events))
+        if dirty and self.state_func is not None:
+            await self.manager.broadcast_state(await self.state_func())
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
@@ -0,0 +1,110 @@
+from bisect import bisect_left
+
+LIST_FIELDS = ("queue_tasks", "printers")
+
+
+def _longest_increasing(pairs):
+    """
+    Returns the keys of the longest run of pairs whose positions increase (patience sorting)
+
+    :param pairs: list of (key, position)
+    :return: set of keys
+    """
+    tails = []
+    tail_index = []
+    previous = [None] * len(pairs)
+    for i, (_, position) in enumerate(pairs):
+        j = bisect_left(tails, position)
+        if j == len(tails):
+            tails.append(position)
+            tail_index.append(i)
+        else:
+            tails[j] = position
+            tail_index[j] = i
+        previous[i] = tail_index[j - 1] if j > 0 else None
+
+    keys = set()
+    i = tail_index[-1] if tail_index else None
+    while i is not None:
+        keys.add(pairs[i][0])
+        i = previous[i]
+    return keys
+
+
+def diff_states(old, new):
+    """
+    Computes the operations turning the old system state into the new one.
+
+    Removed tasks get "task_removed", new ones "task_added" and tasks which changed or moved "task_moved".
+    Tasks keeping their relative order (the longest such run) are not sent. A client removes the removed and
+    moved tasks and then inserts the added and moved ones at their index, in the order of the operations.
+    Changed printers are sent whole ("printer"), other changed fields as "set".
+
+    :param old: previous state from get_system_state
+    :param new: current state from get_system_state
+    :return: list of operation dictionaries, empty when nothing changed
+    """
+    ops = []
+    old_tasks = {task["id"]: task for task in old["queue_tasks"]}
+    new_ids = {task["id"] for task in new["queue_tasks"]}
+    for task in old["queue_tasks"]:
+        if task["id"] not in new_ids:
+            ops.append({"op": "task_removed", "id": task["id"]})
+
+    old_index = {task["id"]: i for i, task in enumerate(old["queue_tasks"])}
+    unchanged = [(task["id"], old_index[task["id"]]) for task in new["queue_tasks"]
+                 if old_tasks.get(task["id"]) == task]
+    kept = _longest_increasing(unchanged)
+    for index, task in enumerate(new["queue_tasks"]):
+        if task["id"] not in old_tasks:
+            ops.append({"op": "task_added", "index": index, "task": task})
+        elif task["id"] not in kept:
+            ops.append({"op": "task_moved", "id": task["id"], "index": index, "task": task})
+
+    old_printers = {printer["name"]: printer for printer in old["printers"]}
+    for printer in new["printers"]:
+        if old_printers.get(printer["name"]) != printer:
+            ops.append({"op": "printer", "printer": printer})
+
+    for field, value in new.items():
+        if field not in LIST_FIELDS and old.get(field) != value:
+            ops.append({"op": "set", "field": field, "value": value})
+    return ops
+
+
+class StateStream:
+    def __init__(self):
+        """
+        Versioned system state sent to WebSocket clients.
+        Every change gets a new version and a "state_delta" message based on the previous version,
+        new or out of sync clients get a "system_state" snapshot. Callers must serialize update calls.
+        """
+        self.version = 0
+        self.state = None
+
+    def update(self, state):
+        """
+        Records a new system state
+
+        :param state: current state from get_system_state
+        :return: message to broadcast, None when nothing changed
+        """
+        if self.state is None:
+            self.version += 1
+            self.state = state
+            return self.snapshot()
+
+        ops = diff_states(self.state, state)
+        if not ops:
+            return None
+        self.version += 1
+        self.state = state
+        return {"type": "state_delta", "version": self.version, "base": self.version - 1, "ops": ops}
+
+    def snapshot(self):
+        """
+        Returns the full state message of the current version
+
+        :return: "system_state" message
+        """
+        return {"type": "system_state", "version": self.version, "data": self.state}
@@ -1,35 +1,49 @@
+import asyncio
 import threading
 from src.models.task import Task
+from src.spooler.engines import ENGINES
+from src.spooler.policies import SchedulingPolicy, StrictPriorityPolicy
 
 
 class TaskListException(Exception):
     pass
 
-class Node:
-    def __init__(self, task):
-        """
-        Defines the single task in the TaskList
+class TaskListFullException(TaskListException):
+    pass
 
-        :param task: Task instance stored in this node
-        """
-        self.task = task
-        self.prev = None
-        self.next = None
+class TaskListEmptyException(TaskListException):
+    pass
 
 class TaskList:
-    def __init__(self, max_size=10):
+    def __init__(self, max_size=10, engine="heap", policy=None, journal=None):
         """
-        Defines LinkedList queue of tasks ordered by priority.
+        Defines queue of tasks ordered by the scheduling policy (by priority by default).
 
         :param max_size: maximum number of tasks to print
+        :param engine: storage engine name, "heap" (O(log n)) or "linked" (O(n) insert)
+        :param policy: SchedulingPolicy instance, StrictPriorityPolicy when None
+        :param journal: TaskJournal recording every change of the queue, or None
+        :raises TaskListException: If engine is not a known engine name or policy is not a SchedulingPolicy
         """
-        self.tail = None
-        self.head = None
-        self.size = 0
+        if engine not in ENGINES:
+            raise TaskListException(f"engine must be one of {sorted(ENGINES)}")
+        if policy is None:
+            policy = StrictPriorityPolicy()
+        if not isinstance(policy, SchedulingPolicy):
+            raise TaskListException("policy must be a SchedulingPolicy")
+        self.engine = engine
+        self.policy = policy
+        self.journal = journal
+        self._engine = ENGINES[engine]()
         self.max_size = max_size
+        self.queued_pages = 0
+        self.version = 0
+        self._snapshot = (0, ())
         self.lock = threading.Lock()
         self.not_empty = threading.Condition(self.lock)
         self.not_full = threading.Condition(self.lock)
+        self._async_not_empty = []
+        self._async_not_full = []
 
     @property
     def max_size(self):
@@ -54,95 +68,339 @@ class TaskList:
             raise TaskListException('max_size must be positive')
         self._max_size = value
 
-    def append(self, task):
+    @property
+    def size(self):
+        """
+        Get the number of tasks currently in the queue
+
+        :return: number of tasks in the queue
+        """
+        return len(self._engine)
+
+    def append(self, task, block=True, timeout=None):
         """
         Add a new task to the queue based on its priority
 
         :param task: Task instance to add to the queue
+        :param block: wait for a free slot when the queue is full
+        :param timeout: maximum number of seconds to wait, None waits forever
         :raises TaskListException: If task is not a Task instance
+        :raises TaskListFullException: If the queue is still full after waiting
         """
 
         print(f"APPEND called: {task.name}, queue_size={self.size}")
 
         if not isinstance(task, Task):
             raise TaskListException("task must be a Task")
-        new_node = Node(task)
 
         with self.not_full:
-            while self.size >= self.max_size:
-                print(f"TaskList is full {self.size}/{self.max_size}")
-                self.not_full.wait()
-
-            if self.head is None:
-                self.head = new_node
-                self.tail = new_node
-            else:
-                current = self.head
-                prev = None
-
-                while current and task.priority >= current.task.priority:
-                    prev = current
-                    current = current.next
-
-                if prev is None:
-                    new_node.next = self.head
-                    self.head.prev = new_node
-                    self.head = new_node
-                else:
-                    new_node.next = current
-                    new_node.prev = prev
-                    prev.next = new_node
-                    if current:
-                        current.prev = new_node
-                    else:
-                        self.tail = new_node
-
-            self.size += 1
-            self.not_empty.notify_all()
+            if block:
+                if not self.not_full.wait_for(lambda: self.size < self.max_size, timeout):
+                    raise TaskListFullException(f"TaskList is full {self.size}/{self.max_size}")
+            elif self.size >= self.max_size:
+                raise TaskListFullException(f"TaskList is full {self.size}/{self.max_size}")
+
+            self._insert(task)
 
-    def pop(self):
+    def extend(self, tasks, block=True, timeout=None):
+        """
+        Add several tasks at once, all of them or none, under one lock acquisition
+
+        :param tasks: list of Task instances
+        :param block: wait until there is room for all tasks
+        :param timeout: maximum number of seconds to wait, None waits forever
+        :raises TaskListException: If an item is not a Task instance
+        :raises TaskListFullException: If there is no room for all tasks after waiting or never can be
+        """
+        tasks = self._check_batch(tasks)
+
+        with self.not_full:
+            if block:
+                if not self.not_full.wait_for(lambda: self.size + len(tasks) <= self.max_size, timeout):
+                    raise TaskListFullException(f"TaskList has no room for {len(tasks)} tasks {self.size}/{self.max_size}")
+            elif self.size + len(tasks) > self.max_size:
+                raise TaskListFullException(f"TaskList has no room for {len(tasks)} tasks {self.size}/{self.max_size}")
+
+            for task in tasks:
+                self._insert(task)
+
+    def _check_batch(self, tasks):
+        """
+        Validates a batch of tasks
+
+        :param tasks: iterable of Task instances
+        :return: list of the tasks
+        :raises TaskListException: If an item is not a Task instance
+        :raises TaskListFullException: If the batch is larger than max_size
+        """
+        tasks = list(tasks)
+        if not all(isinstance(task, Task) for task in tasks):
+            raise TaskListException("tasks must be Task instances")
+        if len(tasks) > self.max_size:
+            raise TaskListFullException(f"Batch of {len(tasks)} tasks is larger than the TaskList {self.max_size}")
+        return tasks
+
+    def pop(self, block=True, timeout=None, match=None):
         """
         Removes the first task in the queue
         Blocks if the queue is empty until a task is available
 
+        :param block: wait for a task when the queue is empty
+        :param timeout: maximum number of seconds to wait, None waits forever
+        :param match: function task -> bool, only the first task it accepts is removed
         :return: the first task in the queue
+        :raises TaskListEmptyException: If the queue is still empty after waiting
         """
 
-        print(f"POP called, queue_size={self.size}")
+        found = [None]
+
+        def available():
+            if match is None:
+                return self.size > 0
+            found[0] = self._engine.find_first(match)
+            return found[0] is not None
 
         with self.not_empty:
-            while self.size == 0:
-                print(f"TaskList is empty {self.size}/{self.max_size} waiting.....")
-                self.not_empty.wait()
+            if block:
+                if not self.not_empty.wait_for(available, timeout):
+                    raise TaskListEmptyException("TaskList is empty")
+            elif not available():
+                raise TaskListEmptyException("TaskList is empty")
+
+            return self._pop(found[0])
+
+    async def async_append(self, task, timeout=None):
+        """
+        Add a new task to the queue without blocking the event loop
+
+        :param task: Task instance to add to the queue
+        :param timeout: maximum number of seconds to wait for a free slot, None waits forever
+        :raises TaskListException: If task is not a Task instance
+        :raises TaskListFullException: If the queue is still full after waiting
+        """
+        if not isinstance(task, Task):
+            raise TaskListException("task must be a Task")
+
+        await self._async_wait(self._async_not_full, lambda: self.size < self.max_size, timeout,
+                               TaskListFullException(f"TaskList is full {self.size}/{self.max_size}"),
+                               lambda: self._insert(task))
+
+    async def async_extend(self, tasks, timeout=None):
+        """
+        Add several tasks at once, all of them or none, without blocking the event loop
+
+        :param tasks: list of Task instances
+        :param timeout: maximum number of seconds to wait for room for all tasks, None waits forever
+        :raises TaskListException: If an item is not a Task instance
+        :raises TaskListFullException: If there is no room for all tasks after waiting or never can be
+        """
+        tasks = self._check_batch(tasks)
+
+        def insert_all():
+            for task in tasks:
+                self._insert(task)
+
+        await self._async_wait(self._async_not_full, lambda: self.size + len(tasks) <= self.max_size, timeout,
+                               TaskListFullException(f"TaskList has no room for {len(tasks)} tasks "
+                                                     f"{self.size}/{self.max_size}"),
+                               insert_all)
+
+    async def async_pop(self, timeout=None):
+        """
+        Removes the first task in the queue without blocking the event loop
+
+        :param timeout: maximum number of seconds to wait for a task, None waits forever
+        :return: the first task in the queue
+        :raises TaskListEmptyException: If the queue is still empty after waiting
+        """
+        return await self._async_wait(self._async_not_empty, lambda: self.size > 0, timeout,
+                                      TaskListEmptyException("TaskList is empty"), self._pop)
 
-            node = self.head
-            self.head = node.next
-            if self.head:
-                self.head.prev = None
-            else:
-                self.head = None
+    async def _async_wait(self, waiters, predicate, timeout, exception, action):
+        """
+        Wait on the event loop until predicate holds, then run action under the lock
+
+        :param waiters: list of futures woken when the predicate may have changed
+        :param predicate: condition checked under the lock
+        :param timeout: maximum number of seconds to wait, None waits forever
+        :param exception: exception raised on timeout
+        :param action: function run under the lock once predicate holds
+        :return: result of action
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while True:
+            with self.lock:
+                if predicate():
+                    return action()
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise exception
+                future = loop.create_future()
+                waiters.append((loop, future))
+
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.lock:
+                    if (loop, future) in waiters:
+                        waiters.remove((loop, future))
+
+    def _insert(self, task):
+        """
+        Insert the task and wake up consumers, must be called with the lock held
+
+        :param task: Task instance to insert
+        """
+        self._engine.insert(task, self.policy.key(task))
+        if self.journal:
+            self.journal.record_enqueue(task)
+        self.queued_pages += task.pages
+        self.version += 1
+        self.not_empty.notify_all()
+        self._wake(self._async_not_empty)
+
+    def _pop(self, task=None):
+        """
+        Pop the first task and wake up producers, must be called with the lock held
+
+        :param task: queued task to remove, found by the match of pop, None takes the first task
+        :return: the removed task
+        """
+        if task is None:
+            task = self._engine.pop()
+        else:
+            task = self._engine.remove(task.task_id)
+        self.policy.on_pop(task)
+        if self.journal:
+            self.journal.record_dequeue(task)
+        self.queued_pages -= task.pages
+        self.version += 1
+        self.not_full.notify_all()
+        self._wake(self._async_not_full)
+        return task
+
+    @staticmethod
+    def _wake(waiters):
+        """
+        Wake up all asyncio waiters from any thread, must be called with the lock held
+
+        :param waiters: list of (loop, future) pairs
+        """
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+        waiters.clear()
 
-            self.size -= 1
-            self.not_full.notify()
-            return node.task
+    def get(self, task_id):
+        """
+        Return the queued task with the given ID
+
+        :param task_id: ID of the task
+        :return: the task or None if it is not in the queue
+        """
+        with self.lock:
+            return self._engine.get(task_id)
+
+    def cancel(self, task_id):
+        """
+        Remove the task with the given ID from the queue
+
+        :param task_id: ID of the task
+        :return: the removed task or None if it is not in the queue
+        """
+        with self.lock:
+            task = self._engine.remove(task_id)
+            if task is not None:
+                self.policy.on_remove(task)
+                if self.journal:
+                    self.journal.record_cancel(task)
+                self.queued_pages -= task.pages
+                self.version += 1
+                self.not_full.notify_all()
+                self._wake(self._async_not_full)
+            return task
+
+    def reprioritize(self, task_id, new_priority):
+        """
+        Change the priority of a queued task, the task goes to the end of its new priority
+
+        :param task_id: ID of the task
+        :param new_priority: new priority of the task
+        :return: the updated task or None if it is not in the queue
+        :raises TaskListException: If new_priority is not an integer
+        """
+        if not isinstance(new_priority, int):
+            raise TaskListException("priority must be an integer")
+
+        with self.lock:
+            task = self._engine.remove(task_id)
+            if task is None:
+                return None
+            task.priority = new_priority
+            self._engine.insert(task, self.policy.rekey(task))
+            if self.journal:
+                self.journal.record_reprioritize(task)
+            self.version += 1
+            return task
+
+    def task_done(self, task):
+        """
+        Mark a task taken by pop() as finished, so it is not restored after a restart
+
+        :param task: Task instance returned by pop()
+        """
+        if self.journal:
+            self.journal.record_complete(task)
+
+    def restore(self, tasks):
+        """
+        Put tasks replayed from the journal back into the queue.
+        Ignores max_size, so tasks which were printing during a crash are not lost.
+
+        :param tasks: list of Task instances in enqueue order
+        """
+        with self.lock:
+            for task in tasks:
+                self._engine.insert(task, self.policy.key(task))
+                self.queued_pages += task.pages
+            self.version += 1
+            self.not_empty.notify_all()
+            self._wake(self._async_not_empty)
 
     def get_all_tasks(self):
+        """
+        Return all tasks in the order they will be printed
+
+        :return: list of tasks
+        """
+        with self.lock:
+            return self._engine.tasks()
+
+    def snapshot(self):
+        """
+        Return an immutable view of the queue in print order.
+        The view is rebuilt only when the version changed, otherwise it is returned without locking.
+
+        :return: tuple (version, tuple of tasks)
+        """
+        snapshot = self._snapshot
+        if snapshot[0] == self.version:
+            return snapshot
+
         with self.lock:
-            tasks = []
-            current = self.head
-            while current is not None:
-                tasks.append(current.task)
-                current = current.next
-            return tasks
+            if self._snapshot[0] != self.version:
+                self._snapshot = (self.version, tuple(self._engine.tasks()))
+            return self._snapshot
 
     def get_queue_info(self):
         with self.lock:
             queue_length = self.size
             tasks_str = "Current Tasks: \n"
-            current = self.head
-            while current is not None:
-                tasks_str += str(current.task) + "\n"
-                current = current.next
+            for task in self._engine.tasks():
+                tasks_str += str(task) + "\n"
             return queue_length, tasks_str
 
     def clear(self):
@@ -150,11 +408,15 @@ class TaskList:
         Clear all tasks from the queue
         """
         with self.not_empty:
-            self.head = None
-            self.tail = None
-            self.size = 0
+            self._engine.clear()
+            self.policy.clear()
+            if self.journal:
+                self.journal.record_clear()
+            self.queued_pages = 0
+            self.version += 1
             self.not_empty.notify_all()
             self.not_full.notify_all()
+            self._wake(self._async_not_full)
 
     def __str__(self):
         """
@@ -163,11 +425,9 @@ class TaskList:
         :return: String with all tasks in the queue
         """
         with self.lock:
-            current = self.head
             result = "Current Tasks: \n"
-            while current is not None:
-                result += str(current.task) + "\n"
-                current = current.next
+            for task in self._engine.tasks():
+                result += str(task) + "\n"
             return result
 
     def __len__(self):
@@ -0,0 +1,104 @@
+import os
+import re
+import threading
+import uuid
+
+HASH_NAME = re.compile(r"^[0-9a-f]{64}(\.[\w-]+)?$")
+
+
+class UploadStore:
+    def __init__(self, directory):
+        """
+        Content-addressed store of uploaded files.
+        A file is stored once as <sha256><extension> and reference-counted by the queued tasks using it,
+        it is removed when the last task is printed or cancelled.
+
+        :param directory: directory of the stored files
+        """
+        self.directory = directory
+        self.incoming = os.path.join(directory, ".incoming")
+        self.lock = threading.Lock()
+        self.references = {}
+        os.makedirs(self.incoming, exist_ok=True)
+
+    def temp_path(self):
+        """
+        Returns a unique path for an upload which is being received
+
+        :return: path inside the incoming directory
+        """
+        return os.path.join(self.incoming, uuid.uuid4().hex)
+
+    def path(self, content_hash, filename):
+        """
+        Returns the path of the stored content, the extension of the original file name is kept
+
+        :param content_hash: SHA-256 of the file content
+        :param filename: original file name
+        :return: path of the stored file
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.directory, f"{content_hash}{extension}")
+
+    def store(self, temp_path, content_hash, filename):
+        """
+        Moves a received upload into the store and takes a reference on it.
+        When the same content is already stored the received copy is dropped.
+
+        :param temp_path: path returned by temp_path() with the complete upload
+        :param content_hash: SHA-256 of the file content
+        :param filename: original file name
+        :return: path of the stored file
+        """
+        path = self.path(content_hash, filename)
+        with self.lock:
+            if path in self.references and os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, path)
+            self.references[path] = self.references.get(path, 0) + 1
+        return path
+
+    def release(self, path):
+        """
+        Drops a reference, the file is deleted with the last one
+
+        :param path: path of the stored file
+        :return: True if the file was deleted
+        """
+        with self.lock:
+            count = self.references.get(path, 0) - 1
+            if count > 0:
+                self.references[path] = count
+                return False
+            self.references.pop(path, None)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    return True
+            except OSError as e:
+                print(f"Warning: Could not delete file {path}: {e}")
+            return False
+
+    def rebuild(self, tasks):
+        """
+        Rebuilds the reference counts from the tasks restored at startup,
+        removes unfinished uploads and stored files which no task uses
+
+        :param tasks: restored tasks
+        """
+        with self.lock:
+            self.references = {}
+            for task in tasks:
+                if task.file_path:
+                    self.references[task.file_path] = self.references.get(task.file_path, 0) + 1
+
+            for name in os.listdir(self.incoming):
+                os.remove(os.path.join(self.incoming, name))
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if HASH_NAME.match(name) and path not in self.references:
+                    os.remove(path)
+
+    def __len__(self):
+        return len(self.references)
@@ -11,6 +11,8 @@ const usernameInput = document.getElementById('username');
 const allowedExtensions = [".pdf"];
 
 let currentUsername = null;
+let systemState = null;
+let stateVersion = 0;
 
 fetch('/api/check-auth')
     .then(res => res.json())
@@ -50,17 +52,32 @@ if (logoutButton) {
 
 ws.onopen = () => {
     updateStatus('online', 'Connected');
-    fetchSystemState();
 };
 
 ws.onmessage = (event) => {
+    let data;
     try {
-        const data = JSON.parse(event.data);
-        if (data.type === 'system_state') {
-            updateSystemState(data.data);
-        }
+        data = JSON.parse(event.data);
     } catch (e) {
         console.log('Server message:', event.data);
+        return;
+    }
+
+    if (data.type === 'system_state') {
+        systemState = data.data;
+        stateVersion = data.version;
+        updateSystemState(systemState);
+    } else if (data.type === 'state_delta') {
+        if (data.version <= stateVersion) {
+            return;
+        }
+        if (systemState === null || data.base !== stateVersion) {
+            ws.send('resync');
+            return;
+        }
+        applyStateDelta(systemState, data.ops);
+        stateVersion = data.version;
+        updateSystemState(systemState);
     }
 };
 
@@ -144,22 +161,31 @@ function isAllowed(filename) {
 }
 
 /**
- * Fetches the current system state from the server and updates the UI.
+ * Applies delta operations sent by the server to the local copy of the system state.
+ * Removed and moved tasks are taken out first, then added and moved tasks are inserted at their index.
+ * @param {Object} state - system state, changed in place
+ * @param {Array} ops - operations of a state_delta message
  */
-async function fetchSystemState() {
-    try {
-        const response = await fetch('/system-state/');
+function applyStateDelta(state, ops) {
+    const leaving = new Set(ops
+        .filter(op => op.op === 'task_removed' || op.op === 'task_moved')
+        .map(op => op.id));
+    state.queue_tasks = state.queue_tasks.filter(task => !leaving.has(task.id));
 
-        if (response.status === 401) {
-            window.location.href = '/login';
-            return;
+    ops.forEach(op => {
+        if (op.op === 'task_added' || op.op === 'task_moved') {
+            state.queue_tasks.splice(op.index, 0, op.task);
+        } else if (op.op === 'printer') {
+            const index = state.printers.findIndex(printer => printer.name === op.printer.name);
+            if (index >= 0) {
+                state.printers[index] = op.printer;
+            } else {
+                state.printers.push(op.printer);
+            }
+        } else if (op.op === 'set') {
+            state[op.field] = op.value;
         }
-
-        const state = await response.json();
-        updateSystemState(state);
-    } catch (error) {
-        console.error('Error fetching system state:', error);
-    }
+    });
 }
 
 /**
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.auth.database import Database
+from src.models.task import Task
+
+
+class DatabaseTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = Database(os.path.join(self.tmp.name, "spooler.db"))
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.database.close()
+        self.tmp.cleanup()
+
+    def test_database_uses_wal_and_indexes(self):
+        """
+        Test that the database runs in WAL mode and lookups by token and username use an index
+        """
+        self.assertEqual(self.database._read("PRAGMA journal_mode")[0][0], "wal")
+        plan = self.database._read("EXPLAIN QUERY PLAN SELECT * FROM sessions WHERE username = ?", ("alice",))
+        self.assertIn("sessions_username", plan[0][-1])
+        plan = self.database._read("EXPLAIN QUERY PLAN SELECT * FROM jobs WHERE username = ?", ("alice",))
+        self.assertIn("jobs_username", plan[0][-1])
+
+    def test_import_json_users_and_sessions(self):
+        """
+        Test that users.json and sessions.json are imported once and renamed
+        """
+        users_file = os.path.join(self.tmp.name, "users.json")
+        sessions_file = os.path.join(self.tmp.name, "sessions.json")
+        session = {"username": "alice", "created": "2025-01-01T00:00:00", "expires": "2025-01-02T00:00:00"}
+        with open(users_file, 'w') as f:
+            json.dump({"alice": "hash"}, f)
+        with open(sessions_file, 'w') as f:
+            json.dump({"token": session}, f)
+
+        self.assertTrue(self.database.import_json(users_file, sessions_file))
+        self.assertEqual(self.database.get_password_hash("alice"), "hash")
+        self.assertIsNone(self.database.get_password_hash("bob"))
+        self.assertEqual(self.database.load_sessions(), {"token": session})
+        self.assertTrue(os.path.exists(users_file + ".imported"))
+        self.assertFalse(self.database.import_json(users_file, sessions_file))
+
+    def test_user_cache_sees_changes_of_other_connections(self):
+        """
+        Test that the cached user table is read again after another connection changed it
+        """
+        self.database.save_users({"alice": "hash"})
+        self.assertEqual(self.database.get_password_hash("alice"), "hash")
+        other = Database(self.database.path)
+        other.save_users({"alice": "new-hash", "bob": "hash"})
+        self.assertEqual(self.database.get_password_hash("alice"), "new-hash")
+        self.assertEqual(self.database.get_password_hash("bob"), "hash")
+        other.close()
+
+    def test_job_history(self):
+        """
+        Test that finished jobs are returned newest first and can be filtered by user
+        """
+        for name, user in (("a.pdf", "alice"), ("b.pdf", "bob"), ("c.pdf", "alice")):
+            self.database.record_job(Task(name, 1, 2, user), "MainPrinter", "printed")
+
+        self.assertEqual([job["name"] for job in self.database.job_history()], ["c.pdf", "b.pdf", "a.pdf"])
+        history = self.database.job_history(username="alice", limit=1)
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["name"], "c.pdf")
+        self.assertEqual(history[0]["printer"], "MainPrinter")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.spooler.document_cache import DocumentArtifact, DocumentCache, hash_file
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "sampleFiles", "faktura_sample.pdf")
+
+
+class DocumentCacheTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.tmp.cleanup()
+
+    def test_document_is_parsed_once(self):
+        """
+        Test that the page count, text and language are parsed once and reused from memory and disk
+        """
+        cache = DocumentCache(self.directory)
+        artifact = cache.get_or_parse(SAMPLE_PDF, "faktura_sample.pdf")
+        self.assertEqual(artifact.content_hash, hash_file(SAMPLE_PDF))
+        self.assertGreater(artifact.pages, 0)
+        self.assertTrue(artifact.text.strip())
+        self.assertEqual(artifact.language, 'cs')
+
+        with patch('src.spooler.document_cache.parse_document') as parse:
+            self.assertIs(cache.get_or_parse(SAMPLE_PDF, "faktura_sample.pdf", artifact.content_hash), artifact)
+            reloaded = DocumentCache(self.directory).get(artifact.content_hash)
+            parse.assert_not_called()
+        self.assertEqual(reloaded.serialize(), artifact.serialize())
+
+    def test_not_pdf_has_one_page(self):
+        """
+        Test that other files count as one page without text
+        """
+        path = os.path.join(self.directory, "note.txt")
+        with open(path, "w") as f:
+            f.write("hello")
+        artifact = DocumentCache(self.directory).get_or_parse(path, "note.txt")
+        self.assertEqual(artifact.pages, 1)
+        self.assertIsNone(artifact.text)
+
+    def test_memory_and_disk_are_bounded(self):
+        """
+        Test that the least recently used artifacts are evicted from memory and from disk
+        """
+        cache = DocumentCache(self.directory, max_memory_bytes=500, max_disk_bytes=400)
+        for name in ["a", "b", "c"]:
+            cache.put(DocumentArtifact(name, 1, name * 100))
+            if name == "b":
+                cache.get("a")
+
+        self.assertEqual(list(cache.memory), ["a", "c"])
+        self.assertLessEqual(cache.memory_bytes, 500)
+        self.assertEqual(list(cache.disk), ["a", "c"])
+        self.assertLessEqual(cache.disk_bytes, 400)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "b.json")))
+        self.assertIsNone(cache.get("b"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.spooler import document_parser
+from src.spooler.document_cache import parse_document
+from src.spooler.document_parser import DocumentParser, DocumentParserException, DocumentParserUnavailableException
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "sampleFiles")
+SAMPLE_PDF = os.path.join(SAMPLE_DIR, "faktura_sample.pdf")
+_real_count_pages = document_parser._count_pages
+
+
+def _count_pages_slowly(file_path):
+    """
+    Runs in a worker process, hangs on files named slow*.pdf
+    """
+    if os.path.basename(file_path).startswith("slow"):
+        time.sleep(30)
+    return _real_count_pages(file_path)
+
+
+class DocumentParserTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.parser = DocumentParser(workers=2, chunk_pages=1)
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.parser.close()
+
+    def test_same_result_as_parsing_in_process(self):
+        """
+        Test that page-parallel parsing in the worker processes gives the same artifact as parse_document
+        """
+        for name in sorted(os.listdir(SAMPLE_DIR)):
+            path = os.path.join(SAMPLE_DIR, name)
+            expected = parse_document(path, name, "hash")
+            self.assertEqual(self.parser.parse(path, name, "hash").serialize(), expected.serialize())
+
+    def test_malformed_and_other_files(self):
+        """
+        Test that a malformed PDF defaults to one page and other files are not sent to the workers
+        """
+        self.assertEqual(self.parser.parse(__file__, "broken.pdf", "hash").pages, 1)
+        self.assertEqual(self.parser.parse(__file__, "notes.txt", "hash").pages, 1)
+
+    def test_timeout_restarts_workers(self):
+        """
+        Test that a document over the time limit raises, its worker is dropped and the next document starts a new one
+        """
+        self.parser.timeout = 0
+        with self.assertRaises(DocumentParserException):
+            self.parser.parse(SAMPLE_PDF, "faktura_sample.pdf", "hash")
+        self.assertEqual((self.parser.idle, self.parser.busy), ([], set()))
+
+        self.parser.timeout = 30
+        self.assertEqual(self.parser.parse(SAMPLE_PDF, "faktura_sample.pdf", "hash").language, 'cs')
+
+    def test_short_documents_share_workers(self):
+        """
+        Test that a short document takes one worker and the next document reuses it instead of starting a new one
+        """
+        self.parser.close()
+        self.parser = DocumentParser(workers=4)
+        self.parser.parse(SAMPLE_PDF, "faktura_sample.pdf", "hash")
+        self.assertEqual(len(self.parser.idle), 1)
+        worker = self.parser.idle[0]
+
+        self.assertEqual(self.parser.parse(SAMPLE_PDF, "faktura_sample.pdf", "hash").language, 'cs')
+        self.assertEqual(self.parser.idle, [worker])
+
+    def test_stuck_document_does_not_fail_others(self):
+        """
+        Test that a document over the time limit fails alone, a document waiting for the only worker
+        gets its own full timeout and is parsed normally
+        """
+        self.parser.close()
+        self.parser = DocumentParser(workers=1, timeout=1.0)
+        results = {}
+
+        def parse(name, path):
+            try:
+                results[name] = self.parser.parse(path, name + ".pdf", "hash")
+            except DocumentParserException as e:
+                results[name] = e
+
+        with tempfile.TemporaryDirectory() as tmp, patch.object(document_parser, "_count_pages", _count_pages_slowly):
+            slow_pdf = os.path.join(tmp, "slow.pdf")
+            shutil.copy(SAMPLE_PDF, slow_pdf)
+            slow = threading.Thread(target=parse, args=("slow", slow_pdf))
+            slow.start()
+            time.sleep(0.3)
+            normal = threading.Thread(target=parse, args=("normal", SAMPLE_PDF))
+            normal.start()
+            slow.join()
+            normal.join()
+
+        self.assertIsInstance(results["slow"], DocumentParserException)
+        self.assertEqual(results["normal"].language, 'cs')
+
+    def test_closed_parser_is_unavailable(self):
+        """
+        Test that parsing after close asks for a retry instead of returning a one page artifact
+        """
+        self.parser.close()
+        with self.assertRaises(DocumentParserUnavailableException):
+            self.parser.parse(SAMPLE_PDF, "faktura_sample.pdf", "hash")
+
+if __name__ == '__main__':
+    unittest.main()
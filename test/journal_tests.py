@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.models.task import Task
+from src.spooler.journal import TaskJournal
+from src.spooler.task_list import TaskList
+
+
+class TaskJournalTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.tmp.cleanup()
+
+    def test_replay_restores_queued_and_printing_tasks(self):
+        """
+        Test that queued and dequeued tasks are restored, cancelled and completed are not
+        """
+        journal = TaskJournal(self.directory)
+        task_list = TaskList(journal=journal)
+        names = ["printing", "done", "cancelled", "queued", "moved"]
+        tasks = {name: Task(name, 1, 5, "user") for name in names}
+        for task in tasks.values():
+            task_list.append(task)
+
+        self.assertEqual(task_list.pop().name, "printing")
+        task_list.task_done(task_list.pop())
+        task_list.cancel(tasks["cancelled"].task_id)
+        task_list.reprioritize(tasks["moved"].task_id, 1)
+        journal.close()
+
+        restored = TaskList(journal=TaskJournal(self.directory))
+        restored.restore(restored.journal.replay())
+        self.assertEqual([task.name for task in restored.get_all_tasks()], ["moved", "printing", "queued"])
+        self.assertEqual(restored.get(tasks["queued"].task_id).task_id, tasks["queued"].task_id)
+
+    def test_compaction_and_torn_record(self):
+        """
+        Test that the snapshot replaces the journal and a torn last record is skipped
+        """
+        journal = TaskJournal(self.directory, compact_every=3)
+        task_list = TaskList(journal=journal)
+        for i in range(4):
+            task_list.append(Task(f"doc{i}", 1, 5, "user"))
+        journal.flush()
+        self.assertEqual(os.path.getsize(journal.journal_path), 0)
+
+        task_list.pop()
+        journal.flush()
+        with open(journal.journal_path, 'a') as f:
+            f.write('{"op": "cancel", "id"')
+
+        tasks = TaskJournal(self.directory).replay()
+        self.assertEqual([task.name for task in tasks], ["doc0", "doc1", "doc2", "doc3"])
+
+    def test_missing_file_is_skipped(self):
+        """
+        Test that tasks whose uploaded file no longer exists are not restored
+        """
+        journal = TaskJournal(self.directory)
+        journal.record_enqueue(Task("gone", 1, 5, "user", file_path=os.path.join(self.directory, "gone.pdf")))
+        journal.close()
+        self.assertEqual(TaskJournal(self.directory).replay(), [])
+
+    def test_background_flush_and_fast_replay(self):
+        """
+        Test group commit through the flusher thread and that tens of thousands of records replay quickly
+        """
+        journal = TaskJournal(self.directory, compact_every=10 ** 6)
+        journal.start()
+        for i in range(20000):
+            task = Task(f"doc{i}", 1, 5, "user")
+            journal.record_enqueue(task)
+            if i % 2:
+                journal.record_complete(task)
+        journal.close()
+
+        start = time.perf_counter()
+        tasks = TaskJournal(self.directory).replay()
+        self.assertEqual(len(tasks), 10000)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
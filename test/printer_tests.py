@@ -1,8 +1,20 @@
 import unittest
 import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 
 from src.devices.printer import Printer, PrinterException
+from src.devices.printer_pool import PrinterPool, PrinterPoolException
+from src.devices.backends import (SimulatedBackend, FileBackend, SocketBackend, Win32Backend,
+                                  PrinterBackendException, make_backend)
 from src.spooler.task_list import TaskList
+from src.models.task import Task
+from src.devices.health import PrinterHealthMonitor
+from src.devices.throughput import ThroughputModel
 
 class DummyManager:
     """
@@ -11,7 +23,7 @@ class DummyManager:
     async def broadcast(self, msg):
         pass
 
-    async def broadcast_json(self, data):
+    async def broadcast_state(self, state):
         pass
 
 class PrinterTest(unittest.TestCase):
@@ -80,5 +92,298 @@ class PrinterTest(unittest.TestCase):
         self.assertEqual(status["current_task"], None)
         self.assertEqual(status["is_printing"], False)
 
+    def test_accepts_routing(self):
+        """
+        Test routing of tasks to any printer, a named printer and by capabilities
+        """
+        narrow = Printer(self.task_list, self.manager, self.loop, name="Narrow")
+        wide = Printer(self.task_list, self.manager, self.loop, name="Wide", paper_width_mm=80,
+                       char_per_line=48, capabilities={"cut"})
+
+        any_task = Task("any", 1, 1, "user")
+        named_task = Task("named", 1, 1, "user", printer="Narrow")
+        wide_task = Task("wide", 1, 1, "user", capabilities={"80mm", "cut"})
+
+        self.assertTrue(narrow.accepts(any_task) and wide.accepts(any_task))
+        self.assertTrue(narrow.accepts(named_task))
+        self.assertFalse(wide.accepts(named_task))
+        self.assertFalse(narrow.accepts(wide_task))
+        self.assertTrue(wide.accepts(wide_task))
+
+        pool = PrinterPool([narrow, wide])
+        self.assertTrue(pool.can_serve(wide_task))
+        self.assertFalse(pool.can_serve(Task("none", 1, 1, "user", printer="Missing")))
+        self.assertEqual([status["name"] for status in pool.get_status()], ["Narrow", "Wide"])
+
+    def test_pool_unique_names(self):
+        """
+        Test that a pool with duplicate printer names raises exception
+        """
+        with self.assertRaises(PrinterPoolException):
+            PrinterPool([Printer(self.task_list, self.manager, self.loop, name="Same"),
+                         Printer(self.task_list, self.manager, self.loop, name="Same")])
+
+class PrintingTest(unittest.TestCase):
+
+    def test_print_with_simulated_backend(self):
+        """
+        Test printing a PDF end to end on the simulator without a fixed sleep after the job
+        """
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "faktura.pdf")
+            shutil.copy(os.path.join(os.path.dirname(__file__), "sampleFiles", "faktura_sample.pdf"), file_path)
+
+            task_list = TaskList()
+            backend = SimulatedBackend(bytes_per_second=10 ** 6)
+            printer = Printer(task_list, DummyManager(), loop, backend=backend)
+            task_list.append(Task("faktura.pdf", 1, 1, "user", file_path=file_path))
+
+            start = time.perf_counter()
+            printer.start()
+            while backend.jobs_written == 0 or printer.get_status()["is_printing"]:
+                self.assertLess(time.perf_counter() - start, 10)
+                time.sleep(0.01)
+
+            self.assertLess(time.perf_counter() - start, 2)
+            self.assertFalse(os.path.exists(file_path))
+            self.assertEqual(printer.throughput.samples, 1)
+
+            printer.stop()
+            printer.join(timeout=5)
+
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join(timeout=5)
+
+    def test_failed_completion_raises(self):
+        """
+        Test that a job the backend reports as failed raises and marks the printer unavailable
+        """
+        class PaperOutBackend(SimulatedBackend):
+            cancelled = []
+
+            def wait_for_completion(self, job, timeout):
+                return False
+
+            def cancel(self, job):
+                self.cancelled.append(job)
+
+        backend = PaperOutBackend(bytes_per_second=10 ** 6)
+        printer = Printer(TaskList(), DummyManager(), asyncio.new_event_loop(), backend=backend)
+        with self.assertRaises(PrinterException):
+            printer._print_raw(b"receipt", "receipt")
+        self.assertFalse(printer.health_monitor.is_available(printer))
+        self.assertEqual(backend.cancelled, [1])
+        printer.health_monitor.stop()
+
+    def test_throughput_model(self):
+        """
+        Test that the learned speed follows measured jobs and small jobs are ignored
+        """
+        model = ThroughputModel(bytes_per_second=1000, smoothing=0.5)
+        self.assertEqual(model.estimate(2000), 2.0)
+        model.observe(10, 1.0)
+        self.assertEqual(model.samples, 0)
+        model.observe(4000, 1.0)
+        self.assertEqual(model.estimate(4000), 1.0)
+        model.observe(2000, 1.0)
+        self.assertEqual(model.bytes_per_second, 3000)
+
+class HealthMonitorTest(unittest.TestCase):
+
+    def test_cached_availability_and_changes(self):
+        """
+        Test that availability is cached, changes are pushed and write failures mark the printer unavailable
+        """
+        now = [0.0]
+        backend = SimulatedBackend()
+        monitor = PrinterHealthMonitor(interval=5, clock=lambda: now[0])
+        printer = Printer(TaskList(), DummyManager(), asyncio.new_event_loop(), backend=backend, health_monitor=monitor)
+        changes = []
+        monitor.watched[printer.name]["on_change"] = lambda p, available: changes.append(available)
+
+        self.assertTrue(monitor.is_available(printer))
+        backend.disconnect()
+        self.assertTrue(monitor.is_available(printer))
+
+        now[0] = 10.0
+        self.assertFalse(monitor.is_available(printer))
+        self.assertFalse(printer.printer_available)
+        self.assertEqual(changes, [False])
+
+        backend.connect()
+        monitor.check(printer)
+        self.assertTrue(monitor.wait_available(printer, timeout=0))
+        monitor.report_failure(printer)
+        self.assertFalse(monitor.is_available(printer))
+        self.assertEqual(changes, [False, True, False])
+
+    def test_monitor_thread_detects_reconnect(self):
+        """
+        Test that the background thread notices the printer coming back
+        """
+        backend = SimulatedBackend()
+        backend.disconnect()
+        monitor = PrinterHealthMonitor(interval=0.01)
+        printer = Printer(TaskList(), DummyManager(), asyncio.new_event_loop(), backend=backend, health_monitor=monitor)
+        monitor.start()
+        try:
+            self.assertFalse(monitor.wait_available(printer, timeout=0.05))
+            backend.connect()
+            self.assertTrue(monitor.wait_available(printer, timeout=2))
+        finally:
+            monitor.stop()
+
+class BackendTest(unittest.TestCase):
+
+    def test_make_backend(self):
+        """
+        Test creating backends from configuration
+        """
+        self.assertIsInstance(make_backend({"type": "simulated", "bytes_per_second": 100}), SimulatedBackend)
+        self.assertIsInstance(make_backend({"type": "win32", "printer_name": "Xprinter"}), Win32Backend)
+        with self.assertRaises(PrinterBackendException):
+            make_backend({"type": "carrier-pigeon"})
+        with self.assertRaises(PrinterBackendException):
+            make_backend({"type": "file"})
+
+    def test_printer_backend_config(self):
+        """
+        Test that Printer accepts a backend configuration and rejects invalid ones
+        """
+        loop = asyncio.new_event_loop()
+        printer = Printer(TaskList(), DummyManager(), loop, backend={"type": "simulated"})
+        self.assertIsInstance(printer.backend, SimulatedBackend)
+        self.assertTrue(printer._check_printer_availability())
+        with self.assertRaises(PrinterException):
+            Printer(TaskList(), DummyManager(), loop, backend={"type": "unknown"})
+        loop.close()
+
+    def test_simulated_throughput_and_events(self):
+        """
+        Test that the simulator models throughput, paper-out and disconnect
+        """
+        backend = SimulatedBackend(bytes_per_second=10000, chunk_size=100)
+        start = time.perf_counter()
+        backend.write(b"x" * 1000)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+        self.assertEqual(backend.bytes_written, 1000)
+        self.assertEqual(backend.jobs_written, 1)
+
+        backend.paper_out()
+        self.assertFalse(backend.is_available())
+        with self.assertRaises(PrinterBackendException):
+            backend.write(b"x")
+        backend.load_paper()
+
+        threading.Timer(0.05, backend.disconnect).start()
+        with self.assertRaises(PrinterBackendException):
+            backend.write(b"x" * 10000)
+        backend.connect()
+        self.assertTrue(backend.is_available())
+
+    def test_file_backend(self):
+        """
+        Test writing raw bytes to a device node
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lp0")
+            backend = FileBackend(path)
+            self.assertFalse(backend.is_available())
+            open(path, 'wb').close()
+            self.assertTrue(backend.is_available())
+            backend.write(b"\x1B\x40hello")
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b"\x1B\x40hello")
+
+    def test_socket_backend(self):
+        """
+        Test sending a raw job to a port 9100 style server
+        """
+        server = socket.create_server(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        received = []
+
+        def serve():
+            connection, _ = server.accept()
+            with connection:
+                data = b""
+                while chunk := connection.recv(1024):
+                    data += chunk
+                received.append(data)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        SocketBackend("127.0.0.1", port).write(b"receipt")
+        thread.join(timeout=5)
+        server.close()
+        self.assertEqual(received, [b"receipt"])
+
+        with self.assertRaises(PrinterBackendException):
+            SocketBackend("127.0.0.1", port, timeout=0.5).write(b"receipt")
+
+    def test_socket_backend_status_poll(self):
+        """
+        Test that the answer to the status request confirms the job and a silent printer is no longer polled
+        """
+        server = socket.create_server(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        received = []
+        waited = threading.Event()
+
+        def serve(answer):
+            connection, _ = server.accept()
+            with connection:
+                data = b""
+                while chunk := connection.recv(1024):
+                    data += chunk
+                received.append(data)
+                if answer:
+                    connection.sendall(b"\x12")
+                else:
+                    waited.wait(5)
+
+        backend = SocketBackend("127.0.0.1", port, status_poll=True)
+        thread = threading.Thread(target=serve, args=(True,))
+        thread.start()
+        self.assertTrue(backend.wait_for_completion(backend.write(b"receipt"), timeout=5))
+        thread.join(timeout=5)
+        self.assertEqual(received, [b"receipt\x1D\x72\x01"])
+
+        silent = SocketBackend("127.0.0.1", port, status_poll=True)
+        thread = threading.Thread(target=serve, args=(False,))
+        thread.start()
+        self.assertIsNone(silent.wait_for_completion(silent.write(b"receipt"), timeout=0.2))
+        waited.set()
+        thread.join(timeout=5)
+        self.assertFalse(silent.status_poll)
+        server.close()
+
+    def test_win32_cancel_deletes_job(self):
+        """
+        Test that cancelling a failed job deletes it from the Windows spooler
+        """
+        calls = []
+
+        class FakeWin32Print:
+            JOB_CONTROL_DELETE = 5
+
+            def OpenPrinter(self, name):
+                return name
+
+            def SetJob(self, handle, job, level, info, command):
+                calls.append((handle, job, command))
+
+            def ClosePrinter(self, handle):
+                pass
+
+        backend = Win32Backend("Xprinter")
+        backend.win32print = FakeWin32Print()
+        backend.cancel(42)
+        self.assertEqual(calls, [("Xprinter", 42, 5)])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
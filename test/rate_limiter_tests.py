@@ -0,0 +1,41 @@
+import unittest
+
+from src.auth.rate_limiter import RateLimiter
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_bucket_allows_burst_then_refills(self):
+        """
+        Test that a key gets burst attempts at once and one more per 1/rate seconds
+        """
+        limiter = RateLimiter(rate=0.5, burst=3)
+        self.assertEqual([limiter.acquire("10.0.0.1", now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("10.0.0.1", now=0), 2.0)
+        self.assertEqual(limiter.acquire("10.0.0.2", now=0), 0)
+        self.assertEqual(limiter.acquire("10.0.0.1", now=2), 0)
+        self.assertGreater(limiter.acquire("10.0.0.1", now=2), 0)
+
+    def test_refund_gives_token_back(self):
+        """
+        Test that a refunded token can be taken again and the bucket never grows over burst
+        """
+        limiter = RateLimiter(rate=1.0, burst=1)
+        self.assertEqual(limiter.acquire("key", now=0), 0)
+        limiter.refund("key", now=0)
+        self.assertEqual(limiter.acquire("key", now=0), 0)
+        limiter.refund("key", now=5)
+        self.assertEqual(limiter.buckets["key"], (1, 5))
+
+    def test_full_buckets_are_pruned(self):
+        """
+        Test that buckets which refilled are forgotten when there are too many keys
+        """
+        limiter = RateLimiter(rate=1.0, burst=2, max_keys=2)
+        limiter.acquire("a", now=0)
+        limiter.acquire("b", now=0)
+        limiter.acquire("c", now=10)
+        self.assertEqual(list(limiter.buckets), ["c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+
+from src.models.task import Task
+from src.spooler.render_pipeline import RenderPipeline
+from src.spooler.task_list import TaskList
+
+
+class RenderPipelineTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.task_list = TaskList(max_size=20)
+        self.rendered = []
+        self.pipeline = RenderPipeline(self.task_list, workers=2, lookahead=2, poll_interval=0.01)
+        self.pipeline.register("58", lambda task: True, self.render)
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.pipeline.stop()
+
+    def render(self, task):
+        self.rendered.append(task.file_path)
+        return task.file_path.encode()
+
+    def wait_rendered(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.rendered) < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_renders_window_in_priority_order(self):
+        """
+        Test that only the first tasks of the queue are rendered ahead and taken after pop
+        """
+        for name, priority in [("c", 3), ("a", 1), ("b", 2)]:
+            self.task_list.append(Task(name, 1, priority, "user", file_path=name))
+        self.pipeline.start()
+        self.wait_rendered(2)
+        time.sleep(0.05)
+        self.assertEqual(sorted(self.rendered), ["a", "b"])
+
+        task = self.task_list.pop()
+        self.assertEqual(self.pipeline.take(task, "58"), b"a")
+        self.assertIsNone(self.pipeline.take(task, "58"))
+        self.wait_rendered(3)
+
+    def test_cancelled_render_is_dropped(self):
+        """
+        Test that a cancelled task does not keep its render and unknown profiles are not rendered
+        """
+        task = Task("doc", 1, 1, "user", file_path="doc")
+        self.task_list.append(task)
+        self.pipeline.start()
+        self.wait_rendered(1)
+
+        self.task_list.cancel(task.task_id)
+        time.sleep(0.05)
+        self.task_list.append(Task("other", 1, 1, "user", file_path="other"))
+        self.wait_rendered(2)
+        time.sleep(0.05)
+        self.assertIsNone(self.pipeline.take(task, "58"))
+        self.assertIsNone(self.pipeline.take(self.task_list.pop(), "80"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,76 @@
 import unittest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, AsyncMock
+import asyncio
+import hashlib
 import io
+import os
+import threading
+import zipfile
 
-from main import app, task_list, manager, INDEX_FILE
+from datetime import datetime, timedelta
 
-class MockPrinter:
+from main import app, task_list, manager, upload_store, publisher, ConnectionManager, INDEX_FILE, UPLOAD_DIR
+from src.auth.session_manager import require_auth
+from src.routes import tasks as task_routes
+from src.auth.rate_limiter import RateLimiter
+from src.spooler.document_cache import DocumentArtifact
+from src.models.task import Task
+
+TEST_SESSIONS = {
+    "test-token": {
+        "username": "test_user",
+        "created": datetime.now().isoformat(),
+        "expires": (datetime.now() + timedelta(hours=1)).isoformat()
+    }
+}
+
+def _damaged_zip():
+    """
+    Builds a zip with a good member, an encrypted member and a member with a corrupt deflate stream
+    """
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("good.pdf", b"good receipt")
+        zf.writestr("secret.pdf", b"secret receipt")
+        zf.writestr("corrupt.pdf", b"corrupt receipt " * 50)
+    data = bytearray(archive.getvalue())
+    for signature, flag_offset in ((b"PK\x03\x04", 6), (b"PK\x01\x02", 8)):
+        start = 0
+        while (header := data.find(signature, start)) >= 0:
+            start = header + 4
+            if 0 <= data.find(b"secret.pdf", header) - header < 50:
+                data[header + flag_offset] |= 0x1
+    corrupt = data.find(b"corrupt.pdf") + len("corrupt.pdf")
+    for i in range(corrupt + 2, corrupt + 20):
+        data[i] ^= 0xFF
+    return io.BytesIO(bytes(data))
+
+class MockPrinterPool:
+    version = 0
+
+    @classmethod
+    def from_config(cls, *args, **kwargs):
+        return cls()
     def start(self):
         pass
     def stop(self):
         pass
+    def can_serve(self, task):
+        return True
     def get_status(self):
-        return {
+        return [{
+            'name': 'MockPrinter',
+            'printer_name': 'Xprinter',
+            'paper_width_mm': 58,
+            'capabilities': ['58mm'],
             'running': True,
             'current_task': None,
             'is_printing': False
-        }
+        }]
 
 
-@patch('main.Printer', new=MockPrinter)
+@patch('main.PrinterPool', new=MockPrinterPool)
 class TestMainApp(unittest.TestCase):
 
     def setUp(self):
@@ -26,8 +78,10 @@ class TestMainApp(unittest.TestCase):
         Method for preparation before every test.
         """
         self.client = TestClient(app)
+        self.client.cookies.set("session_token", "test-token")
+        app.dependency_overrides[require_auth] = lambda: "test_user"
 
-        app.state.printer = MockPrinter()
+        app.state.printer_pool = MockPrinterPool()
 
         task_list.clear()
         manager.active_connections.clear()
@@ -39,10 +93,13 @@ class TestMainApp(unittest.TestCase):
         with task_list.not_empty:
             task_list.not_empty.notify_all()
 
-        if hasattr(app.state, 'printer'):
-            del app.state.printer
+        app.dependency_overrides.clear()
 
-    def test_get_root(self):
+        if hasattr(app.state, 'printer_pool'):
+            del app.state.printer_pool
+
+    @patch('src.routes.pages.get_current_user', return_value="test_user")
+    def test_get_root(self, mock_user):
         """
         Testing if main page returns HTML.
         """
@@ -64,10 +121,46 @@ class TestMainApp(unittest.TestCase):
         self.assertIsNone(data["current_task"])
         self.assertEqual(data["queue_tasks"], [])
 
-    @patch('main.manager.broadcast_json', new_callable=AsyncMock)
+    def test_system_state_etag(self):
+        """
+        Testing that /system-state/ answers a matching If-None-Match with 304 until the state changes.
+        """
+        response = self.client.get("/system-state/")
+        etag = response.headers["ETag"]
+
+        cached = self.client.get("/system-state/", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers["ETag"], etag)
+
+        task_list.append(Task("changed", 1, 1, "user"))
+        changed = self.client.get("/system-state/", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+        self.assertEqual(changed.json()["queue_length"], 1)
+
+    @patch('main.manager.broadcast_state', new_callable=AsyncMock)
+    def test_system_state_long_poll(self, mock_broadcast_state):
+        """
+        Testing that a long-poll returns when the state changes and 304 when the wait ends without a change.
+        """
+        etag = self.client.get("/system-state/").headers["ETag"]
+
+        timed_out = self.client.get("/system-state/?wait=0.1", headers={"If-None-Match": etag})
+        self.assertEqual(timed_out.status_code, 304)
+
+        def change():
+            task_list.append(Task("changed", 1, 1, "user"))
+            asyncio.run(publisher.publish())
+
+        threading.Timer(0.1, change).start()
+        changed = self.client.get("/system-state/?wait=5", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["queue_length"], 1)
+
+    @patch('main.manager.broadcast_state', new_callable=AsyncMock)
     @patch('main.manager.broadcast', new_callable=AsyncMock)
-    @patch('main.get_page_count', return_value=5)
-    def test_create_task_endpoint(self, mock_get_pages, mock_broadcast, mock_broadcast_json):
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 5))
+    def test_create_task_endpoint(self, mock_analyze, mock_broadcast, mock_broadcast_state):
         """
         Testing /tasks/ endpoint.
         """
@@ -82,17 +175,258 @@ class TestMainApp(unittest.TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()["task_id"], "test.pdf")
+        task_id = response.json()["task_id"]
+        self.assertEqual(task_list.get(task_id).name, "test.pdf")
+
+        mock_analyze.assert_called_once()
+        self.assertEqual(len(task_list), 1)
+
+        mock_broadcast.assert_called_once()
+        mock_broadcast_state.assert_called_once()
+
+
+    @patch('src.routes.tasks.UPLOAD_CHUNK_SIZE', 4)
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 1))
+    def test_create_task_streams_upload(self, mock_analyze):
+        """
+        Testing that the upload is written in chunks and hashed, and too large uploads are refused.
+        """
+        content = b"0123456789" * 3
+        response = self.client.post(
+            "/tasks/",
+            data={"username": "test_user", "priority": 1},
+            files={"file": ("stream.txt", io.BytesIO(content), "text/plain")}
+        )
+        task = task_list.get(response.json()["task_id"])
+        self.assertEqual(task.content_hash, hashlib.sha256(content).hexdigest())
+        with open(task.file_path, "rb") as f:
+            self.assertEqual(f.read(), content)
+        upload_store.release(task.file_path)
 
-        mock_get_pages.assert_called_once()
+        with patch('src.routes.tasks.MAX_UPLOAD_SIZE', 10):
+            response = self.client.post(
+                "/tasks/",
+                data={"username": "test_user", "priority": 1},
+                files={"file": ("big.txt", io.BytesIO(content), "text/plain")}
+            )
+        self.assertEqual(response.status_code, 413)
         self.assertEqual(len(task_list), 1)
+        self.assertEqual(os.listdir(upload_store.incoming), [])
+
+    @patch('main.manager.broadcast_state', new_callable=AsyncMock)
+    @patch('main.manager.broadcast', new_callable=AsyncMock)
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 1))
+    def test_same_document_is_stored_once(self, mock_analyze, mock_broadcast, mock_broadcast_state):
+        """
+        Testing that resubmitted content shares one stored file which is deleted with the last task.
+        """
+        task_ids = []
+        for name in ["invoice.pdf", "invoice_copy.pdf"]:
+            response = self.client.post(
+                "/tasks/",
+                data={"username": "test_user", "priority": 1},
+                files={"file": (name, io.BytesIO(b"same invoice"), "application/pdf")}
+            )
+            task_ids.append(response.json()["task_id"])
+
+        first, second = (task_list.get(task_id) for task_id in task_ids)
+        self.assertEqual(first.file_path, second.file_path)
+        self.assertEqual(os.path.dirname(first.file_path), UPLOAD_DIR)
+
+        self.assertEqual(self.client.delete(f"/tasks/{first.task_id}").status_code, 200)
+        self.assertTrue(os.path.exists(second.file_path))
+        self.assertEqual(self.client.delete(f"/tasks/{second.task_id}").status_code, 200)
+        self.assertFalse(os.path.exists(second.file_path))
 
+    @patch('main.manager.broadcast_state', new_callable=AsyncMock)
+    @patch('main.manager.broadcast', new_callable=AsyncMock)
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 2))
+    def test_create_batch_endpoint(self, mock_analyze, mock_broadcast, mock_broadcast_state):
+        """
+        Testing /tasks/batch with plain files and a zip, enqueued together with one broadcast.
+        """
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("receipts/r1.pdf", b"receipt one")
+            zf.writestr("receipts/r2.pdf", b"receipt two")
+        archive.seek(0)
+
+        response = self.client.post(
+            "/tasks/batch",
+            data={"username": "kiosk", "priority": 2},
+            files=[
+                ("files", ("a.pdf", io.BytesIO(b"receipt one"), "application/pdf")),
+                ("files", ("stack.zip", archive, "application/zip")),
+                ("files", ("broken.zip", io.BytesIO(b"not a zip"), "application/zip")),
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["file"] for result in results], ["a.pdf", "r1.pdf", "r2.pdf", "broken.zip"])
+        self.assertIn("error", results[3])
+        tasks = [task_list.get(result["task_id"]) for result in results[:3]]
+        self.assertEqual(len(task_list), 3)
+        self.assertEqual(tasks[0].file_path, tasks[1].file_path)
         mock_broadcast.assert_called_once()
-        mock_broadcast_json.assert_called_once()
+        mock_broadcast_state.assert_called_once()
 
+        self.client.delete(f"/tasks/{tasks[0].task_id}")
+        mock_broadcast.reset_mock()
+        full = self.client.post(
+            "/tasks/batch",
+            data={"username": "kiosk", "priority": 2},
+            files=[("files", (f"{i}.pdf", io.BytesIO(b"x%d" % i), "application/pdf")) for i in range(9)]
+        )
+        self.assertEqual(full.status_code, 503)
+        self.assertEqual(len(task_list), 2)
+        self.assertTrue(all("error" in result for result in full.json()["results"]))
+        mock_broadcast.assert_not_called()
+        for task in tasks[1:]:
+            self.client.delete(f"/tasks/{task.task_id}")
 
-    @patch('main.get_page_count', return_value=1)
-    def test_websocket_broadcast_on_new_task(self, mock_get_pages):
+    @patch('main.manager.broadcast', new_callable=AsyncMock)
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 1))
+    def test_batch_larger_than_queue_is_rejected(self, mock_analyze, mock_broadcast):
+        """
+        Testing that a batch with more files than the queue holds gets 413 without Retry-After and keeps no files.
+        """
+        stored = len(task_routes.upload_store)
+        files = [("files", (f"{i}.pdf", io.BytesIO(b"z%d" % i), "application/pdf"))
+                 for i in range(task_list.max_size + 1)]
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i in range(task_list.max_size + 5):
+                zf.writestr(f"{i}.pdf", b"zip%d" % i)
+        archive.seek(0)
+
+        for batch in (files, [("files", ("many.zip", archive, "application/zip"))]):
+            response = self.client.post("/tasks/batch", data={"username": "kiosk", "priority": 2}, files=batch)
+            self.assertEqual(response.status_code, 413)
+            self.assertNotIn("retry-after", response.headers)
+            self.assertTrue(all("error" in result for result in response.json()["results"]))
+        self.assertEqual(len(task_list), 0)
+        self.assertEqual(len(task_routes.upload_store), stored)
+        mock_broadcast.assert_not_called()
+
+    @patch('main.manager.broadcast_state', new_callable=AsyncMock)
+    @patch('main.manager.broadcast', new_callable=AsyncMock)
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 1))
+    def test_batch_with_damaged_zip_members(self, mock_analyze, mock_broadcast, mock_broadcast_state):
+        """
+        Testing that encrypted and corrupt zip members become per-file errors and a failing batch releases its files.
+        """
+        stored = len(task_routes.upload_store)
+        response = self.client.post(
+            "/tasks/batch",
+            data={"username": "kiosk", "priority": 2},
+            files=[("files", ("damaged.zip", _damaged_zip(), "application/zip"))]
+        )
+        self.assertEqual(response.status_code, 200)
+        results = {result["file"]: result for result in response.json()["results"]}
+        self.assertIn("task_id", results["good.pdf"])
+        self.assertIn("error", results["secret.pdf"])
+        self.assertIn("error", results["corrupt.pdf"])
+        self.assertEqual(len(task_routes.upload_store), stored + 1)
+        self.client.delete(f"/tasks/{results['good.pdf']['task_id']}")
+        self.assertEqual(len(task_routes.upload_store), stored)
+
+        with patch.object(task_list, 'async_extend', new_callable=AsyncMock, side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.client.post(
+                    "/tasks/batch",
+                    data={"username": "kiosk", "priority": 2},
+                    files=[("files", (f"{i}.pdf", io.BytesIO(b"y%d" % i), "application/pdf")) for i in range(3)]
+                )
+        self.assertEqual(len(task_routes.upload_store), stored)
+
+    @patch('src.routes.auth.create_session', return_value="new-token")
+    @patch('src.auth.session_manager.authenticate_user')
+    def test_login_checks_password_off_the_event_loop(self, mock_authenticate, mock_create):
+        """
+        Test that the password is checked in the password thread pool and the session cookie is set
+        """
+        threads = []
+        mock_authenticate.side_effect = lambda username, password: threads.append(threading.current_thread().name) or True
+
+        response = self.client.post("/api/login", data={"username": "alice", "password": "secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies.get("session_token"), "new-token")
+        self.assertTrue(threads[0].startswith("password"))
+
+    @patch('src.routes.auth.get_session_stats', return_value={"mode": "store", "live": 3, "expired": 1, "pending": 0})
+    def test_session_stats_endpoint(self, mock_stats):
+        """
+        Testing that /api/sessions/stats returns the session metrics.
+        """
+        response = self.client.get("/api/sessions/stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["live"], 3)
+
+    @patch('src.routes.auth.authenticate_user_async', new_callable=AsyncMock, return_value=False)
+    def test_login_is_rate_limited(self, mock_authenticate):
+        """
+        Test that login attempts beyond the bucket of the user get 429 without checking the password
+        """
+        with patch('src.routes.auth.ip_limiter', RateLimiter(rate=0.01, burst=100)), \
+                patch('src.routes.auth.user_limiter', RateLimiter(rate=0.01, burst=2)):
+            responses = [self.client.post("/api/login", data={"username": "alice", "password": "guess"})
+                         for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [401, 401, 429])
+        self.assertIn("retry-after", responses[2].headers)
+        self.assertEqual(mock_authenticate.await_count, 2)
+
+    @patch('src.routes.auth.create_session', return_value="new-token")
+    @patch('src.routes.auth.authenticate_user_async', new_callable=AsyncMock)
+    def test_login_not_blocked_by_failures_of_others(self, mock_authenticate, mock_create):
+        """
+        Test that failed attempts from another address and successful logins do not spend the user's bucket
+        """
+        mock_authenticate.side_effect = lambda username, password: password == "right"
+        limiter = RateLimiter(rate=0.01, burst=2)
+        for _ in range(5):
+            limiter.acquire(("alice", "10.0.0.9"))
+
+        with patch('src.routes.auth.ip_limiter', RateLimiter(rate=0.01, burst=100)), \
+                patch('src.routes.auth.user_limiter', limiter):
+            responses = [self.client.post("/api/login", data={"username": "alice", "password": "right"})
+                         for _ in range(4)]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+
+    @patch('src.routes.auth.authenticate_user_async', new_callable=AsyncMock)
+    def test_login_takes_tokens_before_password_check(self, mock_authenticate):
+        """
+        Test that the user's token is taken before the password is checked and failures on other
+        addresses count against the username
+        """
+        user_limiter, account_limiter = RateLimiter(rate=0.01, burst=1), RateLimiter(rate=0.01, burst=3)
+        charged = []
+
+        async def authenticate(username, password):
+            charged.append(user_limiter.acquire((username, "testclient")) > 0)
+            return False
+
+        mock_authenticate.side_effect = authenticate
+        for _ in range(3):
+            account_limiter.acquire("bob")
+
+        with patch('src.routes.auth.ip_limiter', RateLimiter(rate=0.01, burst=100)), \
+                patch('src.routes.auth.user_limiter', user_limiter), \
+                patch('src.routes.auth.account_limiter', account_limiter):
+            guess = self.client.post("/api/login", data={"username": "alice", "password": "guess"})
+            other_addresses = self.client.post("/api/login", data={"username": "bob", "password": "guess"})
+
+        self.assertEqual(guess.status_code, 401)
+        self.assertEqual(charged, [True])
+        self.assertEqual(other_addresses.status_code, 429)
+        self.assertEqual(user_limiter.acquire(("bob", "testclient")), 0)
+
+    @patch('src.routes.tasks.analyze_document', return_value=DocumentArtifact("hash", 1))
+    @patch('main.get_session', side_effect=TEST_SESSIONS.get)
+    def test_websocket_broadcast_on_new_task(self, mock_session, mock_analyze):
         """
         Testing if WebSocket client gets a message after adding a task.
         """
@@ -101,6 +435,9 @@ class TestMainApp(unittest.TestCase):
             greeting = websocket.receive_text()
             self.assertIn("Successfully connected", greeting)
 
+            snapshot = websocket.receive_json()
+            self.assertEqual(snapshot["type"], "system_state")
+            self.assertEqual(snapshot["data"]["queue_length"], 0)
             self.assertEqual(len(manager.active_connections), 1)
 
             self.client.post(
@@ -112,11 +449,104 @@ class TestMainApp(unittest.TestCase):
             text_message = websocket.receive_text()
             self.assertIn("NEW: New task added report.txt", text_message)
 
-            json_state = websocket.receive_json()
-            self.assertEqual(json_state["type"], "system_state")
-            self.assertEqual(json_state["data"]["queue_length"], 1)
+            delta = websocket.receive_json()
+            self.assertEqual(delta["type"], "state_delta")
+            self.assertEqual(delta["base"], snapshot["version"])
+            ops = {op["op"]: op for op in delta["ops"] if op["op"] != "set"}
+            self.assertEqual(ops["task_added"]["task"]["name"], "report.txt")
+            self.assertIn({"op": "set", "field": "queue_length", "value": 1}, delta["ops"])
+
+            websocket.send_text("resync")
+            resync = websocket.receive_json()
+            self.assertEqual(resync["type"], "system_state")
+            self.assertEqual(resync["version"], delta["version"])
+            self.assertEqual(resync["data"]["queue_length"], 1)
 
         self.assertEqual(len(manager.active_connections), 0)
 
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.client = "fake"
+        self.sent = []
+        self.closed = None
+        self.blocked = blocked
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.blocked:
+            await asyncio.Event().wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+class TestConnectionManager(unittest.TestCase):
+    def test_slow_client_does_not_delay_others(self):
+        """
+        Testing that broadcast returns at once and a stuck client is disconnected while others get every message.
+        """
+        async def run():
+            connections = ConnectionManager(backlog=4, send_timeout=0.05)
+            fast, stuck = FakeWebSocket(), FakeWebSocket()
+            await connections.connect(fast)
+            await connections.connect(stuck)
+            stuck.blocked = True
+
+            for number in range(3):
+                await connections.broadcast(f"message {number}")
+            await connections.broadcast_json({"type": "system_state"})
+            await asyncio.sleep(0.2)
+            return connections, fast, stuck
+
+        connections, fast, stuck = asyncio.run(run())
+        self.assertEqual(fast.sent[1:], ["message 0", "message 1", "message 2", '{"type": "system_state"}'])
+        self.assertEqual(connections.active_connections, [fast])
+        self.assertIsNotNone(stuck.closed)
+
+    def test_client_behind_backlog_is_disconnected(self):
+        """
+        Testing that a client which falls further behind than the backlog is disconnected.
+        """
+        async def run():
+            connections = ConnectionManager(backlog=2, send_timeout=1)
+            lagging = FakeWebSocket()
+            await connections.connect(lagging)
+            for number in range(5):
+                await connections.broadcast(f"message {number}")
+            await asyncio.sleep(0.05)
+            return connections, lagging
+
+        connections, lagging = asyncio.run(run())
+        self.assertEqual(connections.active_connections, [])
+        self.assertEqual(len(lagging.sent), 1)
+        self.assertIsNotNone(lagging.closed)
+
+    def test_idle_writers_share_one_wakeup(self):
+        """
+        Testing that idle writers wait on one shared event and a broadcast from a thread wakes them with one call.
+        """
+        async def run():
+            connections = ConnectionManager(backlog=4, send_timeout=1)
+            clients = [FakeWebSocket() for _ in range(5)]
+            for client in clients:
+                await connections.connect(client)
+            await asyncio.sleep(0.05)
+            shared = len(connections.wakeups), len(set(connections.wakeups.values()))
+
+            loop = asyncio.get_running_loop()
+            with patch.object(loop, 'call_soon_threadsafe', wraps=loop.call_soon_threadsafe) as wake:
+                await asyncio.to_thread(connections._publish, "message")
+                calls = [args for args, _ in wake.call_args_list if getattr(args[0], '__name__', None) == 'set']
+            await asyncio.sleep(0.05)
+            return connections, clients, shared, calls
+
+        connections, clients, shared, calls = asyncio.run(run())
+        self.assertEqual(shared, (1, 1))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(client.sent[-1] == "message" for client in clients))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
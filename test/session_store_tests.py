@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from src.auth.database import Database
+from src.auth.session_store import SessionStore
+
+
+class SessionStoreTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database = Database(os.path.join(self.tmp.name, "spooler.db"))
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.database.close()
+        self.tmp.cleanup()
+
+    def test_changes_are_written_on_close_and_reloaded(self):
+        """
+        Test that sessions stay in memory until flushed and are read back by a new store
+        """
+        store = SessionStore(self.database)
+        token = store.create("alice", timedelta(hours=1))
+        removed = store.create("bob", timedelta(hours=1))
+        store.flush()
+        self.assertTrue(store.delete(removed))
+        self.assertFalse(store.delete(removed))
+        self.assertEqual(len(self.database.load_sessions()), 2)
+
+        store.close()
+        self.assertEqual(list(self.database.load_sessions()), [token])
+
+        reloaded = SessionStore(self.database)
+        self.assertEqual(reloaded.get(token)["username"], "alice")
+        self.assertIsNone(reloaded.get(removed))
+
+    def test_expired_sessions_are_removed(self):
+        """
+        Test that an expired session is not returned and purge_expired removes only expired sessions
+        """
+        store = SessionStore(self.database)
+        short = store.create("alice", timedelta(minutes=1))
+        long = store.create("bob", timedelta(hours=1))
+        later = datetime.now() + timedelta(minutes=5)
+
+        self.assertIsNone(store.get(short, now=later))
+        self.assertEqual(store.purge_expired(now=later), 0)
+        self.assertEqual(store.purge_expired(now=later + timedelta(hours=1)), 1)
+        self.assertIsNone(store.get(long))
+        self.assertEqual(len(store), 0)
+
+    def test_writer_thread_batches_changes(self):
+        """
+        Test that the writer thread writes the changes without close and replace drops the other sessions
+        """
+        store = SessionStore(self.database, flush_interval=0.05)
+        store.start()
+        tokens = [store.create(f"user{i}", timedelta(hours=1)) for i in range(20)]
+        time.sleep(0.3)
+        self.assertEqual(sorted(self.database.load_sessions()), sorted(tokens))
+
+        kept = {tokens[0]: store.get(tokens[0])}
+        store.replace(kept)
+        store.close()
+        self.assertEqual(self.database.load_sessions(), kept)
+
+
+    def test_sweeper_removes_expired_sessions(self):
+        """
+        Test that the writer thread purges expired sessions without lookups and counts them in stats
+        """
+        store = SessionStore(self.database, flush_interval=0.02, sweep_interval=0.05)
+        store.create("alice", timedelta(milliseconds=50))
+        live = store.create("bob", timedelta(hours=1))
+        store.start()
+        time.sleep(0.4)
+        store.close()
+
+        self.assertEqual(store.stats(), {"live": 1, "expired": 1, "pending": 0})
+        self.assertEqual(list(self.database.load_sessions()), [live])
+        self.assertEqual(len(store.expiry_heap), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.auth.database import Database
+from src.auth.signed_tokens import TokenSigner, SignedTokenException
+
+
+class TokenSignerTests(unittest.TestCase):
+    def test_sign_and_verify(self):
+        """
+        Test that a signed token carries the username and expiry and is rejected after it expires
+        """
+        signer = TokenSigner("secret")
+        expires = int(time.time()) + 60
+        token = signer.sign("alice", expires)
+
+        self.assertEqual(signer.verify(token), {"username": "alice", "expires": expires})
+        self.assertIsNone(signer.verify(token, now=expires + 1))
+        self.assertRaises(SignedTokenException, TokenSigner, "")
+
+    def test_tampered_tokens_are_rejected(self):
+        """
+        Test that tokens with a changed payload, a foreign key or garbage are rejected
+        """
+        signer = TokenSigner("secret")
+        token = signer.sign("alice", time.time() + 60)
+        forged = TokenSigner("other").sign("admin", time.time() + 60)
+        payload, signature = token.split(".")
+
+        self.assertIsNone(signer.verify(forged))
+        self.assertIsNone(signer.verify(forged.split(".")[0] + "." + signature))
+        self.assertIsNone(signer.verify(payload))
+        self.assertIsNone(signer.verify("not-a-token"))
+        self.assertIsNone(signer.verify("ä.ö"))
+
+    def test_revocation_is_shared_through_database(self):
+        """
+        Test that a token revoked by one process is rejected by another process with the same secret
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Database(os.path.join(tmp, "spooler.db"))
+            first, second = TokenSigner("secret"), TokenSigner("secret")
+            token = first.sign("alice", time.time() + 60)
+            self.assertIsNotNone(second.verify(token))
+
+            now = time.time()
+            database.revoke_token(*first.revoke(token, now), now)
+            self.assertIsNone(first.verify(token))
+            self.assertIsNone(first.revoke(token))
+
+            second.add_revoked(database.load_revoked(now), now)
+            self.assertIsNone(second.verify(token))
+            second.add_revoked({}, now + 120)
+            self.assertEqual(second.revoked, {})
+            database.close()
+
+    def test_revoked_token_with_other_signature_spelling_is_rejected(self):
+        """
+        Test that changing the unused bits in the last signature character does not bring back a revoked token
+        """
+        signer = TokenSigner("secret")
+        token = signer.sign("alice", time.time() + 60)
+        self.assertIsNotNone(signer.revoke(token))
+
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+        for character in alphabet:
+            self.assertIsNone(signer.verify(token[:-1] + character))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+
+from src.spooler.state_publisher import StatePublisher
+
+
+class RecordingManager:
+    def __init__(self):
+        self.frames = []
+        self.states = []
+
+    async def broadcast(self, message):
+        self.frames.append(message)
+
+    async def broadcast_state(self, state):
+        self.states.append(state)
+
+
+class StatePublisherTests(unittest.TestCase):
+    def test_burst_is_coalesced(self):
+        """
+        Test that a burst of changes gives one immediate push and one push with the rest after the interval
+        """
+        manager = RecordingManager()
+        counter = {"value": 0}
+
+        async def state():
+            return counter["value"]
+
+        async def run():
+            publisher = StatePublisher(manager, state, interval=0.1)
+            publisher.start(asyncio.get_running_loop())
+            for number in range(50):
+                counter["value"] = number
+                await publisher.publish(f"NEW: {number}")
+                await asyncio.sleep(0)
+            self.assertTrue(await publisher.wait(1))
+            await asyncio.sleep(0.3)
+
+        asyncio.run(run())
+        self.assertEqual(len(manager.frames), 2)
+        self.assertEqual("\n".join(manager.frames).split("\n"), [f"NEW: {number}" for number in range(50)])
+        self.assertEqual(len(manager.states), 2)
+        self.assertEqual(manager.states[-1], 49)
+
+    def test_without_state_func_only_events_are_sent(self):
+        """
+        Test that a publisher without a state function sends the events and skips the state push
+        """
+        manager = RecordingManager()
+
+        async def run():
+            publisher = StatePublisher(manager, None, interval=0.01)
+            publisher.start(asyncio.get_running_loop())
+            publisher.notify("START: receipt")
+            self.assertTrue(await publisher.wait(1))
+            await asyncio.sleep(0.05)
+            self.assertEqual(publisher.push_tasks, set())
+
+        asyncio.run(run())
+        self.assertEqual(manager.frames, ["START: receipt"])
+        self.assertEqual(manager.states, [])
+
+    def test_not_started_pushes_immediately(self):
+        """
+        Test that without a loop every publish is pushed right away
+        """
+        manager = RecordingManager()
+
+        async def state():
+            return "state"
+
+        async def run():
+            publisher = StatePublisher(manager, state)
+            await publisher.publish("first")
+            await publisher.publish()
+
+        asyncio.run(run())
+        self.assertEqual(manager.frames, ["first"])
+        self.assertEqual(manager.states, ["state", "state"])
+
+if __name__ == '__main__':
+    unittest.main()
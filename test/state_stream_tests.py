@@ -0,0 +1,69 @@
+import random
+import unittest
+
+from src.spooler.state_stream import StateStream, diff_states
+
+
+def apply_ops(state, ops):
+    """
+    Applies delta operations the same way static/app.js does
+    """
+    state = dict(state, queue_tasks=list(state["queue_tasks"]), printers=list(state["printers"]))
+    leaving = {op["id"] for op in ops if op["op"] in ("task_removed", "task_moved")}
+    state["queue_tasks"] = [task for task in state["queue_tasks"] if task["id"] not in leaving]
+    for op in ops:
+        if op["op"] in ("task_added", "task_moved"):
+            state["queue_tasks"].insert(op["index"], op["task"])
+        elif op["op"] == "printer":
+            names = [printer["name"] for printer in state["printers"]]
+            if op["printer"]["name"] in names:
+                state["printers"][names.index(op["printer"]["name"])] = op["printer"]
+            else:
+                state["printers"].append(op["printer"])
+        elif op["op"] == "set":
+            state[op["field"]] = op["value"]
+    return state
+
+
+def make_state(tasks, printer_status="idle"):
+    return {
+        "printer_status": printer_status,
+        "printers": [{"name": "MainPrinter", "status": printer_status}],
+        "queue_length": len(tasks),
+        "queue_tasks": tasks
+    }
+
+
+class StateStreamTests(unittest.TestCase):
+    def test_deltas_rebuild_the_new_state(self):
+        """
+        Test that applying the delta to the old state gives the new state for random queue changes
+        """
+        generator = random.Random(7)
+        tasks = [{"id": str(i), "priority": generator.randint(1, 5)} for i in range(30)]
+        old = make_state(tasks[:20])
+        for _ in range(200):
+            new_tasks = [dict(task) for task in generator.sample(tasks, generator.randint(0, 30))]
+            for task in generator.sample(new_tasks, min(3, len(new_tasks))):
+                task["priority"] += 1
+            new = make_state(new_tasks, generator.choice(["idle", "printing"]))
+            self.assertEqual(apply_ops(old, diff_states(old, new)), new)
+            old = new
+
+    def test_delta_only_sends_changes(self):
+        """
+        Test that appending one task sends one operation for it, and unchanged states are not versioned
+        """
+        stream = StateStream()
+        tasks = [{"id": str(i), "priority": 1} for i in range(10)]
+        first = stream.update(make_state(tasks))
+        self.assertEqual((first["type"], first["version"]), ("system_state", 1))
+        self.assertIsNone(stream.update(make_state(list(tasks))))
+
+        delta = stream.update(make_state(tasks[1:] + [{"id": "new", "priority": 1}]))
+        self.assertEqual((delta["type"], delta["version"], delta["base"]), ("state_delta", 2, 1))
+        self.assertEqual([op["op"] for op in delta["ops"]], ["task_removed", "task_added"])
+        self.assertEqual(stream.snapshot()["version"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
+import asyncio
+import threading
 import unittest
-from src.spooler.task_list import TaskList, TaskListException
+from src.spooler.task_list import TaskList, TaskListException, TaskListFullException, TaskListEmptyException
+from src.spooler.policies import FairSharePolicy, ShortestJobAgingPolicy, SchedulingPolicyException
 from src.models.task import Task
 
 
@@ -89,5 +92,265 @@ class TestTaskList(unittest.TestCase):
         ordered_tasks = task_list.get_all_tasks()
         self.assertEqual(ordered_tasks[0].name, "high_doc_2")
 
+    def test_invalid_engine(self):
+        """
+        Test that unknown engine name raises TaskListException
+        """
+        with self.assertRaises(TaskListException):
+            TaskList(engine="tree")
+
+    def test_engines_same_order(self):
+        """
+        Test that the linked list and heap engines pop tasks in the same order, FIFO within a priority
+        """
+        for engine in ("linked", "heap"):
+            task_list = TaskList(max_size=20, engine=engine)
+            for i, priority in enumerate([5, 1, 5, 3, 1, 5]):
+                task_list.append(Task(f"doc{i}", 1, priority, "user"))
+
+            names = [task.name for task in task_list.get_all_tasks()]
+            self.assertEqual(names, ["doc1", "doc4", "doc3", "doc0", "doc2", "doc5"], engine)
+
+            popped = [task_list.pop().name for _ in range(6)]
+            self.assertEqual(popped, names, engine)
+            self.assertEqual(len(task_list), 0)
+
+    def test_get_cancel_reprioritize(self):
+        """
+        Test lookup, cancel and reprioritize by task ID on both engines
+        """
+        for engine in ("linked", "heap"):
+            task_list = TaskList(engine=engine)
+            first = Task("first", 1, 1, "user")
+            second = Task("second", 1, 2, "user")
+            third = Task("third", 1, 3, "user")
+            for task in (first, second, third):
+                task_list.append(task)
+
+            self.assertIs(task_list.get(second.task_id), second)
+            self.assertIsNone(task_list.get("missing"))
+
+            self.assertIs(task_list.cancel(second.task_id), second)
+            self.assertIsNone(task_list.cancel(second.task_id))
+            self.assertIsNone(task_list.get(second.task_id))
+            self.assertEqual(len(task_list), 2)
+
+            self.assertIs(task_list.reprioritize(third.task_id, 0), third)
+            self.assertEqual(third.priority, 0)
+            self.assertIsNone(task_list.reprioritize("missing", 0))
+            self.assertEqual([task.name for task in task_list.get_all_tasks()], ["third", "first"], engine)
+
+            self.assertEqual(task_list.pop().name, "third")
+            self.assertEqual(task_list.pop().name, "first")
+            self.assertEqual(len(task_list), 0)
+
+    def test_non_blocking_full_and_empty(self):
+        """
+        Test that append and pop raise instead of blocking when asked not to wait
+        """
+        task_list = TaskList(max_size=1)
+        with self.assertRaises(TaskListEmptyException):
+            task_list.pop(block=False)
+        task_list.append(Task("doc1", 3, 1, "user"))
+        self.assertEqual(task_list.queued_pages, 3)
+        with self.assertRaises(TaskListFullException):
+            task_list.append(Task("doc2", 1, 1, "user"), timeout=0.01)
+        task_list.pop()
+        self.assertEqual(task_list.queued_pages, 0)
+
+    def test_async_append_timeout(self):
+        """
+        Test that async_append fails fast when the queue stays full
+        """
+        task_list = TaskList(max_size=1)
+        task_list.append(Task("doc1", 1, 1, "user"))
+
+        async def run():
+            with self.assertRaises(TaskListFullException):
+                await task_list.async_append(Task("doc2", 1, 1, "user"), timeout=0)
+            with self.assertRaises(TaskListFullException):
+                await task_list.async_append(Task("doc2", 1, 1, "user"), timeout=0.05)
+
+        asyncio.run(run())
+        self.assertEqual(len(task_list), 1)
+
+    def test_async_append_woken_by_thread_pop(self):
+        """
+        Test that an async producer waiting for a slot is woken when another thread pops
+        """
+        task_list = TaskList(max_size=1)
+        task_list.append(Task("doc1", 1, 1, "user"))
+
+        async def run():
+            threading.Timer(0.05, task_list.pop).start()
+            await task_list.async_append(Task("doc2", 1, 1, "user"), timeout=5)
+            return await task_list.async_pop(timeout=1)
+
+        self.assertEqual(asyncio.run(run()).name, "doc2")
+        self.assertEqual(len(task_list), 0)
+
+    def test_invalid_policy(self):
+        """
+        Test that a policy which is not a SchedulingPolicy raises TaskListException
+        """
+        with self.assertRaises(TaskListException):
+            TaskList(policy="fair")
+        with self.assertRaises(SchedulingPolicyException):
+            FairSharePolicy(weights={"bob": 0})
+
+    def test_fair_share_interleaves_users(self):
+        """
+        Test that a burst from one user does not starve another user on the fair share policy
+        """
+        for engine in ("linked", "heap"):
+            task_list = TaskList(max_size=20, engine=engine, policy=FairSharePolicy())
+            for i in range(5):
+                task_list.append(Task(f"burst{i}", 2, 1, "alice"))
+            task_list.append(Task("bob0", 2, 1, "bob"))
+            task_list.append(Task("bob1", 2, 1, "bob"))
+
+            popped = [task_list.pop().name for _ in range(7)]
+            self.assertEqual(popped[:4], ["burst0", "bob0", "burst1", "bob1"], engine)
+
+    def test_fair_share_weights_and_pages(self):
+        """
+        Test that the share is weighted and accounts for pages of each task
+        """
+        task_list = TaskList(max_size=20, policy=FairSharePolicy(weights={"boss": 2}))
+        task_list.append(Task("big", 10, 1, "alice"))
+        task_list.append(Task("after_big", 1, 1, "alice"))
+        for i in range(4):
+            task_list.append(Task(f"boss{i}", 4, 1, "boss"))
+
+        popped = [task_list.pop().name for _ in range(6)]
+        self.assertEqual(popped[0], "big")
+        self.assertLess(popped.index("boss3"), popped.index("after_big"))
+
+    def test_fair_share_refunds_cancelled_pages(self):
+        """
+        Test that a user who cancelled a big task is not charged for its pages
+        """
+        task_list = TaskList(max_size=20, policy=FairSharePolicy())
+        manual = Task("manual", 500, 1, "alice")
+        task_list.append(manual)
+        for i in range(5):
+            task_list.append(Task(f"bob{i}", 50, 1, "bob"))
+        task_list.cancel(manual.task_id)
+        task_list.append(Task("receipt", 1, 1, "alice"))
+
+        popped = [task_list.pop().name for _ in range(6)]
+        self.assertLessEqual(popped.index("receipt"), 1)
+
+    def test_shortest_job_aging(self):
+        """
+        Test that short jobs go first within a priority and long jobs age ahead of newer short jobs
+        """
+        now = [0.0]
+        task_list = TaskList(max_size=20, policy=ShortestJobAgingPolicy(aging_rate=1.0, clock=lambda: now[0]))
+
+        task_list.append(Task("manual", 200, 5, "user"))
+        task_list.append(Task("receipt", 1, 5, "user"))
+        task_list.append(Task("urgent", 50, 1, "user"))
+        self.assertEqual([task.name for task in task_list.get_all_tasks()], ["urgent", "receipt", "manual"])
+
+        now[0] = 300.0
+        task_list.append(Task("late_receipt", 1, 5, "user"))
+        self.assertEqual([task.name for task in task_list.get_all_tasks()],
+                         ["urgent", "receipt", "manual", "late_receipt"])
+
+        with self.assertRaises(SchedulingPolicyException):
+            ShortestJobAgingPolicy(aging_rate=0)
+
+    def test_snapshot_versioning(self):
+        """
+        Test that the snapshot is reused until the queue changes
+        """
+        task_list = TaskList()
+        first = task_list.snapshot()
+        self.assertEqual(first, (0, ()))
+
+        task = Task("doc1", 1, 5, "user")
+        task_list.append(task)
+        second = task_list.snapshot()
+        self.assertEqual(second[0], 1)
+        self.assertEqual(second[1], (task,))
+        self.assertIs(task_list.snapshot(), second)
+
+        task_list.reprioritize(task.task_id, 1)
+        self.assertGreater(task_list.snapshot()[0], second[0])
+
+    def test_pop_with_match(self):
+        """
+        Test that pop with match takes the first accepted task and keeps the rest in order
+        """
+        for engine in ("linked", "heap"):
+            task_list = TaskList(engine=engine)
+            task_list.append(Task("for_a", 1, 1, "user", printer="A"))
+            task_list.append(Task("for_b", 1, 2, "user", printer="B"))
+            task_list.append(Task("for_any", 1, 3, "user"))
+
+            accepts_b = lambda task: task.printer in (None, "B")
+            self.assertEqual(task_list.pop(match=accepts_b).name, "for_b", engine)
+            self.assertEqual(task_list.pop(match=accepts_b).name, "for_any", engine)
+            with self.assertRaises(TaskListEmptyException):
+                task_list.pop(block=False, match=accepts_b)
+            self.assertEqual(task_list.pop().name, "for_a", engine)
+
+    def test_pop_with_match_checks_each_task_once(self):
+        """
+        Test that pop with match checks every task in front of the accepted one once and keeps queue order
+        """
+        for engine in ("linked", "heap"):
+            task_list = TaskList(max_size=50, engine=engine)
+            tasks = [Task(f"task_{i}", 1, (i * 7) % 50, "user", printer="A" if i % 5 else "B") for i in range(50)]
+            for task in tasks:
+                task_list.append(task)
+            for task in tasks[::3]:
+                task_list.cancel(task.task_id)
+
+            checked = []
+
+            def accepts_b(task):
+                checked.append(task)
+                return task.printer == "B"
+
+            expected = [task for task in task_list.get_all_tasks() if task.printer == "B"]
+            first = task_list.pop(block=False, match=accepts_b)
+            self.assertIs(first, expected[0], engine)
+            self.assertEqual(len(checked), len(set(checked)), engine)
+            self.assertEqual(checked[-1], first, engine)
+            self.assertEqual([task_list.pop(block=False, match=accepts_b) for _ in expected[1:]], expected[1:], engine)
+
+    def test_extend_all_or_nothing(self):
+        """
+        Test that extend adds a whole batch in priority order with one version change or nothing at all
+        """
+        task_list = TaskList(max_size=3)
+        task_list.extend([Task("low", 1, 5, "user"), Task("high", 1, 1, "user")])
+        self.assertEqual(task_list.snapshot()[0], 2)
+        self.assertEqual([task.name for task in task_list.get_all_tasks()], ["high", "low"])
+
+        with self.assertRaises(TaskListFullException):
+            task_list.extend([Task("a", 1, 1, "user"), Task("b", 1, 1, "user")], block=False)
+        with self.assertRaises(TaskListFullException):
+            task_list.extend([Task(str(i), 1, 1, "user") for i in range(4)])
+        with self.assertRaises(TaskListException):
+            task_list.extend(["not a task"])
+        self.assertEqual(len(task_list), 2)
+
+    def test_async_extend_waits_for_room(self):
+        """
+        Test that async_extend waits until the whole batch fits
+        """
+        task_list = TaskList(max_size=2)
+        task_list.append(Task("doc1", 1, 1, "user"))
+
+        async def run():
+            threading.Timer(0.05, task_list.pop).start()
+            await task_list.async_extend([Task("doc2", 1, 1, "user"), Task("doc3", 1, 1, "user")], timeout=5)
+
+        asyncio.run(run())
+        self.assertEqual([task.name for task in task_list.get_all_tasks()], ["doc2", "doc3"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -50,5 +50,17 @@ class TaskTests(unittest.TestCase):
         task = Task("Doc", 12, 2, "user1")
         self.assertEqual(str(task), "Task Doc, pages=12, priority=2 by username=user1")
 
+    def test_task_id(self):
+        """
+        Test that every task gets its own stable ID and it is in the dict representation
+        """
+        task = Task("Doc", 12, 2, "user1")
+        other = Task("Doc", 12, 2, "user1")
+        self.assertNotEqual(task.task_id, other.task_id)
+        self.assertEqual(Task("Doc", 12, 2, "user1", task_id="abc").task_id, "abc")
+        self.assertEqual(task.to_dict(), {"id": task.task_id, "name": "Doc", "pages": 12, "priority": 2, "user": "user1", "printer": None})
+        with self.assertRaises(TaskException):
+            task.task_id = 5
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from src.models.task import Task
+from src.spooler.upload_store import UploadStore
+
+
+class UploadStoreTests(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs before each test
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = UploadStore(self.tmp.name)
+
+    def tearDown(self):
+        """
+        Runs after each test
+        """
+        self.tmp.cleanup()
+
+    def upload(self, content, filename="doc.pdf"):
+        temp_path = self.store.temp_path()
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        return self.store.store(temp_path, hashlib.sha256(content).hexdigest(), filename)
+
+    def test_same_content_is_stored_once(self):
+        """
+        Test that identical uploads share one file which is deleted with the last reference
+        """
+        first = self.upload(b"invoice", "a.pdf")
+        second = self.upload(b"invoice", "b.PDF")
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith(".pdf"))
+        self.assertEqual(os.listdir(self.store.incoming), [])
+
+        self.assertFalse(self.store.release(first))
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(self.store.release(first))
+        self.assertFalse(os.path.exists(first))
+
+    def test_rebuild_from_restored_tasks(self):
+        """
+        Test that restored tasks keep their files and unused files and unfinished uploads are removed
+        """
+        kept = self.upload(b"kept")
+        orphan = self.upload(b"orphan")
+        unfinished = self.store.temp_path()
+        open(unfinished, "wb").close()
+
+        self.store.rebuild([Task("a", 1, 1, "user", file_path=kept), Task("b", 1, 1, "user", file_path=kept)])
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(unfinished))
+
+        self.assertFalse(self.store.release(kept))
+        self.assertTrue(self.store.release(kept))
+
+if __name__ == '__main__':
+    unittest.main()